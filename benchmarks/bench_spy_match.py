@@ -0,0 +1,124 @@
+"""
+Benchmark comparing the per-invocation match path the Spy module had before MatchPlan (a copy of its original
+_calculate_match, which aligns the predicates against the argspec for every recorded invocation) with a compiled
+MatchPlan applied to every invocation.
+
+Usage:
+
+    python -m benchmarks.bench_spy_match [--invocations N] [--repeat R]
+"""
+from __future__ import print_function
+
+import argparse
+from itertools import islice
+
+from test_toolbox.helpers import perf_counter_ns
+from test_toolbox.spy import Spy, MatchPlan, equal_to, anything
+
+
+def _target(foo, bar, baz=3, *args, **kwargs):
+    return foo
+
+
+def build_spy(num_invocations):
+    spy = Spy(_target)
+    for i in range(num_invocations):
+        spy(i, bar=i % 7)
+    return spy
+
+
+# The original match path, kept verbatim (including its handling of defaults) as the baseline: the _calculate_match
+# of test_toolbox.spy is now a thin wrapper over MatchPlan.
+def _align_args_kwargs_to_argspec_args(argspec_args, args, kwargs):
+    aligned_map = dict(zip(argspec_args[:len(args)], args))
+    aligned_map.update((k, v) for k, v in kwargs.items() if k in argspec_args)
+    return aligned_map
+
+
+def _apply_predicate_map_to_value_map(predicate_map, value_map):
+    for key in set(predicate_map.keys()):
+        yield predicate_map[key](value_map[key])
+
+
+def _apply_predicate_list_to_value_list(predicate_list, value_list):
+    for predicate, value in islice(zip(predicate_list, value_list), 0, len(predicate_list)):
+        yield predicate(value)
+
+
+def _calculate_match(argspec, predicate_args, predicate_kwargs, call_args, call_kwargs, exact=True):
+    if argspec.defaults:
+        aligned_call_args = dict(zip(argspec.args[len(argspec.defaults)+1::-1], argspec.defaults[::-1]))
+    else:
+        aligned_call_args = {}
+    aligned_call_args.update(_align_args_kwargs_to_argspec_args(argspec.args, call_args, call_kwargs))
+    aligned_predicate_args = _align_args_kwargs_to_argspec_args(argspec.args, predicate_args, predicate_kwargs)
+
+    extra_call_args = call_args[len(argspec.args):]
+    extra_predicate_args = predicate_args[len(argspec.args):]
+
+    extra_call_kwargs = dict((k, v) for k, v in call_kwargs.items() if k not in aligned_call_args)
+    extra_predicate_kwargs = dict((k, v) for k, v in predicate_kwargs.items() if k not in aligned_predicate_args)
+
+    if exact:
+        matching_named_call_args = set(aligned_call_args.keys()) == set(aligned_predicate_args.keys())
+        matching_extra_args = len(extra_call_args) == len(extra_predicate_args)
+        matching_extra_kwargs = set(extra_call_kwargs.keys()) == set(extra_predicate_kwargs.keys())
+    else:
+        matching_named_call_args = set(aligned_call_args.keys()) >= set(aligned_predicate_args.keys())
+        matching_extra_args = len(extra_call_args) >= len(extra_predicate_args)
+        matching_extra_kwargs = set(extra_call_kwargs.keys()) >= set(extra_predicate_kwargs.keys())
+
+    if matching_named_call_args and matching_extra_args and matching_extra_kwargs:
+        all_named_pass = all(_apply_predicate_map_to_value_map(aligned_predicate_args, aligned_call_args))
+        all_extra_args_pass = all(_apply_predicate_list_to_value_list(extra_predicate_args, extra_call_args))
+        all_extra_kwargs_pass = all(_apply_predicate_map_to_value_map(extra_predicate_kwargs, extra_call_kwargs))
+        return all_named_pass and all_extra_args_pass and all_extra_kwargs_pass
+    else:
+        return False
+
+
+def per_invocation_path(spy, args, kwargs, exact):
+    argspec = spy.target_func_argspec
+    return [invocation for invocation in spy.successful_invocations
+            if _calculate_match(argspec, args, kwargs, invocation.args, invocation.kwargs, exact=exact)]
+
+
+def compiled_plan_path(spy, args, kwargs, exact):
+    plan = MatchPlan(spy.target_func_argspec, args, kwargs, exact=exact)
+    return [invocation for invocation in spy.successful_invocations
+            if plan.matches(invocation.args, invocation.kwargs)]
+
+
+def best_of(repeat, func, *args):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter_ns()
+        func(*args)
+        elapsed = (perf_counter_ns() - start) / 1e9
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--invocations", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+
+    spy = build_spy(options.invocations)
+    queries = [
+        ("partial", (equal_to(options.invocations - 1),), {}, False),
+        ("exact", (anything, equal_to(0), equal_to(3)), {}, True),
+    ]
+    print("{0} recorded invocations, best of {1}".format(options.invocations, options.repeat))
+    for name, args, kwargs, exact in queries:
+        assert per_invocation_path(spy, args, kwargs, exact) == compiled_plan_path(spy, args, kwargs, exact)
+        old = best_of(options.repeat, per_invocation_path, spy, args, kwargs, exact)
+        new = best_of(options.repeat, compiled_plan_path, spy, args, kwargs, exact)
+        print("{0:>8}: per-invocation {1:8.3f} s, compiled plan {2:8.3f} s, speedup {3:5.1f}x".format(
+            name, old, new, old / new if new else float("inf")
+        ))
+
+
+if __name__ == "__main__":
+    main()
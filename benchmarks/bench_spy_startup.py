@@ -0,0 +1,89 @@
+"""
+Benchmark of Spy construction cost, spying every function and method found in a large module, first with the
+uncached signature introspection and then with the argspec cache of get_argspec.
+
+Usage:
+
+    python -m benchmarks.bench_spy_startup [--module NAME] [--rounds N] [--repeat R]
+"""
+from __future__ import print_function
+
+import argparse
+import importlib
+import time
+from types import FunctionType
+
+from test_toolbox import spy as spy_module
+from test_toolbox.spy import Spy
+
+
+def collect_targets(module):
+    functions, methods = [], []
+    for value in vars(module).values():
+        if isinstance(value, FunctionType):
+            functions.append(value)
+        elif isinstance(value, type):
+            methods.extend(attribute for attribute in vars(value).values() if isinstance(attribute, FunctionType))
+    return functions, methods
+
+
+def spy_everything(functions, methods, rounds):
+    for _ in range(rounds):
+        for function in functions:
+            Spy(function)
+        for method in methods:
+            Spy(method, is_method=True)
+
+
+class _NoCache(dict):
+    """
+    An always empty cache, which makes every construction introspect its target again.
+    """
+    def setdefault(self, key, value=None):
+        return value
+
+
+def uncached(functions, methods, rounds):
+    original = spy_module._ARGSPEC_CACHE
+    spy_module._ARGSPEC_CACHE = _NoCache()
+    try:
+        spy_everything(functions, methods, rounds)
+    finally:
+        spy_module._ARGSPEC_CACHE = original
+
+
+def cached(functions, methods, rounds):
+    spy_everything(functions, methods, rounds)
+
+
+def best_of(repeat, func, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--module", default="inspect")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+
+    functions, methods = collect_targets(importlib.import_module(options.module))
+    num_spies = (len(functions) + len(methods)) * options.rounds
+    print("{0} spies over {1} functions and {2} methods of {3}, best of {4}".format(
+        num_spies, len(functions), len(methods), options.module, options.repeat
+    ))
+    old = best_of(options.repeat, uncached, functions, methods, options.rounds)
+    new = best_of(options.repeat, cached, functions, methods, options.rounds)
+    print("uncached {0:8.3f} s, cached {1:8.3f} s, speedup {2:5.1f}x".format(
+        old, new, old / new if new else float("inf")
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Benchmark suite of the Spy hot paths, with JSON baselines to catch performance regressions. It measures:
+
+* call.* -- The per-call overhead of function, method, builtin and callable object Spies, as the ratio of the time
+    of a spied call to the time of a call of the raw callable.
+* query.<kind>.<n> -- The time of exact, partial and result match queries, per recorded invocation, over 10 up to
+    10^6 recorded invocations.
+* memory.<mode> -- The memory allocated per recorded invocation (arguments included), for the main recording modes.
+
+Every benchmark reports a single value, for which lower is better. Every value is the best of --repeat runs, timed
+with the garbage collector disabled, but the smallest query sizes remain sensitive to the load of the machine: gate
+on full (not --quick) runs, with a larger --repeat, on an otherwise idle machine.
+
+A run may be saved as a baseline, and later runs compared against it: a benchmark regresses if its value exceeds
+the baseline by more than the threshold. Baselines are only comparable on the machine (and Python) they were
+recorded on, so none are committed. Record one on the machine that runs the comparison, from the commit to compare
+against, and keep it in benchmarks/baselines/ (which git ignores), i.e.
+
+    git checkout master && python -m benchmarks.bench_spy_suite --save-baseline benchmarks/baselines/local.json
+    git checkout my-branch && python -m benchmarks.bench_spy_suite --baseline benchmarks/baselines/local.json
+
+Usage:
+
+    python -m benchmarks.bench_spy_suite [--quick] [--repeat R] [--output PATH] [--save-baseline PATH]
+        [--baseline PATH] [--threshold FRACTION] [--only PREFIX]
+
+The exit status is 1 if any benchmark regressed against the baseline, 0 otherwise.
+"""
+from __future__ import print_function, division
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from test_toolbox.helpers import perf_counter_ns
+from test_toolbox.spy import Spy, apply_method_spy, apply_builtin_function_spy, times, equal_to
+
+DEFAULT_THRESHOLD = 0.25
+
+
+def _target(foo, bar=2, *args, **kwargs):
+    return foo
+
+
+class _Plain(object):
+    def method(self, foo, bar=2):
+        return foo
+
+
+class _Spied(object):
+    @apply_method_spy
+    def method(self, foo, bar=2):
+        return foo
+
+
+class _CallableObject(object):
+    def __call__(self, foo, bar=2):
+        return foo
+
+
+def best_of(repeat, func, *args):
+    best = None
+    for _ in range(repeat):
+        # As timeit does, keep the garbage collector from running in the middle of a measurement.
+        gc.collect()
+        gc.disable()
+        try:
+            start = perf_counter_ns()
+            func(*args)
+            elapsed = perf_counter_ns() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _call_loop(func, num_calls):
+    for i in range(num_calls):
+        func(i, 3)
+
+
+def _call_benchmarks(options):
+    num_calls = 20000 if options.quick else 200000
+    spied_instance = _Spied()
+    cases = [
+        ("function", _target, Spy(_target)),
+        ("method", _Plain().method, spied_instance.method),
+        ("builtin", max, apply_builtin_function_spy(max)),
+        ("callable_object", _CallableObject(), Spy(_CallableObject())),
+    ]
+    results = {}
+    for name, raw, spied in cases:
+        raw_ns = spied_ns = None
+        for _ in range(options.repeat):
+            # Time the raw and spied calls in turns, so that both see the same load of the machine. Every repeat
+            # starts from an empty Spy, without timing the release of the previous recordings.
+            elapsed = best_of(1, _call_loop, raw, num_calls)
+            raw_ns = elapsed if raw_ns is None else min(raw_ns, elapsed)
+            spied.reset()
+            elapsed = best_of(1, _call_loop, spied, num_calls)
+            spied_ns = elapsed if spied_ns is None else min(spied_ns, elapsed)
+        results["call.{0}".format(name)] = {
+            "value": spied_ns / raw_ns, "unit": "x raw", "raw_ns_per_call": raw_ns / num_calls,
+            "spied_ns_per_call": spied_ns / num_calls
+        }
+    return results
+
+
+def _build_spy(num_invocations):
+    spy = Spy(_target)
+    for i in range(num_invocations):
+        spy(i, bar=i % 7)
+    return spy
+
+
+def _query_benchmarks(options):
+    max_exponent = 4 if options.quick else 6
+    results = {}
+    for exponent in range(1, max_exponent + 1):
+        num_invocations = 10 ** exponent
+        spy = _build_spy(num_invocations)
+        last = num_invocations - 1
+        # Each query matches only the last invocation, so every invocation is scanned.
+        queries = [
+            ("exact", lambda: spy.check_quantified_exact_match(times(1), equal_to(last), equal_to(last % 7))),
+            ("partial", lambda: spy.check_quantified_partial_match(times(1), equal_to(last))),
+            ("result", lambda: spy.check_quantified_result_match(times(1), equal_to(last))),
+        ]
+        num_loops = max(1, 100000 // num_invocations)
+        for kind, query in queries:
+            assert query()
+            elapsed = best_of(options.repeat, _query_loop, query, num_loops)
+            results["query.{0}.{1}".format(kind, num_invocations)] = {
+                "value": elapsed / num_loops / num_invocations, "unit": "ns per invocation"
+            }
+    return results
+
+
+def _query_loop(query, num_loops):
+    for _ in range(num_loops):
+        query()
+
+
+def _memory_benchmarks(options):
+    if tracemalloc is None:
+        return {}
+    num_invocations = 10000 if options.quick else 100000
+    modes = [
+        ("default", {}),
+        ("bind_arguments", {"bind_arguments": True}),
+        ("columnar", {"columnar": True}),
+        ("counts_only", {"counts_only": True}),
+    ]
+    results = {}
+    for name, spy_options in modes:
+        spy = Spy(_target, **spy_options)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            for i in range(num_invocations):
+                spy(i, bar=i % 7)
+            gc.collect()
+            after, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        results["memory.{0}".format(name)] = {
+            "value": (after - before) / num_invocations, "unit": "bytes per invocation"
+        }
+    return results
+
+
+_BENCHMARK_GROUPS = [("call.", _call_benchmarks), ("query.", _query_benchmarks), ("memory.", _memory_benchmarks)]
+
+
+def run_suite(options):
+    results = {}
+    for prefix, benchmarks in _BENCHMARK_GROUPS:
+        if not options.only or prefix.startswith(options.only) or options.only.startswith(prefix):
+            results.update(benchmarks(options))
+    if options.only:
+        results = dict((name, result) for name, result in results.items() if name.startswith(options.only))
+    return {
+        "meta": {
+            "python": platform.python_version(), "implementation": platform.python_implementation(),
+            "machine": platform.machine(), "platform": platform.platform(), "quick": options.quick,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(run, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare a run of the suite against a baseline run.
+
+    :param run: The run, as returned by run_suite().
+    :param baseline: The baseline run, in the same format.
+    :param threshold: The fraction by which a value may exceed its baseline before it is a regression.
+    :return: A list of (name, baseline value, value, change) tuples for the regressed benchmarks, sorted by name.
+    """
+    regressions = []
+    for name, result in sorted(run["results"].items()):
+        baseline_result = baseline["results"].get(name)
+        if baseline_result is None or not baseline_result["value"]:
+            continue
+        change = result["value"] / baseline_result["value"] - 1
+        if change > threshold:
+            regressions.append((name, baseline_result["value"], result["value"], change))
+    return regressions
+
+
+def print_run(run, baseline=None):
+    for name, result in sorted(run["results"].items()):
+        line = "{0:<28} {1:12.3f} {2}".format(name, result["value"], result["unit"])
+        baseline_result = (baseline or {}).get("results", {}).get(name)
+        if baseline_result is not None and baseline_result["value"]:
+            line += "  ({0:+.1%} vs baseline {1:.3f})".format(
+                result["value"] / baseline_result["value"] - 1, baseline_result["value"]
+            )
+        print(line)
+
+
+def _write_json(run, path):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, "w") as output:
+        json.dump(run, output, indent=2, sort_keys=True)
+        output.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes, for a fast smoke run.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the results of this run to a JSON file.")
+    parser.add_argument("--save-baseline", help="Write the results of this run as a JSON baseline.")
+    parser.add_argument("--baseline", help="Compare this run against a JSON baseline.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="The fraction a benchmark may exceed its baseline by. Default: %(default)s")
+    parser.add_argument("--only", help="Only report the benchmarks whose name starts with this prefix.")
+    options = parser.parse_args()
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["meta"].get("quick") != options.quick:
+            print("Warning: the baseline was recorded with quick = {0}".format(baseline["meta"].get("quick")))
+
+    run = run_suite(options)
+    print("Python {0} ({1}), best of {2}".format(run["meta"]["python"], run["meta"]["implementation"], options.repeat))
+    print_run(run, baseline)
+    for path in (options.output, options.save_baseline):
+        if path:
+            _write_json(run, path)
+
+    if baseline is not None:
+        regressions = compare(run, baseline, options.threshold)
+        for name, baseline_value, value, change in regressions:
+            print("REGRESSION {0}: {1:.3f} -> {2:.3f} ({3:+.1%}, threshold {4:.0%})".format(
+                name, baseline_value, value, change, options.threshold
+            ))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
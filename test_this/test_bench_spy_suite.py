@@ -0,0 +1,29 @@
+from unittest import TestCase
+
+from benchmarks.bench_spy_suite import compare, DEFAULT_THRESHOLD
+
+
+def _run(**values):
+    return {"meta": {}, "results": dict(
+        (name.replace("_", "."), {"value": value, "unit": "ns"}) for name, value in values.items()
+    )}
+
+
+class CompareUnitTests(TestCase):
+    def test_threshold_verdict(self):
+        baseline = _run(call_function=10.0, query_exact=100.0, memory_default=300.0)
+        run = _run(call_function=12.6, query_exact=125.0, memory_default=150.0)
+        self.assertEqual(0.25, DEFAULT_THRESHOLD)
+        # 26% slower regresses, 25% slower is still within the threshold, and getting faster never regresses.
+        regressions = compare(run, baseline)
+        self.assertEqual(["call.function"], [name for name, _, _, _ in regressions])
+        name, baseline_value, value, change = regressions[0]
+        self.assertEqual((10.0, 12.6), (baseline_value, value))
+        self.assertAlmostEqual(0.26, change)
+        self.assertEqual(["call.function", "query.exact"], [name for name, _, _, _ in compare(run, baseline, 0.2)])
+        self.assertEqual([], compare(run, baseline, 0.5))
+
+    def test_benchmarks_without_a_usable_baseline_are_skipped(self):
+        baseline = _run(call_function=0.0)
+        run = _run(call_function=5.0, call_method=50.0)
+        self.assertEqual([], compare(run, baseline))
@@ -0,0 +1,897 @@
+from array import array
+from functools import partial, wraps
+from types import ModuleType
+from unittest import TestCase
+import gc
+import math
+import sys
+import threading
+import time
+import weakref
+
+from test_toolbox.spy import (
+    Spy, BoundSpy, MatchPlan, BoundInvocation, get_argspec, apply_function_spy, apply_method_spy, equal_to, any_of,
+    instance_of, anything, at_least_once, at_least_times, once, never, always, times, spy_module, spy_class,
+    SpyRegistry, BufferFingerprint, fingerprint, identical_to, set_reporting_max_invocations,
+    get_reporting_max_invocations, all_of, either, not_, in_range, matches_regex, contains, simplify_predicate,
+    AllOfPredicate, ResultStats, QuantifierPredicate
+)
+from test_toolbox import spy as spy_module_under_test
+from test_toolbox.helpers import await_condition
+
+
+def _target_function(foo, bar=2, *args, **kwargs):
+    return foo + bar
+
+
+class SpyModuleUnitTests(TestCase):
+    spy_options = {}
+
+    def setUp(self):
+        self.spy = apply_function_spy(_target_function, **self.spy_options)
+
+    def test_exact_match_uses_defaults(self):
+        self.spy(1)
+        self.spy.assert_one_exact_match(equal_to(1), equal_to(2))
+        self.assertFalse(self.spy.check_quantified_exact_match(at_least_once, equal_to(1)))
+        self.assertTrue(self.spy.check_quantified_partial_match(once, equal_to(1)))
+
+    def test_extra_args_and_kwargs(self):
+        self.spy(1, 3, 5, baz=7)
+        self.spy.assert_any_partial_match(anything, anything, equal_to(5))
+        self.spy.assert_any_partial_match(baz=equal_to(7))
+        self.spy.assert_one_exact_match(anything, anything, equal_to(5), baz=equal_to(7))
+        self.assertFalse(self.spy.check_quantified_exact_match(at_least_once, anything, anything, baz=anything))
+        self.assertFalse(self.spy.check_quantified_partial_match(at_least_once, qux=anything))
+
+    def test_keyword_and_positional_calls_match_alike(self):
+        self.spy(1, bar=4)
+        self.spy(foo=1, bar=4)
+        self.spy(1, 4)
+        self.spy.assert_quantified_exact_match(times(3), equal_to(1), bar=equal_to(4))
+        self.spy.assert_all_partial_match(foo=instance_of(int))
+        self.assertTrue(self.spy.check_quantified_partial_match(never, bar=equal_to(2)))
+
+    def test_result_match(self):
+        self.spy(1)
+        self.spy(2)
+        self.spy.assert_one_result_match(equal_to(4))
+        self.spy.assert_all_result_match(any_of([3, 4]))
+        self.spy.assert_quantified_partial_plus_result_match(once, equal_to(3), equal_to(1))
+        self.assertRaises(AssertionError, self.spy.assert_any_result_match, equal_to(5))
+
+    def test_times_predicates_see_matching_invocations(self):
+        self.spy(1)
+        self.spy(2)
+        seen = []
+
+        def record_times(matching, all_invocations):
+            seen.append((list(matching), list(all_invocations)))
+            return True
+
+        self.spy.check_quantified_partial_match(record_times, equal_to(2))
+        matching, all_invocations = seen[0]
+        self.assertEqual([4], [invocation.result for invocation in matching])
+        self.assertEqual(2, len(all_invocations))
+        self.assertTrue(self.spy.check_quantified_partial_match(always, instance_of(int)))
+
+    def test_reset(self):
+        self.spy(1)
+        self.spy.reset()
+        self.assertEqual(0, self.spy.num_invocations)
+        self.assertTrue(self.spy.check_quantified_partial_match(never, anything))
+
+    def test_incremental_queries(self):
+        examined = []
+
+        def is_one(value):
+            examined.append(value)
+            return value == 1
+
+        query = self.spy.incremental_partial_match(is_one)
+        self.assertEqual(0, query.update())
+        for polls in range(3):
+            self.spy(1)
+            self.spy(2)
+            self.assertEqual(polls + 1, query.update())
+        self.assertEqual(6, len(examined))
+        self.assertEqual(6, query.num_examined)
+        self.assertTrue(query.check(times(3)))
+        self.assertFalse(query.check(at_least_times(4)))
+        self.assertFalse(query.check(always))
+        self.assertTrue(query.check(lambda matching, all_invocations: 2 * len(matching) == len(all_invocations)))
+        self.assertEqual(6, len(examined))
+        self.assertEqual([3, 3, 3], [invocation.result for invocation in query.matching_invocations])
+
+        exact_query = self.spy.incremental_exact_match(equal_to(2), equal_to(2))
+        result_query = self.spy.incremental_result_match(equal_to(3))
+        plus_result_query = self.spy.incremental_partial_plus_result_match(equal_to(4), equal_to(2))
+        exact_plus_result_query = self.spy.incremental_exact_plus_result_match(equal_to(4), equal_to(2))
+        self.assertEqual([3, 3, 3, 0], [q.update() for q in (exact_query, result_query, plus_result_query,
+                                                              exact_plus_result_query)])
+        self.assertRaises(AssertionError, exact_plus_result_query.assert_check, at_least_once)
+        with self.assertRaises(AssertionError) as context:
+            query.assert_check(times(4))
+        self.assertIn("Failed to find a matching partial invocation!", str(context.exception))
+
+        num_examined = len(examined)
+        self.spy.reset()
+        self.assertEqual(0, query.update())
+        self.assertEqual(0, query.num_examined)
+        self.spy(1, bar=3)
+        query.assert_check(once)
+        plus_result_query.assert_check(never)
+        exact_plus_result_query.assert_check(never)
+        self.assertEqual(num_examined + 1, len(examined))
+
+    def test_polled_incremental_query(self):
+        query = self.spy.incremental_partial_match(instance_of(int))
+        worker = threading.Thread(target=lambda: [self.spy(i) for i in range(2000)])
+        worker.start()
+        await_condition("2000 invocations", lambda: query.check(at_least_times(2000)), timeout=10, poll_s=0.001)
+        worker.join()
+        self.assertEqual(2000, query.num_examined)
+
+    def test_method_spy(self):
+        class Target(object):
+            @partial(apply_method_spy, **self.spy_options)
+            def method(self, value):
+                return value * 2
+
+        self.addCleanup(Target.__dict__["method"].close)
+        first, second = Target(), Target()
+        first.method(1)
+        second.method(2)
+        second.method(3)
+        first.method.assert_one_exact_match(equal_to(1))
+        second.method.assert_quantified_exact_match(times(2), instance_of(int))
+        self.assertEqual(1, first.method.num_invocations)
+
+
+class BoundSpyModuleUnitTests(SpyModuleUnitTests):
+    spy_options = {"bind_arguments": True}
+
+    def test_bound_invocations(self):
+        self.spy(1, baz=3)
+        self.spy(5, 6, 7)
+        self.assertEqual(
+            [BoundInvocation({"foo": 1, "bar": 2}, (), {"baz": 3}, 3),
+             BoundInvocation({"foo": 5, "bar": 6}, (7,), {}, 11)],
+            self.spy.bound_invocations
+        )
+        self.assertEqual(2, len(self.spy.successful_invocations))
+
+
+class ColumnarSpyModuleUnitTests(SpyModuleUnitTests):
+    spy_options = {"columnar": True}
+
+    def test_numeric_columns(self):
+        for i in range(10):
+            self.spy(i, bar=0.5)
+        store = self.spy.invocation_store
+        self.assertIsInstance(store.column("foo"), array)
+        self.assertIsInstance(store.column("bar"), array)
+        self.spy("a", "b")
+        self.assertIsInstance(store.column("foo"), list)
+        self.assertEqual([0, 1, 2], list(store.column("foo")[:3]))
+        self.assertEqual(11, self.spy.num_invocations)
+        self.assertEqual((3, 0.5), self.spy.successful_invocations[3].args)
+        self.spy.assert_quantified_exact_match(times(2), any_of([3, 4]), equal_to(0.5))
+        self.spy.assert_one_result_match(equal_to(9.5))
+        self.spy.assert_one_result_match(equal_to("ab"))
+        self.assertEqual([1, 2], store.matching_indices(result_predicate=any_of([1.5, 2.5])))
+
+
+class ArgSpecUnitTests(TestCase):
+    def test_argspec_is_cached_by_function(self):
+        def make(default):
+            def closure(foo, bar=default, *args, **kwargs):
+                return foo
+            return closure
+
+        first, second = make(1), make(2)
+        self.assertEqual(["foo", "bar"], get_argspec(first).args)
+        self.assertEqual("args", get_argspec(first).varargs)
+        self.assertEqual("kwargs", get_argspec(first).keywords)
+        self.assertEqual((1,), get_argspec(first).defaults)
+        self.assertEqual((2,), get_argspec(second).defaults)
+        self.assertEqual(["bar"], get_argspec(first, skip_first=True).args)
+        self.assertEqual([], get_argspec(_target_function, skip_first=True).posonlyargs)
+
+    def test_argspec_cache_does_not_keep_functions_alive(self):
+        def target(foo, bar=None):
+            return foo
+
+        target.__defaults__ = (target,)
+        spy = Spy(target)
+        self.assertIn(target, spy_module_under_test._ARGSPEC_CACHE)
+        self.assertEqual((target,), get_argspec(target).defaults)
+        reference = weakref.ref(target)
+        del target, spy
+        gc.collect()
+        self.assertIsNone(reference())
+
+    def test_argspec_follows_wrapped(self):
+        @wraps(_target_function)
+        def wrapper(*args, **kwargs):
+            return _target_function(*args, **kwargs)
+
+        self.assertEqual(["foo", "bar"], get_argspec(wrapper).args)
+        self.assertEqual((2,), get_argspec(wrapper).defaults)
+
+    def test_keyword_only_and_positional_only(self):
+        if sys.version_info < (3, 8):
+            return
+        namespace = {}
+        exec("def target(foo, /, bar, *, baz, qux=4):\n    return foo + bar + baz + qux\n", namespace)
+        argspec = get_argspec(namespace["target"])
+        self.assertEqual(["foo", "bar"], argspec.args)
+        self.assertEqual(["foo"], argspec.posonlyargs)
+        self.assertEqual(["baz", "qux"], argspec.kwonlyargs)
+        self.assertEqual({"qux": 4}, argspec.kwonlydefaults)
+        for options in ({}, {"bind_arguments": True}, {"index_arguments": True}, {"columnar": True}):
+            spy = Spy(namespace["target"], **options)
+            self.assertEqual(10, spy(1, 2, baz=3))
+            spy.assert_one_partial_match(equal_to(1), baz=equal_to(3))
+            # The keyword-only default applies when the call leaves it out, as a positional default would.
+            spy.assert_one_partial_match(qux=equal_to(4))
+            self.assertTrue(spy.check_quantified_partial_match(at_least_once, qux=equal_to(4)))
+            spy.assert_one_exact_match(equal_to(1), equal_to(2), baz=equal_to(3), qux=equal_to(4))
+            self.assertFalse(spy.check_quantified_exact_match(at_least_once, equal_to(1), equal_to(2), baz=equal_to(3)))
+            # Positional predicates never align to keyword-only parameters.
+            self.assertFalse(spy.check_quantified_partial_match(at_least_once, anything, anything, equal_to(3)))
+            self.assertEqual(18, spy(1, 2, baz=3, qux=12))
+            spy.assert_one_exact_match(equal_to(1), equal_to(2), baz=equal_to(3), qux=equal_to(12))
+
+
+class MethodSpyUnitTests(TestCase):
+    def test_bound_spy_is_cached_per_instance(self):
+        class Target(object):
+            def __init__(self, key):
+                self.key = key
+
+            def __eq__(self, other):
+                return self.key == other.key
+
+            def __hash__(self):
+                return hash(self.key)
+
+            def __len__(self):
+                return 0
+
+            @apply_method_spy
+            def method(self, value, scale=2):
+                return value * scale
+
+        first, second = Target(1), Target(1)
+        self.assertIs(first.method, first.method)
+        self.assertIsInstance(first.method, BoundSpy)
+        self.assertIs(first, first.method.__self__)
+        self.assertEqual(6, first.method(3))
+        self.assertEqual(12, first.method(3, scale=4))
+        self.assertEqual((3,), first.method.successful_invocations[0].args)
+        first.method.assert_one_exact_match(equal_to(3), equal_to(4))
+        self.assertEqual(0, second.method.num_invocations)
+
+        reference = weakref.ref(first)
+        del first
+        gc.collect()
+        self.assertIsNone(reference())
+        self.assertEqual(1, len(Target.__dict__["method"]._instance_spies))
+
+    def test_slotted_instances(self):
+        class Target(object):
+            __slots__ = ("__weakref__",)
+
+            @apply_method_spy
+            def method(self, value):
+                return value
+
+        target = Target()
+        target.method(1)
+        target.method(2)
+        target.method.assert_quantified_partial_match(times(2), instance_of(int))
+
+        class Unreferenceable(object):
+            __slots__ = ("value",)
+
+            @apply_method_spy
+            def method(self, value):
+                return value
+
+        with self.assertRaises(TypeError) as context:
+            Unreferenceable().method(1)
+        self.assertIn("Add \"__weakref__\" to the __slots__ of Unreferenceable", str(context.exception))
+
+        class Unslotted(int):
+            @apply_method_spy
+            def method(self, value):
+                return value
+
+        # An instance which cannot be weakly referenced, but holds attributes, keeps its Spy itself.
+        number = Unslotted(5)
+        number.method(1)
+        number.method(2)
+        number.method.assert_quantified_partial_match(times(2), instance_of(int))
+
+
+_SPIED_MODULE_SOURCE = """
+from os.path import join
+
+
+def add(foo, bar=2):
+    return foo + bar
+
+
+def twice(foo):
+    return add(foo, foo)
+
+
+def _private(foo):
+    return foo
+"""
+
+
+class _SpiedClass(object):
+    def method(self, value):
+        return self.helper(value) + 1
+
+    def helper(self, value):
+        return value * 2
+
+    @staticmethod
+    def static(value):
+        return value
+
+    @classmethod
+    def build(cls, value):
+        return cls, value
+
+
+class BulkSpyUnitTests(TestCase):
+    def setUp(self):
+        self.module = ModuleType("spied_module")
+        exec(_SPIED_MODULE_SOURCE, vars(self.module))
+
+    def test_spy_module(self):
+        original_add = self.module.add
+        with spy_module(self.module, bind_arguments=True) as spies:
+            self.assertEqual(["spied_module.add", "spied_module.twice"], sorted(spies))
+            self.assertEqual(6, self.module.twice(3))
+            spies["spied_module.add"].assert_one_exact_match(equal_to(3), equal_to(3))
+            spies["spied_module.twice"].assert_one_result_match(equal_to(6))
+            self.assertIsNotNone(spies["spied_module.add"].bound_invocations)
+        self.assertIs(original_add, self.module.add)
+        self.assertEqual({}, spies)
+
+    def test_spy_module_include(self):
+        spies = spy_module(self.module, include=lambda name: name.startswith("_"))
+        self.assertEqual(["spied_module._private"], list(spies))
+        spies.restore()
+        self.assertRaises(AttributeError, spy_module, self.module, include=["missing"])
+        with spy_module(math, include=["sqrt"]) as spies:
+            self.assertEqual(3.0, math.sqrt(9))
+            spies["math.sqrt"].assert_one_partial_match(equal_to(9))
+        self.assertFalse(hasattr(math.sqrt, "successful_invocations"))
+
+    def test_spy_class(self):
+        original_method = _SpiedClass.__dict__["method"]
+        registry = SpyRegistry()
+        with spy_class(_SpiedClass, registry=registry) as spies:
+            self.assertIs(registry, spies)
+            prefix = "{0}._SpiedClass.".format(__name__)
+            self.assertEqual(sorted(prefix + name for name in ("method", "helper", "static", "build")), sorted(spies))
+            target = _SpiedClass()
+            self.assertEqual(5, target.method(2))
+            target.helper.assert_one_exact_match(equal_to(2))
+            self.assertEqual(1, _SpiedClass.static(1))
+            self.assertEqual((_SpiedClass, 1), _SpiedClass.build(1))
+            spies[prefix + "static"].assert_one_exact_match(equal_to(1))
+            spies[prefix + "build"].assert_one_exact_match(equal_to(1))
+            spies.reset()
+            self.assertEqual(0, spies[prefix + "static"].num_invocations)
+        self.assertIs(original_method, _SpiedClass.__dict__["method"])
+        self.assertNotIn("method", vars(target))
+        self.assertFalse(hasattr(target.method, "successful_invocations"))
+        self.assertFalse(hasattr(_SpiedClass.static, "successful_invocations"))
+
+
+class FailureReportUnitTests(TestCase):
+    def setUp(self):
+        self.spy = Spy(_target_function)
+        self.max_invocations = get_reporting_max_invocations()
+
+    def tearDown(self):
+        set_reporting_max_invocations(self.max_invocations)
+
+    def _failure_message(self, assertion, *args, **kwargs):
+        try:
+            assertion(*args, **kwargs)
+        except AssertionError as e:
+            return str(e)
+        self.fail("{0} did not fail".format(assertion.__name__))
+
+    def test_nearest_matches_first(self):
+        set_reporting_max_invocations(2)
+        for i in range(5):
+            self.spy(i, bar=10)
+        self.spy(3, bar=4)
+        message = self._failure_message(self.spy.assert_any_exact_match, equal_to(3), equal_to(5))
+        lines = message.split("\n")
+        self.assertEqual("Failed to find a matching exact invocation!", lines[0])
+        self.assertEqual("All invocations (2 of 6 listed, nearest matches first):", lines[1])
+        self.assertEqual("[TargetInvocation(args=(3,), kwargs={'bar': 10}, result=13),", lines[2])
+        self.assertEqual("TargetInvocation(args=(3,), kwargs={'bar': 4}, result=7)]", lines[3])
+        self.assertEqual("... 4 more omitted", lines[4])
+
+    def test_results_and_bounded_repr(self):
+        self.spy("x" * 100000, bar="y")
+        self.spy([[[[["deep"]]]]] + list(range(100)), bar=[])
+        message = self._failure_message(self.spy.assert_any_result_match, equal_to(None))
+        self.assertLess(len(message), 2000)
+        self.assertIn("All invocation results:", message)
+        self.assertIn("xxx...xxx", message)
+        self.assertIn("[[[[[...]]]], 0, 1, 2, 3, 4, 5, 6, 7, 8, ...]", message)
+        message = self._failure_message(self.spy.assert_any_partial_match, instance_of(dict))
+        self.assertIn("All invocations:", message)
+
+
+class QuantifierUnitTests(TestCase):
+    def test_quantifiers_stop_once_decided(self):
+        spy = Spy(_target_function)
+        for i in range(100):
+            spy(i % 2)
+        calls = []
+
+        def is_zero(value):
+            calls.append(value)
+            return value == 0
+
+        for quantifier, expected, expected_calls in ((at_least_once, True, 1), (never, False, 1), (once, False, 3),
+                                                     (always, False, 2), (at_least_times(50), True, 99)):
+            del calls[:]
+            self.assertEqual(expected, spy.check_quantified_partial_match(quantifier, is_zero))
+            self.assertEqual(expected_calls, len(calls))
+        self.assertTrue(spy.check_quantified_partial_match(times(50), is_zero))
+        self.assertTrue(spy.check_quantified_partial_match(lambda matching, _: len(matching) == 50, is_zero))
+
+    def test_quantifiers_support_the_list_protocol(self):
+        self.assertTrue(times(2)([1, 2], [1, 2, 3]))
+        self.assertFalse(always([1, 2], [1, 2, 3]))
+        self.assertTrue(at_least_times(0)([], []))
+        self.assertTrue(never([], [1]))
+
+    def test_custom_quantifiers_only_need_counts(self):
+        class MostlyPredicate(QuantifierPredicate):
+            def evaluate_counts(self, num_matching, num_invocations):
+                return 2 * num_matching > num_invocations
+
+        spy = Spy(_target_function)
+        for i in range(5):
+            spy(i % 3)
+        self.assertTrue(spy.check_quantified_partial_match(MostlyPredicate(), any_of([0, 1])))
+        self.assertFalse(spy.check_quantified_partial_match(MostlyPredicate(), equal_to(0)))
+        self.assertTrue(spy.incremental_partial_match(any_of([0, 1])).check(MostlyPredicate()))
+        with self.assertRaises(NotImplementedError) as context:
+            QuantifierPredicate().evaluate([True])
+        self.assertIn("must implement evaluate_counts()", str(context.exception))
+
+
+class MatchPlanUnitTests(TestCase):
+    def test_defaults_align_to_trailing_arguments(self):
+        def target(a, b, c, d=4):
+            return a
+
+        spy = Spy(target)
+        plan = MatchPlan(spy.target_func_argspec, (anything, anything, anything, equal_to(4)), {}, exact=True)
+        self.assertTrue(plan.matches((1, 2, 3), {}))
+        self.assertFalse(plan.matches((1, 2, 3, 5), {}))
+        self.assertFalse(MatchPlan(spy.target_func_argspec, (anything,) * 3, {}, exact=True).matches((1, 2, 3), {}))
+
+
+class PredicateUnitTests(TestCase):
+    def test_combinators(self):
+        small_int = all_of(instance_of(int), in_range(0, 10))
+        self.assertTrue(small_int(9))
+        self.assertFalse(small_int(10))
+        self.assertFalse(small_int(5.0))
+        self.assertTrue(either(equal_to("a"), small_int)(3))
+        self.assertFalse(either(equal_to("a"), small_int)("b"))
+        self.assertTrue(not_(contains(1))([2]))
+        self.assertTrue(in_range(upper=10, inclusive=True)(10))
+        self.assertFalse(in_range(0)("a"))
+        self.assertTrue(matches_regex(r"^GET /\d+$")("GET /42"))
+        self.assertFalse(matches_regex("GET")(42))
+        self.assertEqual("all_of(instance_of(int), in_range(0, 10))", repr(small_int))
+
+    def test_any_of(self):
+        predicate = any_of([1, "a", (2, 3)])
+        self.assertIsInstance(predicate.elements, frozenset)
+        self.assertTrue(predicate((2, 3)))
+        self.assertFalse(predicate([2, 3]))
+        self.assertTrue(any_of([[1], 2])([1]))
+        self.assertTrue(any_of("abc")("b"))
+        self.assertEqual((4,), tuple(any_of([4]).index_values))
+
+    def test_simplification(self):
+        predicate = all_of(anything, all_of(in_range(0, 10), in_range(5, 20, inclusive=True)), instance_of(int))
+        simplified = predicate.simplify()
+        self.assertEqual("all_of(in_range(5, 10), instance_of(int))", repr(simplified))
+        self.assertEqual([predicate(value) for value in range(-5, 25)], [simplified(value) for value in range(-5, 25)])
+
+        # Predicates are never reordered, so a guard keeps protecting the predicates after it.
+        def shout(argument):
+            return argument.upper() == argument
+
+        guarded = all_of(instance_of(str), matches_regex("^[A-Z]"), shout).simplify()
+        self.assertEqual("all_of(instance_of(str), matches_regex('^[A-Z]'), shout)", repr(guarded))
+        self.assertFalse(guarded(5))
+        self.assertTrue(guarded("OK"))
+        self.assertIs(anything, all_of(anything).simplify())
+
+        # Nor are either() predicates: the merged equalities take the place of the first of them.
+        checked = []
+
+        def logged(argument):
+            checked.append(argument)
+            return False
+
+        alternatives = either(logged, equal_to(1), matches_regex("x"), equal_to(2)).simplify()
+        self.assertEqual("either(logged, any_of([1, 2]), matches_regex('x'))", repr(alternatives))
+        self.assertTrue(alternatives(2))
+        self.assertEqual([2], checked)
+        self.assertEqual("either(any_of([1, 2]), logged)", repr(either(equal_to(1), logged, equal_to(2)).simplify()))
+        self.assertIs(anything, either(equal_to(1), anything).simplify())
+        self.assertEqual("either(any_of([1, 2, 3]), matches_regex('x'))",
+                         repr(either(equal_to(1), either(any_of([2, 3]), matches_regex("x"))).simplify()))
+        positive = in_range(0)
+        self.assertIs(positive, not_(not_(positive)).simplify())
+        self.assertIs(len, simplify_predicate(len))
+        self.assertEqual((5,), all_of(instance_of(int), equal_to(5)).index_values)
+        self.assertEqual((1, 2, 3), either(equal_to(1), any_of([2, 3])).index_values)
+        self.assertIsNone(either(equal_to(1), instance_of(int)).index_values)
+
+    def test_queries_plan_simplified_predicates(self):
+        spy = Spy(_target_function, index_arguments=True)
+        for i in range(10):
+            spy(i, bar=i % 2)
+        plan = MatchPlan(spy.target_func_argspec, (all_of(anything, in_range(2, 8), in_range(0, 5)),), {}, exact=False)
+        self.assertEqual("in_range(2, 5)", repr(plan.named_predicates[0][2]))
+        self.assertEqual([0, 5], spy.argument_index.candidates(
+            MatchPlan(spy.target_func_argspec, (either(equal_to(0), equal_to(5)),), {}, exact=False)
+        ))
+        spy.assert_quantified_partial_match(times(3), plan.named_predicates[0][2])
+        spy.assert_quantified_partial_match(times(5), either(equal_to(0), all_of(in_range(5), not_(equal_to(9)))))
+        spy.assert_quantified_result_match(times(4), either(equal_to(0), equal_to(10), equal_to(4)))
+
+    def test_vectorized_predicates(self):
+        spy = Spy(_target_function, columnar=True)
+        for i in range(10):
+            spy(i, bar=0.5)
+        predicate = all_of(in_range(2, 8), not_(any_of([3, 4])))
+        self.assertIsNotNone(predicate.vectorized)
+        self.assertIsInstance(predicate, AllOfPredicate)
+        self.assertEqual([2, 5, 6, 7], spy.successful_invocations.matching_indices(
+            MatchPlan(spy.target_func_argspec, (predicate,), {}, exact=False)
+        ))
+        spy.assert_quantified_result_match(times(2), either(in_range(upper=1), in_range(9)))
+
+
+def _scale(value, factor=1.0):
+    return value * factor
+
+
+class NumericResultUnitTests(TestCase):
+    spy_options = {}
+
+    def setUp(self):
+        self.spy = Spy(_scale, **self.spy_options)
+
+    def _failure_message(self, assertion, *args, **kwargs):
+        with self.assertRaises(AssertionError) as context:
+            assertion(*args, **kwargs)
+        return str(context.exception)
+
+    def test_results_within(self):
+        self.assertIn("No results", self._failure_message(self.spy.assert_results_within, 0, 1))
+        for i in range(100):
+            self.spy(i / 100.0)
+        self.spy.assert_results_within(0, 0.99)
+        self.spy.assert_results_within(upper=1)
+        self.spy(float("nan"))
+        self.spy(2.0)
+        message = self._failure_message(self.spy.assert_results_within, 0, 1)
+        self.assertIn("2 of 102 results are not within [0, 1]:\n  #100: nan\n  #101: 2.0", message)
+
+    def test_results_allclose(self):
+        for i in range(10):
+            self.spy(i, factor=1.0 / 3)
+        self.spy.assert_results_allclose([i / 3.0 for i in range(10)])
+        self.spy.assert_results_allclose([i * 0.333 for i in range(10)], rtol=1e-2, atol=1e-9)
+        message = self._failure_message(self.spy.assert_results_allclose, [i * 0.333 for i in range(10)])
+        self.assertIn("9 of 10 results are not close to", message)
+        self.assertIn("Expected 2 results, but 10 were recorded!",
+                      self._failure_message(self.spy.assert_results_allclose, [1, 2]))
+        self.spy.reset()
+        self.spy(3.0)
+        self.spy(3.0 + 1e-9)
+        self.spy.assert_results_allclose(3.0)
+
+    def test_result_stats(self):
+        self.assertEqual(ResultStats(0, None, None, None), self.spy.result_stats())
+        for value in (1, 2, 3, 6):
+            self.spy(value)
+        self.assertEqual(ResultStats(4, 1, 6, 3), self.spy.result_stats())
+        self.spy.assert_result_stats(min=equal_to(1), max=in_range(upper=6, inclusive=True), mean=in_range(2.5, 3.5))
+        message = self._failure_message(self.spy.assert_result_stats, mean=in_range(upper=3))
+        self.assertIn("mean = 3.0 (expected in_range(None, 3))", message)
+
+
+class ColumnarNumericResultUnitTests(NumericResultUnitTests):
+    spy_options = {"columnar": True}
+
+
+class ArrayResultUnitTests(TestCase):
+    def setUp(self):
+        self.spy = Spy(_scale)
+
+    def test_array_results(self):
+        self.spy([1.0, 2.0], factor=1)
+        self.spy((3, 4), factor=1)
+        self.spy.assert_results_within(1, 4)
+        self.spy.assert_results_allclose([[1, 2], [3, 4]])
+        self.assertRaises(AssertionError, self.spy.assert_results_within, 1, 3)
+        self.assertEqual(ResultStats(2, 1, 4, 2.5), self.spy.result_stats())
+        self.spy([5.0], factor=1)
+        self.spy.assert_results_within(1, 5)
+        self.assertRaises(AssertionError, self.spy.assert_results_allclose, [[1, 2], [3, 4], [5, 6]])
+        self.assertEqual(ResultStats(3, 1, 5, 3), self.spy.result_stats())
+        self.spy("a", factor=2)
+        with self.assertRaises(AssertionError) as context:
+            self.spy.assert_results_within(0, 10)
+        self.assertIn("1 of 4 results are not numeric:\n  #3: 'aa'", str(context.exception))
+        self.assertRaises(ValueError, self.spy.result_stats)
+
+
+class _WithoutNumpy(object):
+    """
+    Runs the tests of a TestCase without NumPy, over the pure Python fallbacks.
+    """
+    def setUp(self):
+        self.numpy = spy_module_under_test.numpy
+        spy_module_under_test.numpy = None
+        super(_WithoutNumpy, self).setUp()
+
+    def tearDown(self):
+        spy_module_under_test.numpy = self.numpy
+        super(_WithoutNumpy, self).tearDown()
+
+
+class PurePythonNumericResultUnitTests(_WithoutNumpy, NumericResultUnitTests):
+    pass
+
+
+class PurePythonArrayResultUnitTests(_WithoutNumpy, ArrayResultUnitTests):
+    pass
+
+
+class BoundedSpyModuleUnitTests(SpyModuleUnitTests):
+    spy_options = {"max_invocations": 3, "bind_arguments": True}
+
+    def test_ring_buffer_keeps_last_invocations(self):
+        for i in range(10):
+            self.spy(i)
+        self.assertEqual(3, self.spy.num_invocations)
+        self.assertEqual(7, self.spy.evicted_invocations)
+        self.assertEqual(10, self.spy.total_invocations)
+        self.assertEqual([7, 8, 9], [invocation.args[0] for invocation in self.spy.successful_invocations])
+        self.spy.assert_all_partial_match(any_of([7, 8, 9]))
+        self.assertTrue(self.spy.check_quantified_partial_match(never, equal_to(0)))
+        self.spy.reset()
+        self.assertEqual(0, self.spy.total_invocations)
+        self.assertRaises(ValueError, Spy, _target_function, max_invocations=0)
+
+    def test_incremental_queries(self):
+        # Evictions shift the retained invocations, so there is no position to resume an incremental query from.
+        self.assertRaises(ValueError, self.spy.incremental_partial_match, equal_to(1))
+        self.assertRaises(ValueError, Spy(_target_function, counts_only=True).incremental_result_match, anything)
+        self.assertRaises(ValueError, Spy(_target_function, reservoir_size=5).incremental_exact_match, anything)
+
+    def test_polled_incremental_query(self):
+        self.assertRaises(ValueError, self.spy.incremental_partial_match, instance_of(int))
+
+
+class IndexedSpyModuleUnitTests(SpyModuleUnitTests):
+    spy_options = {"index_arguments": True}
+
+    def test_index_lookups(self):
+        for i in range(10):
+            self.spy(i % 5, bar=i)
+        self.spy([1], [2])
+        index = self.spy.argument_index
+        self.assertEqual([0, 5], index.by_name["foo"][0])
+        self.assertEqual([10], index.unhashable_by_name["foo"])
+        self.assertEqual([0, 5, 10], index.candidates(MatchPlan(self.spy.target_func_argspec, (equal_to(0),), {})))
+        self.assertEqual([4, 10], index.candidates(MatchPlan(self.spy.target_func_argspec,
+                                                             (equal_to(4), equal_to(4)), {})))
+        self.assertIsNone(index.candidates(MatchPlan(self.spy.target_func_argspec, (anything,), {})))
+        self.spy.assert_quantified_partial_match(times(2), equal_to(0))
+        self.spy.assert_one_exact_match(equal_to(4), equal_to(4))
+        self.spy.assert_one_partial_match(equal_to([1]))
+        self.spy.assert_quantified_partial_match(times(4), any_of([1, 2]))
+        self.spy.reset()
+        self.assertEqual({}, index.by_name["foo"])
+        self.assertTrue(self.spy.check_quantified_partial_match(never, equal_to(0)))
+
+    def test_index_uses_equality(self):
+        self.spy(1)
+        self.spy(1.0, bar=True)
+        self.spy.assert_quantified_partial_match(times(2), equal_to(1))
+        self.spy.assert_one_exact_match(equal_to(1), equal_to(1))
+        self.assertRaises(ValueError, Spy, _target_function, index_arguments=True, columnar=True)
+
+
+def _recv_into(buffer, nbytes=None):
+    buffer[:3] = b"abc"
+    return 3
+
+
+class CaptureSpyModuleUnitTests(SpyModuleUnitTests):
+    spy_options = {"capture": "snapshot"}
+
+    def test_capture_policies(self):
+        payload = b"payload"
+        for capture, expected in (("reference", bytearray(b"abc---")), ("snapshot", bytearray(b"------")),
+                                  ("buffer", b"------"), ("fingerprint", fingerprint(b"------"))):
+            spy = Spy(_recv_into, capture=capture)
+            buffer = bytearray(b"------")
+            spy(buffer, nbytes=payload)
+            expected_payload = fingerprint(payload) if capture == "fingerprint" else payload
+            spy.assert_one_exact_match(equal_to(expected), equal_to(expected_payload))
+            self.assertEqual(buffer is spy.successful_invocations[0].args[0], capture == "reference")
+            if capture in ("reference", "buffer"):
+                spy.assert_one_partial_match(nbytes=identical_to(payload))
+
+    def test_fingerprints(self):
+        self.assertEqual(BufferFingerprint(3, fingerprint(b"abc").digest), fingerprint(bytearray(b"abc")))
+        self.assertNotEqual(fingerprint(b"abc"), fingerprint(b"abd"))
+        self.assertEqual(fingerprint(b"\x01\x00\x00\x00" * 2), fingerprint(array("i", [1, 1])))
+        self.assertEqual(fingerprint(b"ace"), fingerprint(memoryview(b"abcdef")[::2]))
+        self.assertEqual("not a buffer", fingerprint("not a buffer"))
+
+    def test_custom_capture_and_methods(self):
+        class Target(object):
+            @partial(apply_method_spy, capture=list)
+            def method(self, values):
+                values.append(len(values))
+                return values
+
+        target = Target()
+        values = [0]
+        target.method(values)
+        target.method(values)
+        target.method.assert_quantified_exact_match(times(1), equal_to([0]))
+        target.method.assert_quantified_exact_match(times(1), equal_to([0, 1]))
+        self.assertRaises(ValueError, Spy, _recv_into, capture="copy")
+
+
+class SampledSpyModuleUnitTests(TestCase):
+    def test_counts_only(self):
+        spy = Spy(_target_function, counts_only=True)
+        for i in range(10):
+            spy(i % 3, bar=1)
+        spy([1], [2])
+        self.assertEqual(11, spy.num_invocations)
+        self.assertEqual(4, spy.invocation_store.count(0, bar=1))
+        self.assertEqual(1, spy.invocation_store.unhashable)
+        spy.assert_quantified_partial_match(times(3), equal_to(2))
+        self.assertRaises(ValueError, spy.check_quantified_result_match, once, anything)
+
+        # Unhashable keyword arguments are counted like unhashable positional ones, rather than raising.
+        self.assertEqual(3, spy(1, b=[1]))
+        self.assertEqual(12, spy.num_invocations)
+        self.assertEqual(2, spy.invocation_store.unhashable)
+        self.assertEqual(0, spy.invocation_store.count(1, b=[1]))
+        self.assertTrue(spy.check_quantified_partial_match(never, b=anything))
+        self.assertFalse(spy.check_quantified_partial_match(always, anything))
+        spy.assert_quantified_partial_match(at_least_times(10), anything)
+        self.assertEqual(10, spy.invocation_store.count_matching())
+
+    def test_sample_every(self):
+        spy = Spy(_target_function, sample_every=4)
+        for i in range(10):
+            spy(i)
+        self.assertEqual([0, 4, 8], [invocation.args[0] for invocation in spy.successful_invocations])
+        self.assertEqual(10, spy.total_invocations)
+        self.assertEqual(7, spy.evicted_invocations)
+        spy.assert_one_result_match(equal_to(6))
+
+    def test_reservoir(self):
+        spy = Spy(_target_function, reservoir_size=5)
+        for i in range(100):
+            spy(i)
+        self.assertEqual(5, spy.num_invocations)
+        self.assertEqual(100, spy.total_invocations)
+        spy.assert_all_partial_match(any_of(list(range(100))))
+        self.assertEqual(5, len(set(invocation.args for invocation in spy.successful_invocations)))
+
+    def test_incompatible_options(self):
+        self.assertRaises(ValueError, Spy, _target_function, counts_only=True, max_invocations=3)
+        self.assertRaises(ValueError, Spy, _target_function, sample_every=3, bind_arguments=True)
+        self.assertRaises(ValueError, Spy, _target_function, reservoir_size=0)
+
+
+class ThreadSafeSpyModuleUnitTests(SpyModuleUnitTests):
+    spy_options = {"thread_safe": True}
+
+    def test_concurrent_recording(self):
+        start = threading.Event()
+
+        def work():
+            start.wait()
+            for i in range(1000):
+                self.spy(i)
+
+        workers = [threading.Thread(target=work) for _ in range(8)]
+        for worker in workers:
+            worker.start()
+        start.set()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(8000, self.spy.num_invocations)
+        self.spy.assert_quantified_exact_match(times(8), equal_to(999), anything)
+        sequenced = self.spy.invocation_store.sequenced()
+        self.assertEqual(list(range(8000)), [record.sequence for record in sequenced])
+        self.assertEqual(8, len(set(record.thread_id for record in sequenced)))
+        for thread_id in set(record.thread_id for record in sequenced):
+            thread_records = [record for record in sequenced if record.thread_id == thread_id]
+            self.assertEqual(list(range(1000)), [record.thread_sequence for record in thread_records])
+            self.assertEqual(list(range(1000)), [record.invocation.args[0] for record in thread_records])
+
+
+class StreamingSpyModuleUnitTests(TestCase):
+    @staticmethod
+    def _rows(limit):
+        for i in range(limit):
+            yield i
+
+    def test_yielded_items_are_recorded_lazily(self):
+        spy = Spy(self._rows, stream_results=True, stream_max_items=2)
+        rows = spy(5)
+        recorded = spy.successful_invocations[0].result
+        self.assertEqual(0, recorded.count)
+        self.assertEqual([0, 1, 2], [next(rows) for _ in range(3)])
+        self.assertEqual(3, recorded.count)
+        self.assertEqual([3, 4], list(rows))
+        self.assertEqual(5, recorded.count)
+        self.assertEqual([0, 1], recorded.items)
+        self.assertTrue(recorded.exhausted)
+        spy.assert_one_result_match(lambda stream: stream.count == 5)
+
+    def test_non_iterators_are_not_wrapped(self):
+        spy = Spy(lambda n: list(range(n)), stream_results=True)
+        self.assertEqual([0, 1], spy(2))
+        spy.assert_one_result_match(equal_to([0, 1]))
+
+
+class LatencySpyModuleUnitTests(TestCase):
+    def setUp(self):
+        self.spy = Spy(lambda delay: time.sleep(delay), record_latency=True)
+
+    def test_latency_percentiles(self):
+        for delay in (0, 0, 0, 0.02):
+            self.spy(delay)
+        self.assertEqual(4, len(self.spy.latencies_ns))
+        self.assertLess(self.spy.latency_percentile(50), 20 * 1000 * 1000)
+        self.assertGreaterEqual(self.spy.latency_percentile(100), 20 * 1000 * 1000)
+        self.spy.assert_latency_below(p50=20 * 1000 * 1000)
+        self.assertRaises(AssertionError, self.spy.assert_latency_below, p80=10 * 1000 * 1000, max=10 ** 10)
+        self.assertRaises(AssertionError, self.spy.assert_latency_below, max=10 * 1000 * 1000)
+        self.spy.assert_quantified_latency_match(once, lambda latency: latency >= 20 * 1000 * 1000)
+        self.assertEqual(4, sum(count for _, count in self.spy.latency_histogram()))
+        self.assertEqual([(1, 0), (10 ** 10, 4)], self.spy.latency_histogram([1, 10 ** 10]))
+
+    def test_no_latencies(self):
+        self.assertIsNone(self.spy.latency_percentile(99))
+        self.assertRaises(AssertionError, self.spy.assert_latency_below, p99=1)
+        self.assertRaises(ValueError, self.spy.latency_percentile, 101)
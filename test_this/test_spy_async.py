@@ -0,0 +1,127 @@
+import asyncio
+from contextlib import asynccontextmanager
+from functools import wraps
+from unittest import TestCase
+
+from test_toolbox.spy import Spy, apply_function_spy, apply_method_spy, equal_to, instance_of
+
+
+@apply_function_spy
+async def _double(value, delay=0):
+    await asyncio.sleep(delay)
+    return value * 2
+
+
+@apply_function_spy
+async def _count_to(limit):
+    for i in range(limit):
+        yield i
+
+
+@apply_function_spy
+@asynccontextmanager
+async def _opened(name):
+    yield name.upper()
+
+
+def _logged(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+    return wrapper
+
+
+@apply_function_spy
+@_logged
+async def _logged_count_to(limit):
+    for i in range(limit):
+        yield i
+
+
+class _Resource(object):
+    @apply_method_spy
+    async def __aenter__(self):
+        return self
+
+    @apply_method_spy
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class AsyncSpyModuleUnitTests(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        for spy in (_double, _count_to, _opened):
+            spy.reset()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_coroutine_results_are_awaited(self):
+        self.assertEqual(4, self.loop.run_until_complete(_double(2, delay=0.01)))
+        _double.assert_one_exact_match(equal_to(2), equal_to(0.01))
+        _double.assert_one_result_match(equal_to(4))
+        self.assertEqual(1, len(_double.latencies_ns))
+        self.assertGreaterEqual(_double.latencies_ns[0], 10 * 1000 * 1000)
+
+    def test_unawaited_coroutines_are_not_recorded(self):
+        coroutine = _double(3)
+        self.assertEqual(0, _double.num_invocations)
+        self.assertEqual(6, self.loop.run_until_complete(coroutine))
+        self.assertEqual(1, _double.num_invocations)
+
+    def test_async_generator_items(self):
+        async def consume():
+            return [item async for item in _count_to(3)]
+
+        self.assertEqual([0, 1, 2], self.loop.run_until_complete(consume()))
+        _count_to.assert_one_exact_match(equal_to(3))
+        iterator = _count_to.successful_invocations[0].result
+        self.assertEqual([0, 1, 2], iterator.items)
+        self.assertTrue(iterator.exhausted)
+
+    def test_wrapped_async_generator_items(self):
+        async def consume():
+            return [item async for item in _logged_count_to(2)]
+
+        self.assertEqual("async_generator", _logged_count_to.async_kind)
+        self.assertEqual("async_context_manager", _opened.async_kind)
+        self.assertEqual([0, 1], self.loop.run_until_complete(consume()))
+        _logged_count_to.assert_one_exact_match(equal_to(2))
+        iterator = _logged_count_to.successful_invocations[0].result
+        self.assertEqual([0, 1], iterator.items)
+        self.assertTrue(iterator.exhausted)
+
+    def test_async_generator_max_items(self):
+        spy = Spy(_count_to.target_func, stream_max_items=1)
+
+        async def consume():
+            return [item async for item in spy(4)]
+
+        self.assertEqual([0, 1, 2, 3], self.loop.run_until_complete(consume()))
+        iterator = spy.successful_invocations[0].result
+        self.assertEqual([0], iterator.items)
+        self.assertEqual(4, iterator.count)
+
+    def test_async_context_manager_factory(self):
+        async def enter():
+            async with _opened("abc") as value:
+                return value
+
+        self.assertEqual("ABC", self.loop.run_until_complete(enter()))
+        _opened.assert_one_exact_match(equal_to("abc"))
+        _opened.assert_one_result_match(equal_to("ABC"))
+
+    def test_async_context_manager_methods(self):
+        resource = _Resource()
+
+        async def enter_twice():
+            async with resource:
+                pass
+            async with resource:
+                pass
+
+        self.loop.run_until_complete(enter_twice())
+        self.assertEqual(2, resource.__aenter__.num_invocations)
+        resource.__aenter__.assert_all_result_match(instance_of(_Resource))
+        resource.__aexit__.assert_all_exact_match(equal_to(None), equal_to(None), equal_to(None))
@@ -0,0 +1,119 @@
+from functools import partial
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+from test_this import test_spy
+from test_toolbox.spy import Spy, apply_method_spy, open_invocation_log, equal_to, instance_of, times, anything
+from test_toolbox.spy_log import InvocationLogStore, UnpicklableValue
+
+
+def _target(foo, bar=2, *args, **kwargs):
+    return foo + bar
+
+
+class LoggedSpyModuleUnitTests(test_spy.SpyModuleUnitTests):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.spy_options = {"invocation_log": os.path.join(self.tempdir, "spy.log")}
+        super(LoggedSpyModuleUnitTests, self).setUp()
+
+    def tearDown(self):
+        self.spy.close()
+        shutil.rmtree(self.tempdir)
+
+
+class InvocationLogUnitTests(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "spy.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_streamed_queries(self):
+        spy = Spy(_target, invocation_log=self.path)
+        self.addCleanup(spy.close)
+        for i in range(3000):
+            spy(i, bar=i % 3)
+        self.assertEqual(3000, spy.num_invocations)
+        self.assertEqual([], spy.successful_results)
+        self.assertEqual((2500,), spy.successful_invocations[2500].args)
+        self.assertEqual({"bar": 2}, spy.successful_invocations[-1].kwargs)
+        spy.assert_quantified_partial_match(times(1000), anything, equal_to(0))
+        spy.assert_one_exact_match(equal_to(2999), equal_to(2))
+        spy.assert_all_result_match(instance_of(int))
+        self.assertRaises(IndexError, lambda: spy.successful_invocations[3000])
+        spy.reset()
+        self.assertEqual(0, spy.num_invocations)
+        self.assertEqual([], list(spy.successful_invocations))
+        spy.close()
+        self.assertRaises(ValueError, spy, 1)
+
+    def test_reopen_for_offline_analysis(self):
+        spy = Spy(_target, invocation_log=self.path)
+        spy(1, 2, 3, baz=lambda: None)
+        spy(4)
+        spy.close()
+
+        offline = open_invocation_log(self.path)
+        self.assertEqual(2, offline.num_invocations)
+        offline.assert_one_exact_match(equal_to(4), equal_to(2))
+        offline.assert_one_partial_match(equal_to(1), baz=instance_of(UnpicklableValue))
+        self.assertEqual("function", offline.successful_invocations[0].kwargs["baz"].type_name)
+        self.assertRaises(TypeError, offline, 1)
+        offline.invocation_store.record((5,), {}, 7)
+        offline.close()
+
+        # A record cut short (i.e. by a crash) is dropped when the log is reopened.
+        with open(self.path, "ab") as log:
+            log.write(b"\x10\x00\x00\x00torn")
+        store = InvocationLogStore(self.path, append=True)
+        self.assertEqual(3, len(store))
+        store.record((6,), {}, 8)
+        self.assertEqual([1, 4, 5, 6], [invocation.args[0] for invocation in store])
+        store.close()
+
+        with open(self.path, "wb") as log:
+            log.write(b"not a log")
+        self.assertRaises(ValueError, open_invocation_log, self.path)
+
+    def test_unpicklable_defaults(self):
+        def target(value, callback=lambda: None, lock=threading.Lock()):
+            return value
+
+        spy = Spy(target, invocation_log=self.path)
+        spy(1)
+        spy.close()
+        offline = open_invocation_log(self.path)
+        offline.assert_one_exact_match(equal_to(1), instance_of(UnpicklableValue), instance_of(UnpicklableValue))
+        self.assertEqual("function", offline.target_func_argspec.defaults[0].type_name)
+        offline.close()
+
+    def test_missing_log(self):
+        missing = os.path.join(self.tempdir, "missing.log")
+        self.assertRaises(IOError, open_invocation_log, missing)
+        self.assertRaises(IOError, InvocationLogStore, missing, append=True)
+        self.assertRaises(ValueError, InvocationLogStore, missing)
+        self.assertFalse(os.path.exists(missing))
+
+    def test_method_spies_log_per_instance(self):
+        path = self.path
+
+        class Target(object):
+            @partial(apply_method_spy, invocation_log=path)
+            def method(self, value):
+                return value
+
+        first, second = Target(), Target()
+        first.method(1)
+        second.method(2)
+        Target.__dict__["method"].close()
+        self.assertRaises(ValueError, first.method, 3)
+        for suffix, value in ((".1", 1), (".2", 2)):
+            offline = open_invocation_log(path + suffix)
+            offline.assert_one_exact_match(equal_to(value))
+            offline.close()
+        self.assertRaises(ValueError, Spy, _target, invocation_log=path, thread_safe=True)
@@ -0,0 +1,95 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import pickle
+from unittest import TestCase, skipUnless
+
+from test_toolbox.spy import Spy, equal_to, instance_of, times
+from test_toolbox.spy_log import UnpicklableValue
+from test_toolbox.spy_process import ProcessInvocation
+
+HAS_FORK = "fork" in multiprocessing.get_all_start_methods()
+
+
+def _square(value):
+    return value * value
+
+
+def _closure(value):
+    return lambda: value
+
+
+def _unbatched(value):
+    return value
+
+
+_square = Spy(_square, process_safe=True, process_batch_size=4)
+_closure = Spy(_closure, process_safe=True)
+_unbatched = Spy(_unbatched, process_safe=True, process_batch_size=1)
+
+
+def _square_and_flush(value):
+    result = _square(value)
+    _square.invocation_store.flush()
+    return result
+
+
+@skipUnless(HAS_FORK, "Worker processes only inherit Spies through fork.")
+class ProcessSpyUnitTests(TestCase):
+    def setUp(self):
+        self.context = multiprocessing.get_context("fork")
+        for spy in (_square, _closure, _unbatched):
+            spy.reset()
+
+    def test_process_pool_executor(self):
+        _square(100)
+        with ProcessPoolExecutor(max_workers=3, mp_context=self.context) as executor:
+            self.assertEqual([value * value for value in range(50)], list(executor.map(_square, range(50))))
+        self.assertEqual(51, _square.num_invocations)
+        _square.assert_one_exact_match(equal_to(100))
+        for value in range(50):
+            _square.assert_quantified_exact_plus_result_match(times(1), equal_to(value * value), equal_to(value))
+        pids = set(entry.pid for entry in _square.invocation_store.by_process())
+        self.assertIn(os.getpid(), pids)
+        self.assertLessEqual(len(pids), 4)
+        self.assertIsInstance(_square.invocation_store.by_process()[0], ProcessInvocation)
+
+    def test_pool_close_and_join(self):
+        pool = self.context.Pool(2)
+        try:
+            pool.map(_square, range(10))
+            pool.close()
+            pool.join()
+        finally:
+            pool.terminate()
+        _square.assert_quantified_partial_match(times(10), instance_of(int))
+
+    def test_unbatched_and_flushed_calls_are_seen_straight_away(self):
+        with ProcessPoolExecutor(max_workers=2, mp_context=self.context) as executor:
+            self.assertEqual(list(range(5)), list(executor.map(_unbatched, range(5))))
+            _unbatched.assert_quantified_partial_match(times(5), instance_of(int))
+            executor.submit(_square_and_flush, 3).result()
+            _square.assert_one_exact_match(equal_to(3))
+
+    def test_incremental_query(self):
+        query = _unbatched.incremental_partial_match(instance_of(int))
+        _unbatched(-1)
+        with ProcessPoolExecutor(max_workers=2, mp_context=self.context) as executor:
+            list(executor.map(_unbatched, range(5)))
+            self.assertTrue(query.check(times(6)))
+            list(executor.map(_unbatched, range(5, 10)))
+            self.assertEqual(11, query.update())
+        self.assertEqual(11, query.num_examined)
+
+    def test_unpicklable_values(self):
+        with ProcessPoolExecutor(max_workers=1, mp_context=self.context) as executor:
+            # The worker cannot send the lambda back as the result of the task either.
+            self.assertIsNotNone(executor.submit(_closure, 1).exception())
+        _closure.assert_one_result_match(instance_of(UnpicklableValue))
+        self.assertEqual("function", _closure.successful_invocations[0].result.type_name)
+
+    def test_options(self):
+        self.assertRaises(ValueError, Spy, _square, process_safe=True, thread_safe=True)
+        self.assertRaises(ValueError, Spy, _square, process_safe=True, process_batch_size=0)
+        self.assertIs(_square, pickle.loads(pickle.dumps(_square)))
+        self.assertRaises(Exception, pickle.dumps, Spy(lambda: None))
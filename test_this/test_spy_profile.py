@@ -0,0 +1,108 @@
+import os
+import pstats
+import shutil
+import tempfile
+from types import ModuleType
+from unittest import TestCase
+
+from test_toolbox.spy import spy_module, spy_class, equal_to
+from test_toolbox.spy_profile import SpyProfiler
+
+_PROFILED_MODULE_SOURCE = """
+import time
+
+
+def handle(n):
+    time.sleep(0.002)
+    return parse(n) + countdown(n)
+
+
+def parse(n):
+    time.sleep(0.001)
+    return n
+
+
+def countdown(n):
+    return 0 if n == 0 else countdown(n - 1)
+
+
+def explode():
+    raise ValueError("boom")
+"""
+
+
+class _Service(object):
+    def run(self):
+        return self.step() + self.step()
+
+    def step(self):
+        return 1
+
+
+class SpyProfilerUnitTests(TestCase):
+    def setUp(self):
+        self.module = ModuleType("profiled")
+        exec(_PROFILED_MODULE_SOURCE, vars(self.module))
+        self.profiler = SpyProfiler()
+        self.spies = spy_module(self.module, profiler=self.profiler)
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.spies.restore()
+        shutil.rmtree(self.tempdir)
+
+    def test_function_stats_and_edges(self):
+        self.assertEqual(3, self.module.handle(3))
+        self.spies["profiled.handle"].assert_one_exact_match(equal_to(3))
+        stats = self.profiler.function_stats()
+        self.assertEqual(["profiled.handle", "profiled.parse", "profiled.countdown"], list(stats)[:3])
+        self.assertEqual((1, 1), stats["profiled.handle"][:2])
+        self.assertEqual((4, 1), stats["profiled.countdown"][:2])
+        self.assertGreaterEqual(stats["profiled.handle"].inclusive_ns, 3 * 1000 * 1000)
+        self.assertGreaterEqual(stats["profiled.parse"].exclusive_ns, 1000 * 1000)
+        self.assertLess(stats["profiled.handle"].exclusive_ns, stats["profiled.handle"].inclusive_ns)
+        self.assertEqual(["profiled.handle"], list(self.profiler.callers("profiled.parse")))
+        self.assertEqual(
+            {"profiled.handle": 1, "profiled.countdown": 3},
+            dict((caller, stats.calls) for caller, stats in self.profiler.callers("profiled.countdown").items())
+        )
+        self.profiler.reset()
+        self.assertEqual({}, self.profiler.function_stats())
+
+    def test_collapsed_stacks(self):
+        self.module.handle(1)
+        lines = self.profiler.collapsed_stacks(unit_ns=1)
+        self.assertEqual(["profiled.handle", "profiled.handle;profiled.countdown",
+                          "profiled.handle;profiled.countdown;profiled.countdown", "profiled.handle;profiled.parse"],
+                         [line.rsplit(" ", 1)[0] for line in lines])
+        path = os.path.join(self.tempdir, "stacks.txt")
+        self.profiler.write_collapsed_stacks(path, unit_ns=1)
+        with open(path) as stacks:
+            self.assertEqual(lines, stacks.read().splitlines())
+
+    def test_pstats(self):
+        self.module.handle(2)
+        stats = pstats.Stats(self.profiler)
+        names = dict((key[2], value) for key, value in stats.stats.items())
+        self.assertEqual((1, 3), names["countdown"][:2])
+        self.assertEqual(2, len(names["countdown"][4]))
+        path = os.path.join(self.tempdir, "profile.pstats")
+        self.profiler.dump_stats(path)
+        self.assertEqual(stats.stats, pstats.Stats(path).stats)
+
+    def test_exceptions_unwind(self):
+        self.assertRaises(ValueError, self.module.explode)
+        self.module.parse(1)
+        self.assertEqual({}, self.profiler.callers("profiled.parse"))
+        self.assertEqual(1, self.profiler.function_stats()["profiled.explode"].calls)
+        self.assertEqual(0, self.spies["profiled.explode"].num_invocations)
+
+    def test_method_spies(self):
+        with spy_class(_Service, profiler=self.profiler, record_latency=True):
+            first, second = _Service(), _Service()
+            first.run()
+            second.step()
+            self.assertEqual(2, len(first.step.latencies_ns))
+        label = "{0}._Service.step".format(__name__)
+        self.assertEqual(3, self.profiler.function_stats()[label].calls)
+        self.assertEqual(2, self.profiler.callers(label)["{0}._Service.run".format(__name__)].calls)
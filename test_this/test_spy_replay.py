@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from test_toolbox.spy import Spy, equal_to, anything, instance_of
+from test_toolbox.spy_replay import save_recording, ReplayStub, ReplayMissError, replay_stub
+
+
+def _fetch(url, method="GET", *args, **headers):
+    _fetch.num_calls += 1
+    return "{0} {1} #{2}".format(method, url, _fetch.num_calls)
+
+
+class ReplayStubUnitTests(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "fetch.recording")
+        _fetch.num_calls = 0
+        self.spy = Spy(_fetch)
+        self.spy("/a")
+        self.spy("/b", method="POST", token="x")
+        self.spy("/a", "GET")
+        self.spy(["/unhashable"])
+        save_recording(self.spy, self.path)
+        _fetch.num_calls = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_exact_replay(self):
+        stub = ReplayStub(self.path)
+        self.assertEqual("GET /a #1", stub("/a"))
+        self.assertEqual("GET /a #3", stub(url="/a", method="GET"))
+        self.assertEqual("GET /a #3", stub("/a"))
+        self.assertEqual("POST /b #2", stub("/b", "POST", token="x"))
+        self.assertEqual("GET ['/unhashable'] #4", stub(["/unhashable"]))
+        self.assertEqual((5, 0), (stub.num_hits, stub.num_misses))
+        self.assertEqual(0, _fetch.num_calls)
+        self.assertEqual(stub("/b", method="POST", token="x"), ReplayStub(self.spy)("/b", method="POST", token="x"))
+
+    def test_miss_policies(self):
+        stub = ReplayStub(self.path)
+        with self.assertRaises(ReplayMissError) as context:
+            stub("/b", method="POST", token="y")
+        self.assertIn("Nearest recorded call: args=('/b',)", str(context.exception))
+        self.assertEqual(1, stub.num_misses)
+
+        self.assertEqual("POST /b #2", ReplayStub(self.path, miss_policy="nearest")("/b", method="POST"))
+
+        stub = ReplayStub(self.path, miss_policy="call_through", target_func=_fetch)
+        self.assertEqual("GET /c #1", stub("/c"))
+        self.assertEqual("GET /c #1", stub("/c"))
+        self.assertEqual(1, _fetch.num_calls)
+
+        self.assertRaises(ValueError, ReplayStub, self.path, miss_policy="call_through")
+        self.assertRaises(ValueError, ReplayStub, self.path, miss_policy="guess")
+
+    def test_predicate_rules(self):
+        stub = ReplayStub(self.path).when(anything, equal_to("POST"), token=anything)
+        self.assertEqual("POST /b #2", stub("/b", "POST", token="y"))
+        self.assertEqual("POST /b #2", stub("/z", "POST", token="y"))
+        self.assertRaises(ReplayMissError, stub, "/z", "PUT", token="y")
+
+    def test_replay_spy(self):
+        spy = replay_stub(self.path, bind_arguments=True)
+        self.assertEqual("GET /a #1", spy("/a"))
+        spy.assert_one_exact_match(equal_to("/a"), equal_to("GET"))
+        spy.assert_one_partial_match(method=equal_to("GET"))
+        spy.assert_all_result_match(instance_of(str))
+        self.assertEqual({"url": "/a", "method": "GET"}, spy.bound_invocations[0].arguments)
+        self.assertRaises(ReplayMissError, spy, "/missing")
+        self.assertEqual(1, spy.num_invocations)
+
+    def test_unpicklable_results_are_not_replayed(self):
+        spy = Spy(lambda value: lambda: value)
+        spy(1)
+        save_recording(spy, self.path)
+        self.assertRaises(ReplayMissError, ReplayStub(self.path), 1)
+        self.assertEqual(1, ReplayStub(spy)(1)())
+
+    def test_invocation_log_is_a_recording(self):
+        spy = Spy(_fetch, invocation_log=self.path)
+        spy("/d")
+        save_recording(spy, self.path)
+        self.assertEqual("GET /d #1", ReplayStub(self.path)("/d"))
+        spy.close()
+
+    def test_missing_recording(self):
+        missing = os.path.join(self.tempdir, "missing.recording")
+        with self.assertRaises(IOError) as context:
+            ReplayStub(missing)
+        self.assertIn("No such recording", str(context.exception))
+        self.assertRaises(IOError, replay_stub, missing)
+        self.assertFalse(os.path.exists(missing))
@@ -0,0 +1,158 @@
+from functools import partial
+from itertools import chain
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from test_toolbox.spy import Spy, apply_method_spy, equal_to, in_range, instance_of
+from test_toolbox.spy_sequence import SequenceClock, SequencedMatch, check_in_order, assert_in_order
+
+
+def connect(host, port=80):
+    return True
+
+
+def send(payload, flags=0):
+    return len(payload)
+
+
+def close():
+    return None
+
+
+class SequenceClockUnitTests(TestCase):
+    def setUp(self):
+        self.clock = SequenceClock()
+        self.connect = Spy(connect, sequence_clock=self.clock)
+        self.send = Spy(send, sequence_clock=self.clock)
+        self.close = Spy(close, sequence_clock=self.clock)
+
+    def run_protocol(self):
+        self.connect("example.com")
+        self.send(b"HELLO")
+        self.send(b"DATA", flags=1)
+        self.close()
+
+    def test_sequence_numbers(self):
+        self.run_protocol()
+        self.assertEqual([0], list(self.connect.sequence_numbers))
+        self.assertEqual([1, 2], list(self.send.sequence_numbers))
+        self.assertEqual([3], list(self.close.sequence_numbers))
+        self.assertEqual([2], self.send.match(flags=equal_to(1)).sequences())
+        self.assertEqual([1], self.send.exact_match(equal_to(b"HELLO"), equal_to(0)).sequences())
+        self.assertEqual([2], self.send.result_match(equal_to(4)).sequences())
+        self.assertEqual(2, self.send.match().first_after(1))
+        self.assertIsNone(self.send.match().first_after(2))
+
+        self.send.reset()
+        self.assertEqual([], list(self.send.sequence_numbers))
+        self.send(b"AGAIN")
+        self.assertEqual([4], list(self.send.sequence_numbers))
+
+    def test_in_order(self):
+        self.run_protocol()
+        assert_in_order(self.connect.match(), self.send.match(equal_to(b"HELLO")), self.close.match())
+        assert_in_order(self.send.match(), self.send.match())
+        assert_in_order(self.connect.match(equal_to("example.com")), self.send.result_match(in_range(4, 5)))
+        self.assertTrue(check_in_order(self.send.match(flags=equal_to(1))))
+        self.assertFalse(check_in_order(self.close.match(), self.connect.match()))
+        self.assertFalse(check_in_order(self.send.match(flags=equal_to(1)), self.send.match(equal_to(b"HELLO"))))
+        self.assertFalse(check_in_order(self.send.match(), self.send.match(), self.send.match()))
+        self.assertFalse(check_in_order(self.connect.match(equal_to("elsewhere"))))
+
+    def test_failure_report(self):
+        self.run_protocol()
+        with self.assertRaises(AssertionError) as context:
+            assert_in_order(self.send.match(equal_to(b"DATA")), self.send.match(equal_to(b"HELLO")))
+        message = str(context.exception)
+        self.assertIn("after sequence number 2 (matching send.match(equal_to(b'DATA')))", message)
+        self.assertIn("2. send.match(equal_to(b'HELLO')): [1]", message)
+
+        with self.assertRaises(AssertionError) as context:
+            assert_in_order(self.close.result_match(instance_of(int)))
+        self.assertIn("Failed to find any invocation of close.result_match(instance_of(int))", str(context.exception))
+
+    def test_nested_calls_are_sequenced_when_they_return(self):
+        def outer():
+            return self.send(b"INNER")
+
+        outer_spy = Spy(outer, sequence_clock=self.clock)
+        outer_spy()
+        assert_in_order(self.send.match(), outer_spy.match())
+
+    def test_method_spies_share_the_clock(self):
+        clock = self.clock
+
+        class Client(object):
+            @partial(apply_method_spy, sequence_clock=clock)
+            def request(self, path):
+                return path
+
+        first, second = Client(), Client()
+        second.request("/")
+        self.connect("example.com")
+        first.request("/")
+        assert_in_order(second.request.match(equal_to("/")), self.connect.match(), first.request.match())
+        self.assertFalse(check_in_order(first.request.match(), second.request.match()))
+
+    def test_threads_share_the_clock(self):
+        class YieldingClock(SequenceClock):
+            def tick(self):
+                sequence = super(YieldingClock, self).tick()
+                # Hand over to another thread between drawing a number and recording it.
+                time.sleep(0)
+                return sequence
+
+        clock = YieldingClock()
+        spies = [Spy(send, sequence_clock=clock), Spy(send, sequence_clock=clock, columnar=True)]
+
+        def worker(spy):
+            for i in range(500):
+                spy(b"X", flags=i)
+
+        threads = [threading.Thread(target=worker, args=(spy,)) for spy in spies for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for spy in spies:
+            sequences = list(spy.sequence_numbers)
+            self.assertEqual(1500, spy.num_invocations)
+            self.assertEqual(sorted(sequences), sequences)
+            self.assertEqual(len(sequences), len(spy.match(flags=in_range(0, 500)).sequences()))
+        self.assertEqual(list(range(3000)), sorted(chain.from_iterable(spy.sequence_numbers for spy in spies)))
+
+    def test_store_modes(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            spies = [
+                Spy(send, sequence_clock=self.clock, columnar=True),
+                Spy(send, sequence_clock=self.clock, index_arguments=True),
+                Spy(send, sequence_clock=self.clock, bind_arguments=True),
+                Spy(send, sequence_clock=self.clock, invocation_log=os.path.join(tempdir, "send.log")),
+            ]
+            for i in range(6):
+                for spy in spies:
+                    spy(b"X" * i)
+            for spy in spies:
+                self.assertEqual([4 * 3 + spies.index(spy)], spy.match(equal_to(b"XXX")).sequences())
+            assert_in_order(*[spy.match(equal_to(b"X")) for spy in spies] +
+                            [spy.result_match(equal_to(5)) for spy in spies])
+            self.assertFalse(check_in_order(*[spy.match(equal_to(b"X")) for spy in reversed(spies)]))
+            spies[-1].close()
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_invalid_uses(self):
+        self.assertRaises(ValueError, Spy(send).match)
+        other = Spy(close, sequence_clock=SequenceClock())
+        other()
+        self.assertRaises(ValueError, check_in_order, self.close.match(), other.match())
+        for option in ({"max_invocations": 5}, {"counts_only": True}, {"sample_every": 2}, {"reservoir_size": 5},
+                       {"thread_safe": True}, {"process_safe": True}):
+            self.assertRaises(ValueError, Spy, send, sequence_clock=self.clock, **option)
+        self.assertIsInstance(self.send.match(), SequencedMatch)
+        self.assertEqual("send.match(flags=equal_to(1))", repr(self.send.match(flags=equal_to(1))))
@@ -7,6 +7,7 @@ Included are:
     functions/methods like socket.recv_into()
 * await_condition() -- Repeated evaluates a callable at a specified poll rate for a given amount of time, and
     either returns if the callable became true quickly enough, or asserts otherwise.
+* perf_counter_ns() -- time.perf_counter_ns(), or the closest equivalent on Python versions that lack it.
 """
 
 import ctypes
@@ -69,3 +70,10 @@ def await_condition(description, condition_eval_callable, on_failure=lambda: Tru
                 "Awaiting condition {0} has timed out after {1} seconds".format(description, timeout)
             )
         time.sleep(poll_s)
+
+
+def _perf_counter_ns():
+    return int(getattr(time, "perf_counter", time.time)() * 1e9)
+
+
+perf_counter_ns = getattr(time, "perf_counter_ns", _perf_counter_ns)
@@ -1,12 +1,63 @@
 import inspect
+from array import array
+from bisect import bisect_left
+import copy
 from functools import update_wrapper
+import hashlib
+import heapq
+from itertools import chain, count, islice, repeat
+import math
+from numbers import Real
+import random
+import re
+import threading
+import weakref
 from types import MethodType, FunctionType, BuiltinFunctionType
-from collections import namedtuple
-from itertools import islice
+from collections import namedtuple, deque
 import sys
 
+from test_toolbox.helpers import perf_counter_ns
+
+try:
+    from collections.abc import Iterator
+except ImportError:
+    from collections import Iterator
+
+try:
+    from itertools import ifilter as _filter
+except ImportError:
+    _filter = filter
+
+try:
+    from reprlib import Repr as _Repr
+except ImportError:
+    from repr import Repr as _Repr
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from inspect import signature as _signature, unwrap as _unwrap, Parameter as _Parameter
+except ImportError:
+    _signature = None
+
 IS_PY2 = sys.version_info[0] == 2
+HAS_ASYNC_SUPPORT = sys.version_info >= (3, 6)
+
+if HAS_ASYNC_SUPPORT:
+    from test_toolbox.spy_async import (
+        record_awaited, SpiedAsyncIterator, SpiedAsyncContextManager, is_async_context_manager_factory
+    )
 _REPR_MAX_WIDTH = [5000]
+_REPORT_MAX_INVOCATIONS = [20]
+_INT64_TYPECODE = 'l' if IS_PY2 else 'q'
+_NUMERIC_TYPECODES = {int: _INT64_TYPECODE, float: 'd'}
+_MISSING = object()
+_NO_KWARGS = ()
+# Keyed weakly on the function, so that it never keeps a spied function (or its code and globals) alive.
+_ARGSPEC_CACHE = weakref.WeakKeyDictionary()
 
 
 def set_reporting_max_width(w):
@@ -32,16 +83,957 @@ def get_reporting_max_width():
     return _REPR_MAX_WIDTH[0]
 
 
+def set_reporting_max_invocations(n):
+    """
+    Set the max number of invocations listed when a Spy assertion fails. The nearest matches are listed first, and
+    the rest are only counted.
+
+    :param n: The new max number of invocations to list for the module
+    :type n: int
+    :return: True
+    """
+    _REPORT_MAX_INVOCATIONS[0] = int(n)
+    return True
+
+
+def get_reporting_max_invocations():
+    """
+    Get the current max number of invocations listed when a Spy assertion fails.
+
+    :return: The current max number of listed invocations.
+    :rtype: int
+    """
+    return _REPORT_MAX_INVOCATIONS[0]
+
+
+class _BoundedRepr(_Repr):
+    """
+    A reprlib.Repr which limits the nesting depth, the number of items of containers and the length of strings
+    while it formats, so that a recorded payload is never formatted in full only to be truncated.
+    """
+    def __init__(self, max_width):
+        _Repr.__init__(self)
+        self.maxlevel = 4
+        self.maxtuple = self.maxlist = self.maxarray = self.maxdict = self.maxset = self.maxfrozenset = 10
+        self.maxdeque = 10
+        # A single long string (or payload) should not crowd out the rest of an invocation.
+        self.maxstring = self.maxother = self.maxlong = max(max_width // 8, 40)
+
+    def repr1(self, x, level):
+        fields = getattr(type(x), "_fields", None)
+        if fields is not None and isinstance(x, tuple):
+            # i.e. a TargetInvocation, which would otherwise be formatted in full by repr_instance().
+            if level <= 0:
+                return "{0}(...)".format(type(x).__name__)
+            return "{0}({1})".format(type(x).__name__, ", ".join(
+                "{0}={1}".format(name, self.repr1(value, level - 1)) for name, value in zip(fields, x)
+            ))
+        return _Repr.repr1(self, x, level)
+
+    def repr_bytes(self, x, level):
+        return self.repr_str(x, level)
+
+    repr_bytearray = repr_bytes
+
+
 def _max_length_repr(obj, max_width=None):
     max_width = max_width or _REPR_MAX_WIDTH[0]
-    result_str = repr(obj)
+    result_str = _BoundedRepr(max_width).repr(obj)
     if len(result_str) > max_width:
         return result_str[:max_width-3] + "..."
     else:
         return result_str
 
 
+def _satisfies(predicate, value):
+    try:
+        return bool(predicate(value))
+    except Exception:
+        return False
+
+
 TargetInvocation = namedtuple("TargetInvocation", ("args", "kwargs", "result"))
+BoundInvocation = namedtuple("BoundInvocation", ("arguments", "extra_args", "extra_kwargs", "result"))
+ResultStats = namedtuple("ResultStats", ("count", "min", "max", "mean"))
+SequencedInvocation = namedtuple("SequencedInvocation", ("sequence", "thread_id", "thread_sequence", "invocation"))
+
+
+SpyArgSpec = namedtuple(
+    "SpyArgSpec", ["args", "varargs", "keywords", "defaults", "kwonlyargs", "kwonlydefaults", "posonlyargs"]
+)
+_UNINSPECTABLE_ARGSPEC = SpyArgSpec((), 'args', 'kwargs', (), (), None, ())
+
+
+def _signature_argspec(func):
+    if _signature is None:
+        args, varargs, keywords, defaults = inspect.getargspec(func)
+        return SpyArgSpec(args, varargs, keywords, defaults, [], None, [])
+    args, posonlyargs, kwonlyargs, defaults = [], [], [], []
+    varargs = keywords = kwonlydefaults = None
+    for parameter in _signature(func).parameters.values():
+        kind = parameter.kind
+        if kind in (_Parameter.POSITIONAL_ONLY, _Parameter.POSITIONAL_OR_KEYWORD):
+            args.append(parameter.name)
+            if kind == _Parameter.POSITIONAL_ONLY:
+                posonlyargs.append(parameter.name)
+            if parameter.default is not _Parameter.empty:
+                defaults.append(parameter.default)
+        elif kind == _Parameter.VAR_POSITIONAL:
+            varargs = parameter.name
+        elif kind == _Parameter.KEYWORD_ONLY:
+            kwonlyargs.append(parameter.name)
+            if parameter.default is not _Parameter.empty:
+                kwonlydefaults = kwonlydefaults or {}
+                kwonlydefaults[parameter.name] = parameter.default
+        else:
+            keywords = parameter.name
+    return SpyArgSpec(args, varargs, keywords, tuple(defaults) or None, kwonlyargs, kwonlydefaults, posonlyargs)
+
+
+def get_argspec(func, skip_first=False):
+    """
+    Introspect the parameters of a callable, in the style of inspect.getargspec(), but built on
+    inspect.signature() so that keyword-only and positional-only parameters are supported.
+
+    The parameter layout of a plain function is cached for as long as that function is alive, so every spy of the
+    same function or method costs a single introspection. Defaults are always read from the function itself.
+
+    :param func: The callable to introspect.
+    :param skip_first: True if the first positional parameter (i.e. self) should be left out, False otherwise.
+    :return: A SpyArgSpec. Its args are the parameters that may be passed positionally, and its defaults align to
+        the end of those args. Keyword-only parameters are listed in kwonlyargs (with their defaults in
+        kwonlydefaults), and are matched as named parameters, which may only be passed by keyword.
+    """
+    if _signature is not None:
+        func = _unwrap(func, stop=lambda f: hasattr(f, "__signature__"))
+    if not isinstance(func, FunctionType) or hasattr(func, "__signature__"):
+        argspec = _signature_argspec(func)
+    else:
+        argspec = _ARGSPEC_CACHE.get(func)
+        if argspec is None:
+            # The defaults are left out of the cached layout, as they may refer back to the function itself.
+            argspec = _ARGSPEC_CACHE.setdefault(
+                func, _signature_argspec(func)._replace(defaults=None, kwonlydefaults=None)
+            )
+        argspec = argspec._replace(defaults=func.__defaults__, kwonlydefaults=getattr(func, "__kwdefaults__", None))
+    if skip_first and argspec.args:
+        argspec = argspec._replace(args=argspec.args[1:], posonlyargs=argspec.posonlyargs[1:])
+    return argspec
+
+
+def _argspec_defaults(argspec):
+    # Map every defaulted parameter, positional or keyword-only, to its default.
+    defaults = dict(zip(argspec.args[-len(argspec.defaults):], argspec.defaults)) if argspec.defaults else {}
+    defaults.update(argspec.kwonlydefaults or {})
+    return defaults
+
+
+class ArgumentBinder(object):
+    """
+    An ArgumentBinder binds the arguments of an invocation to the parameter names of an argspec, filling in
+    any defaults that were not explicitly passed.
+
+    :param argspec: The argspec of the spied callable (see Spy.target_func_argspec).
+    """
+    def __init__(self, argspec):
+        self.arg_names = tuple(argspec.args)
+        self.parameter_names = self.arg_names + tuple(argspec.kwonlyargs or ())
+        self._arg_name_set = frozenset(self.parameter_names)
+        self.defaults = _argspec_defaults(argspec)
+
+    def bind(self, args, kwargs, result):
+        """
+        Bind a single invocation.
+
+        :param args: The positional arguments of the invocation.
+        :param kwargs: The keyword arguments of the invocation.
+        :param result: The result of the invocation.
+        :return: A BoundInvocation, mapping every named parameter (keyword-only ones included) to its value, with
+            any arguments that did not align to a named parameter kept in extra_args and extra_kwargs.
+        """
+        arguments = dict(self.defaults)
+        arguments.update(zip(self.arg_names, args))
+        extra_kwargs = {}
+        for name, value in kwargs.items():
+            if name in self._arg_name_set:
+                arguments[name] = value
+            else:
+                extra_kwargs[name] = value
+        return BoundInvocation(arguments, tuple(args[len(self.arg_names):]), extra_kwargs, result)
+
+
+class ArgumentIndex(object):
+    """
+    An ArgumentIndex keeps hash indexes over the arguments of recorded invocations, so that queries whose
+    predicates are equality based (equal_to and any_of, which expose the values they accept as "index_values")
+    can look up candidate invocations instead of scanning every one of them. There is one index per parameter
+    name, keyed by the bound argument value, and one over whole bound argument tuples for exact matches.
+
+    Invocations with unhashable argument values are tracked separately and are always treated as candidates,
+    so that they are still checked by the full predicates. The index is positional, and so only supports
+    append-only invocation lists.
+
+    :param argspec: The argspec of the spied callable (see Spy.target_func_argspec).
+    """
+    def __init__(self, argspec):
+        self._binder = ArgumentBinder(argspec)
+        self.parameter_names = self._binder.parameter_names
+        self.clear()
+
+    def clear(self):
+        """
+        Remove every indexed invocation.
+
+        :return: None
+        """
+        self.by_name = dict((name, {}) for name in self.parameter_names)
+        self.unhashable_by_name = dict((name, []) for name in self.parameter_names)
+        self.by_arguments = {}
+        self.unhashable_arguments = []
+        self._length = 0
+
+    def add(self, args, kwargs, bound_invocation=None):
+        """
+        Index the next recorded invocation.
+
+        :param args: The positional arguments of the invocation.
+        :param kwargs: The keyword arguments of the invocation.
+        :param bound_invocation: (OPTIONAL) The invocation already bound by an ArgumentBinder, if available.
+        :return: None
+        """
+        position = self._length
+        self._length += 1
+        arguments, extra_args, extra_kwargs, _ = bound_invocation or self._binder.bind(args, kwargs, None)
+        for name in self.parameter_names:
+            value = arguments.get(name, _MISSING)
+            try:
+                self.by_name[name].setdefault(value, []).append(position)
+            except TypeError:
+                self.unhashable_by_name[name].append(position)
+        try:
+            key = (tuple(arguments.get(name, _MISSING) for name in self.parameter_names), extra_args,
+                   frozenset(extra_kwargs.items()))
+            self.by_arguments.setdefault(key, []).append(position)
+        except TypeError:
+            self.unhashable_arguments.append(position)
+
+    def _whole_argument_candidates(self, plan):
+        if not plan.exact or len(plan.named_predicates) != len(self.parameter_names):
+            return None
+        predicates = [predicate for _, _, predicate in plan.named_predicates] + list(plan.extra_arg_predicates) + \
+            [predicate for _, predicate in plan.extra_kwarg_predicates]
+        values = [getattr(predicate, "index_values", None) for predicate in predicates]
+        if not all(value is not None and len(value) == 1 for value in values):
+            return None
+        num_names = len(self.parameter_names)
+        key = (tuple(value[0] for value in values[:num_names]),
+               tuple(value[0] for value in values[num_names:num_names + len(plan.extra_arg_predicates)]),
+               frozenset((name, value[0]) for (name, _), value in
+                         zip(plan.extra_kwarg_predicates, values[num_names + len(plan.extra_arg_predicates):])))
+        return self.by_arguments.get(key, []) + self.unhashable_arguments
+
+    def candidates(self, plan):
+        """
+        Find the positions of the invocations that may satisfy a MatchPlan, using the most selective index
+        available for its predicates.
+
+        :param plan: The MatchPlan to find candidates for.
+        :return: A sorted list of candidate positions, or None if no predicate of the plan can use an index (in
+            which case every invocation is a candidate).
+        """
+        best = None
+        try:
+            best = self._whole_argument_candidates(plan)
+        except TypeError:
+            pass
+        if best is None:
+            for _, name, predicate in plan.named_predicates:
+                values = getattr(predicate, "index_values", None)
+                if values is None:
+                    continue
+                index = self.by_name[name]
+                try:
+                    positions = [position for value in values for position in index.get(value, ())]
+                except TypeError:
+                    continue
+                positions.extend(self.unhashable_by_name[name])
+                if best is None or len(positions) < len(best):
+                    best = positions
+        return None if best is None else sorted(set(best))
+
+
+class InvocationRingBuffer(deque):
+    """
+    A fixed-size buffer of recorded invocations, which keeps only the most recent maxlen invocations and counts
+    the invocations it has had to evict to make room for newer ones.
+
+    :param maxlen: The maximum number of invocations to retain.
+    """
+    def __init__(self, maxlen):
+        deque.__init__(self, (), maxlen)
+        self.seen = 0
+
+    def append(self, invocation):
+        self.seen += 1
+        deque.append(self, invocation)
+
+    @property
+    def evicted(self):
+        return self.seen - len(self)
+
+
+class SampledInvocationStore(object):
+    """
+    An invocation store which records only one in every sample_every invocations (the first, and then every
+    sample_every-th one after it), while counting every invocation seen.
+
+    :param sample_every: The sampling period.
+    """
+    def __init__(self, sample_every):
+        self.sample_every = sample_every
+        self.clear()
+
+    def clear(self):
+        """
+        Remove all of the recorded invocations from this store.
+
+        :return: None
+        """
+        self.invocations = []
+        self.seen = 0
+        self._countdown = 1
+
+    def record(self, args, kwargs, result):
+        """
+        Record a single invocation, if it is sampled.
+
+        :param args: The positional arguments of the invocation.
+        :param kwargs: The keyword arguments of the invocation.
+        :param result: The result of the invocation.
+        :return: None
+        """
+        self.seen += 1
+        self._countdown -= 1
+        if not self._countdown:
+            self._countdown = self.sample_every
+            self.invocations.append(TargetInvocation(args, kwargs, result))
+
+    def __len__(self):
+        return len(self.invocations)
+
+    def __getitem__(self, index):
+        return self.invocations[index]
+
+    def __iter__(self):
+        return iter(self.invocations)
+
+
+class ReservoirInvocationStore(SampledInvocationStore):
+    """
+    An invocation store which keeps a uniform random sample (a "reservoir") of at most size invocations out of
+    all of the invocations seen. Sampled invocations are not kept in recording order.
+
+    :param size: The maximum number of invocations to keep.
+    :param random_source: (OPTIONAL) The random.Random instance to draw samples with.
+    """
+    def __init__(self, size, random_source=None):
+        self.size = size
+        self.random_source = random_source or random.Random()
+        SampledInvocationStore.__init__(self, 1)
+
+    def record(self, args, kwargs, result):
+        """
+        Record a single invocation, if it is sampled into the reservoir.
+
+        :param args: The positional arguments of the invocation.
+        :param kwargs: The keyword arguments of the invocation.
+        :param result: The result of the invocation.
+        :return: None
+        """
+        self.seen += 1
+        if len(self.invocations) < self.size:
+            self.invocations.append(TargetInvocation(args, kwargs, result))
+        else:
+            index = self.random_source.randrange(self.seen)
+            if index < self.size:
+                self.invocations[index] = TargetInvocation(args, kwargs, result)
+
+
+class ThreadLocalInvocationStore(object):
+    """
+    An invocation store for callables invoked concurrently from many threads. Each thread records into its own
+    buffer, so recording takes no lock, and every invocation is stamped with a global sequence number (drawn from
+    an itertools.count, which is atomic under the GIL) as well as its position in its thread's buffer. The
+    buffers are merged lazily, in global sequence order, when the store is read (see sequenced()). The thread_id
+    of each SequencedInvocation is the ident of the recording thread, which may be reused once a thread exits.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """
+        Remove all of the recorded invocations from this store. Invocations racing with a clear may be lost.
+
+        :return: None
+        """
+        with self._lock:
+            self._local = threading.local()
+            self._sequence = count()
+            self._buffers = []
+            self._merged = []
+            self._merged_offsets = []
+
+    def _register_buffer(self, local):
+        buffer = []
+        with self._lock:
+            self._buffers.append((threading.current_thread().ident, buffer))
+        local.buffer = buffer
+        return buffer
+
+    def record(self, args, kwargs, result):
+        """
+        Record a single invocation into the buffer of the calling thread.
+
+        :param args: The positional arguments of the invocation.
+        :param kwargs: The keyword arguments of the invocation.
+        :param result: The result of the invocation.
+        :return: None
+        """
+        local = self._local
+        buffer = getattr(local, "buffer", None)
+        if buffer is None:
+            buffer = self._register_buffer(local)
+        buffer.append((next(self._sequence), TargetInvocation(args, kwargs, result)))
+
+    def sequenced(self):
+        """
+        Merge the per-thread buffers recorded so far.
+
+        :return: The list of SequencedInvocation records, in global sequence order.
+        """
+        with self._lock:
+            buffers = list(self._buffers)
+            merged = self._merged
+            offsets = self._merged_offsets
+            offsets.extend([0] * (len(buffers) - len(offsets)))
+            new_entries = []
+            for i, (thread_id, buffer) in enumerate(buffers):
+                end = len(buffer)
+                new_entries.extend(
+                    SequencedInvocation(sequence, thread_id, thread_sequence, invocation)
+                    for thread_sequence, (sequence, invocation) in enumerate(buffer[offsets[i]:end], offsets[i])
+                )
+                offsets[i] = end
+            new_entries.sort()
+            if merged and new_entries and new_entries[0].sequence < merged[-1].sequence:
+                merged.extend(new_entries)
+                merged.sort()
+            else:
+                merged.extend(new_entries)
+            return list(merged)
+
+    def snapshot(self):
+        """
+        Merge the per-thread buffers recorded so far.
+
+        :return: The list of recorded TargetInvocation records, in global sequence order.
+        """
+        return [sequenced.invocation for sequenced in self.sequenced()]
+
+    def invocations_since(self, cursor):
+        """
+        Access the invocations recorded since an earlier call (see IncrementalQuery), without merging the
+        per-thread buffers: they are grouped by thread, rather than in global sequence order.
+
+        :param cursor: The cursor returned by the earlier call, or None for every invocation.
+        :return: A (list of TargetInvocation records, cursor) pair.
+        """
+        with self._lock:
+            buffers = list(self._buffers)
+        offsets = list(cursor or ())
+        offsets.extend([0] * (len(buffers) - len(offsets)))
+        invocations = []
+        for i, (_, buffer) in enumerate(buffers):
+            end = len(buffer)
+            invocations.extend(invocation for _, invocation in buffer[offsets[i]:end])
+            offsets[i] = end
+        return invocations, offsets
+
+    def __len__(self):
+        return sum(len(buffer) for _, buffer in list(self._buffers))
+
+    def __getitem__(self, index):
+        return self.sequenced()[index].invocation
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+
+class InvocationCounter(object):
+    """
+    An invocation store which keeps no invocations at all, only the number of invocations seen and a frequency
+    table of their (hashable) arguments. Results are not kept.
+
+    Queries against an InvocationCounter are answered from the frequency table, so invocations with unhashable
+    arguments (positional or keyword) are counted but can never match. Times predicates which are
+    QuantifierPredicates are decided from the counts alone (see count_matching()), without building a record per
+    invocation.
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """
+        Reset all of the counts kept by this store.
+
+        :return: None
+        """
+        self.argument_counts = {}
+        self.seen = 0
+        self.unhashable = 0
+
+    def record(self, args, kwargs, _):
+        """
+        Count a single invocation.
+
+        :param args: The positional arguments of the invocation.
+        :param kwargs: The keyword arguments of the invocation.
+        :return: None
+        """
+        self.seen += 1
+        counts = self.argument_counts
+        try:
+            key = _counter_key(args, kwargs)
+            counts[key] = counts.get(key, 0) + 1
+        except TypeError:
+            self.unhashable += 1
+
+    def count(self, *args, **kwargs):
+        """
+        Access the number of invocations made with exactly the given arguments.
+
+        :param args: The positional arguments to look up.
+        :param kwargs: The keyword arguments to look up.
+        :return: The integer number of matching invocations.
+        """
+        try:
+            return self.argument_counts.get(_counter_key(args, kwargs), 0)
+        except TypeError:
+            return 0
+
+    def __len__(self):
+        return self.seen
+
+    def __iter__(self):
+        for (args, kwargs_items), count in self.argument_counts.items():
+            invocation = TargetInvocation(args, dict(kwargs_items), None)
+            for _ in range(count):
+                yield invocation
+
+    def find_matching(self, plan=None, result_predicate=None):
+        """
+        Find the counted invocations whose arguments satisfy a MatchPlan.
+
+        :param plan: (OPTIONAL) The MatchPlan the invocation arguments must satisfy.
+        :param result_predicate: Not supported, as results are not kept.
+        :return: The list of matching TargetInvocation records (with a result of None), one per invocation.
+        """
+        if result_predicate is not None:
+            raise ValueError("Results are not recorded by a counts only Spy.")
+        matching = []
+        for (args, kwargs_items), count in self.argument_counts.items():
+            kwargs = dict(kwargs_items)
+            if plan is None or plan.matches(args, kwargs):
+                matching.extend([TargetInvocation(args, kwargs, None)] * count)
+        return matching
+
+    def count_matching(self, plan=None, result_predicate=None):
+        """
+        Count the invocations whose arguments satisfy a MatchPlan, with a single check per distinct set of
+        arguments.
+
+        :param plan: (OPTIONAL) The MatchPlan the invocation arguments must satisfy.
+        :param result_predicate: Not supported, as results are not kept.
+        :return: The integer number of matching invocations.
+        """
+        if result_predicate is not None:
+            raise ValueError("Results are not recorded by a counts only Spy.")
+        if plan is None:
+            return self.seen - self.unhashable
+        return sum(count for (args, kwargs_items), count in self.argument_counts.items()
+                   if plan.matches(args, dict(kwargs_items)))
+
+
+def _counter_key(args, kwargs):
+    # Keyword names are unique strings, so sorting the items never compares their values. A tuple is also much
+    # smaller than a frozenset of the same items. Raises TypeError if any argument is unhashable.
+    key = (args, tuple(sorted(kwargs.items())) if kwargs else _NO_KWARGS)
+    hash(key)
+    return key
+
+
+class InvocationColumn(object):
+    """
+    A single column of a ColumnarInvocationStore. Values are kept in a typed array for as long as every value
+    appended is a plain int (that fits in 64 bits) or float, and the column falls back to a list otherwise.
+    """
+    __slots__ = ("values", "numeric_type")
+
+    def __init__(self):
+        self.values = None
+        self.numeric_type = None
+
+    def append(self, value):
+        values = self.values
+        if values is None:
+            typecode = _NUMERIC_TYPECODES.get(type(value))
+            if typecode is not None:
+                values = self.values = array(typecode)
+                self.numeric_type = type(value)
+            else:
+                values = self.values = []
+        if self.numeric_type is not None:
+            if type(value) is self.numeric_type:
+                try:
+                    values.append(value)
+                    return
+                except OverflowError:
+                    pass
+            values = self.values = list(values)
+            self.numeric_type = None
+        values.append(value)
+
+    def __len__(self):
+        return 0 if self.values is None else len(self.values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def as_numpy(self):
+        """
+        Access the column as a NumPy array, if NumPy is available and the column is numeric.
+
+        :return: A new NumPy array copy of the column, or None.
+        """
+        if numpy is None or self.numeric_type is None:
+            return None
+        return numpy.array(self.values)
+
+
+class ColumnarInvocationStore(object):
+    """
+    An invocation store which keeps recorded invocations bound to the parameter names of the spied callable,
+    as one column per parameter name plus a column of results. Numeric columns are kept as typed arrays (see
+    InvocationColumn), and predicates which provide a "vectorized" attribute are run over whole columns at once
+    with NumPy, if it is available. Arguments which do not align to a named parameter are kept sparsely.
+
+    Iterating over the store yields TargetInvocation records, reconstructed with every named parameter passed
+    positionally, except for keyword-only parameters, which are passed by keyword.
+
+    :param argspec: The argspec of the spied callable (see Spy.target_func_argspec).
+    """
+    def __init__(self, argspec):
+        self._binder = ArgumentBinder(argspec)
+        self.arg_names = self._binder.arg_names
+        self.parameter_names = self._binder.parameter_names
+        self.clear()
+
+    def clear(self):
+        """
+        Remove all of the recorded invocations from this store.
+
+        :return: None
+        """
+        self.columns = dict((name, InvocationColumn()) for name in self.parameter_names)
+        self.results = InvocationColumn()
+        self.extra_args = {}
+        self.extra_kwargs = {}
+        self._length = 0
+
+    def record(self, args, kwargs, result):
+        """
+        Record a single invocation.
+
+        :param args: The positional arguments of the invocation.
+        :param kwargs: The keyword arguments of the invocation.
+        :param result: The result of the invocation.
+        :return: None
+        """
+        arguments, extra_args, extra_kwargs, _ = self._binder.bind(args, kwargs, result)
+        for name, column in self.columns.items():
+            column.append(arguments.get(name, _MISSING))
+        self.results.append(result)
+        if extra_args:
+            self.extra_args[self._length] = extra_args
+        if extra_kwargs:
+            self.extra_kwargs[self._length] = extra_kwargs
+        self._length += 1
+
+    def column(self, name):
+        """
+        Access the recorded values of a single parameter.
+
+        :param name: The parameter name.
+        :return: The values of that parameter for every recorded invocation, as an array or a list.
+        """
+        return self.columns[name].values or []
+
+    def bound(self, index):
+        """
+        Access a single recorded invocation in its bound form.
+
+        :param index: The index of the invocation.
+        :return: A BoundInvocation.
+        """
+        arguments = {}
+        for name, column in self.columns.items():
+            value = column[index]
+            if value is not _MISSING:
+                arguments[name] = value
+        return BoundInvocation(
+            arguments, self.extra_args.get(index, ()), self.extra_kwargs.get(index, {}), self.results[index]
+        )
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("invocation index out of range")
+        arguments, extra_args, extra_kwargs, result = self.bound(index)
+        args = tuple(arguments[name] for name in self.arg_names if name in arguments)
+        kwargs = dict((name, arguments[name]) for name in self.parameter_names[len(self.arg_names):]
+                      if name in arguments)
+        kwargs.update(extra_kwargs)
+        return TargetInvocation(args + extra_args, kwargs, result)
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self[index]
+
+    def _extras_match(self, plan, index):
+        extra_args = self.extra_args.get(index, ())
+        extra_kwargs = self.extra_kwargs.get(index, {})
+        if plan.exact:
+            if len(extra_args) != len(plan.extra_arg_predicates) or \
+                    len(extra_kwargs) != len(plan.extra_kwarg_predicates):
+                return False
+        elif len(extra_args) < len(plan.extra_arg_predicates):
+            return False
+        for name, _ in plan.extra_kwarg_predicates:
+            if name not in extra_kwargs:
+                return False
+        for predicate, value in zip(plan.extra_arg_predicates, extra_args):
+            if not predicate(value):
+                return False
+        for name, predicate in plan.extra_kwarg_predicates:
+            if not predicate(extra_kwargs[name]):
+                return False
+        return True
+
+    def matching_indices(self, plan=None, result_predicate=None):
+        """
+        Find the indices of the recorded invocations that satisfy a MatchPlan and/or a result predicate. Each
+        predicate is applied column by column, vectorized where possible.
+
+        :param plan: (OPTIONAL) The MatchPlan the invocation arguments must satisfy.
+        :param result_predicate: (OPTIONAL) An arity 1 predicate the invocation result must satisfy.
+        :return: The list of matching indices, in recording order.
+        """
+        checks = []
+        if plan is not None:
+            if plan.exact and len(plan.named_predicates) != len(self.parameter_names):
+                return []
+            checks.extend((self.columns[name], predicate) for _, name, predicate in plan.named_predicates)
+        if result_predicate is not None:
+            checks.append((self.results, result_predicate))
+
+        mask = None
+        scalar_checks = []
+        for column, predicate in checks:
+            column_mask = _vectorized_mask(column, predicate)
+            if column_mask is None:
+                scalar_checks.append((column, predicate))
+            else:
+                mask = column_mask if mask is None else mask & column_mask
+        candidates = range(self._length) if mask is None else numpy.flatnonzero(mask).tolist()
+
+        if plan is not None and (plan.exact or plan.extra_arg_predicates or plan.extra_kwarg_predicates):
+            candidates = [index for index in candidates if self._extras_match(plan, index)]
+        for column, predicate in scalar_checks:
+            values = column.values
+            candidates = [index for index in candidates
+                          if values[index] is not _MISSING and predicate(values[index])]
+        return list(candidates)
+
+    def find_matching(self, plan=None, result_predicate=None):
+        """
+        Find the recorded invocations that satisfy a MatchPlan and/or a result predicate.
+
+        :param plan: (OPTIONAL) The MatchPlan the invocation arguments must satisfy.
+        :param result_predicate: (OPTIONAL) An arity 1 predicate the invocation result must satisfy.
+        :return: The list of matching BoundInvocation records.
+        """
+        return [self.bound(index) for index in self.matching_indices(plan, result_predicate)]
+
+
+def _vectorized_mask(column, predicate):
+    vectorized = getattr(predicate, "vectorized", None)
+    if vectorized is None:
+        return None
+    values = column.as_numpy()
+    if values is None:
+        return None
+    return numpy.asarray(vectorized(values), dtype=bool)
+
+
+class SpiedIterator(object):
+    """
+    An iterator wrapper, which records the items yielded by the wrapped iterator lazily, as they are consumed,
+    rather than materializing the iterator. Generator send(), throw() and close() are passed through.
+
+    :param iterator: The iterator to wrap.
+    :param max_items: (OPTIONAL) The maximum number of yielded items to keep; only the first max_items are kept, but
+        every item is counted. Use 0 to keep only the count. Default: None (keep every item)
+    """
+    def __init__(self, iterator, max_items=None):
+        self.iterator = iterator
+        self.max_items = max_items
+        self.items = []
+        self.count = 0
+        self.exhausted = False
+
+    def __iter__(self):
+        return self
+
+    def _record_item(self, item):
+        self.count += 1
+        if self.max_items is None or len(self.items) < self.max_items:
+            self.items.append(item)
+        return item
+
+    def __next__(self):
+        try:
+            item = next(self.iterator)
+        except StopIteration:
+            self.exhausted = True
+            raise
+        return self._record_item(item)
+
+    next = __next__
+
+    def send(self, value):
+        try:
+            item = self.iterator.send(value)
+        except StopIteration:
+            self.exhausted = True
+            raise
+        return self._record_item(item)
+
+    def __getattr__(self, name):
+        return getattr(self.iterator, name)
+
+    def __repr__(self):
+        return "SpiedIterator(count={0!r}, items={1!r}, exhausted={2!r})".format(
+            self.count, self.items, self.exhausted
+        )
+
+
+def _get_async_kind(func):
+    if not HAS_ASYNC_SUPPORT:
+        return None
+    if not inspect.isfunction(func) and not inspect.ismethod(func):
+        func = getattr(func, "__call__", None)
+    if inspect.iscoroutinefunction(func):
+        return "coroutine"
+    elif inspect.isasyncgenfunction(func):
+        return "async_generator"
+    # Follow __wrapped__ (i.e. of functools.wraps) down to an asynccontextmanager factory, recognised by its own
+    # code, or else to the function that was wrapped: a plain decorator of an async generator function is still an
+    # async generator function.
+    try:
+        wrapped = _unwrap(func, stop=is_async_context_manager_factory)
+    except ValueError:
+        return None
+    if is_async_context_manager_factory(wrapped):
+        return "async_context_manager"
+    elif wrapped is not func and inspect.isasyncgenfunction(wrapped):
+        return "async_generator"
+    return None
+
+
+BufferFingerprint = namedtuple("BufferFingerprint", ["nbytes", "digest"])
+_fingerprint_hash = getattr(hashlib, "blake2b", hashlib.sha256)
+
+
+def snapshot_buffer(value):
+    """
+    Capture a buffer protocol object (i.e. a bytearray, an array.array or a NumPy array) as it is right now, with a
+    single flat copy of its bytes. Read only buffers (i.e. bytes) cannot change, and are kept as they are, without
+    copying. Anything else is kept by reference.
+
+    :param value: The value to capture.
+    :return: The bytes of a writable buffer, or value itself.
+    """
+    try:
+        view = memoryview(value)
+    except TypeError:
+        return value
+    return value if view.readonly else view.tobytes()
+
+
+def fingerprint(value):
+    """
+    Capture a buffer protocol object as a BufferFingerprint (its size in bytes and a digest of its contents),
+    rather than keeping the buffer itself. Anything else is kept by reference. This may also be used to build the
+    expected value of a predicate, i.e. equal_to(fingerprint(b"expected payload")).
+
+    :param value: The value to capture.
+    :return: A BufferFingerprint for a buffer, or value itself.
+    """
+    try:
+        view = memoryview(value)
+    except TypeError:
+        return value
+    data = view if getattr(view, "c_contiguous", False) else view.tobytes()
+    return BufferFingerprint(getattr(view, "nbytes", None) or len(data), _fingerprint_hash(data).hexdigest())
+
+
+_CAPTURE_POLICIES = {
+    "reference": None,
+    "snapshot": copy.deepcopy,
+    "buffer": snapshot_buffer,
+    "fingerprint": fingerprint,
+}
+
+
+class BoundSpy(object):
+    """
+    A BoundSpy is the per instance form of a method Spy (see apply_method_spy), standing in for the bound method.
+    It is created once per instance and cached on it, so calls through the spied method do not allocate a bound
+    method, and it hands the positional arguments of each call to the Spy without self (see Spy.call_bound), so
+    they are recorded without being sliced. Any other attribute is looked up on the Spy itself.
+
+    :param spy: The per instance Spy.
+    :param instance: The instance the Spy is bound to.
+    """
+    __slots__ = ("__func__", "__self__")
+
+    def __init__(self, spy, instance):
+        self.__func__ = spy
+        self.__self__ = instance
+
+    def __call__(self, *args, **kwargs):
+        return self.__func__.call_bound(self.__self__, args, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.__func__, name)
+
+    def __repr__(self):
+        return "<bound spy {0} of {1!r}>".format(getattr(self.__func__, "__name__", "?"), self.__self__)
 
 
 class Spy(object):
@@ -50,35 +1042,111 @@ class Spy(object):
     wrapped function, method, or other callable in order to allow users to examine
     and verify how callables might be consumed by other code.
 
+    On Python 3.6 and later, a Spy also understands asyncio code (see the spy_async module):
+
+    * Calling a spied coroutine function returns an awaitable, and the invocation is recorded with the awaited
+      result once it completes. The await latency is appended to latencies_ns.
+    * Calling a spied async generator function records the invocation straight away, with a SpiedAsyncIterator
+      as the result, which collects the yielded items as they are consumed.
+    * Calling a spied async context manager factory (i.e. decorated with contextlib.asynccontextmanager) records
+      the invocation when the context is entered, with the entered value as the result.
+    * Instance methods that are coroutine functions, including __aenter__ and __aexit__, may be spied with
+      apply_method_spy as usual.
+
+    Similarly, a Spy created with stream_results set records any iterator (i.e. a generator) returned by the target
+    as a SpiedIterator, which records the yielded items lazily as the caller consumes them.
+
     :param target_func: A function of any arity that will be wrapped with by this Spy.
     :param is_method: True if this is wrapped an uninitialized method (i.e. in a class declaration), False otherwise.
     :param is_not_inspectable: True if this is a built-in (i.e. implemented in C) or is otherwise unable to be
         inspected by the "inspect" module, False otherwise.
     :param verbose: True if verbose reporting is desired, False otherwise.
+    :param bind_arguments: True if each invocation should also be bound to the parameter names of the target when
+        it is recorded (see bound_invocations), False otherwise. This moves the cost of aligning arguments from
+        every query onto the (single) recording of each call, at the price of keeping a second record per call.
+    :param columnar: True if invocations should be recorded into a ColumnarInvocationStore (which then serves as
+        successful_invocations) rather than a list of TargetInvocation records, False otherwise. Invocations in
+        a columnar store are always bound, so bind_arguments has no further effect.
+    :param max_invocations: (OPTIONAL) If set, only the most recent max_invocations invocations are retained,
+        in an InvocationRingBuffer. All queries (and so all times predicates) then apply to the retained window
+        only; total_invocations and evicted_invocations still count every invocation seen. Not supported
+        together with the other recording modes.
+    :param counts_only: True if the Spy should keep only the number of invocations and a frequency table of their
+        arguments (see InvocationCounter), rather than the invocations themselves, False otherwise.
+    :param sample_every: (OPTIONAL) If set, only one in every sample_every invocations is recorded (see
+        SampledInvocationStore).
+    :param reservoir_size: (OPTIONAL) If set, only a uniform random sample of at most reservoir_size invocations is
+        recorded (see ReservoirInvocationStore).
+    :param thread_safe: True if the Spy will be invoked concurrently from several threads, in which case each thread
+        records into its own buffer (see ThreadLocalInvocationStore), False otherwise.
+    :param stream_results: True if iterators returned by the target should be wrapped in (and recorded as) a
+        SpiedIterator, False otherwise.
+    :param stream_max_items: (OPTIONAL) The maximum number of yielded items each SpiedIterator (or
+        SpiedAsyncIterator) keeps; every item is still counted. Use 0 to keep only the counts.
+    :param record_latency: True if the duration of every invocation should be measured (with perf_counter_ns) and
+        appended to latencies_ns, False otherwise. Invocations of coroutine functions always record their await
+        latency. Latencies are kept for every invocation seen, whatever the recording mode.
+    :param index_arguments: True if the Spy should keep an ArgumentIndex over the hashable arguments of its
+        invocations, so that equal_to/any_of queries become lookups, False otherwise. Not supported together
+        with the other recording modes.
+    :param profiler: (OPTIONAL) A SpyProfiler (see the spy_profile module) which times every call through this
+        Spy, and attributes it to the spied caller it was made from.
+    :param capture: How the arguments of each invocation are recorded. They are captured when the Spy is called,
+        before the target runs, so an argument the target (or the caller, later) mutates is recorded as it was
+        passed. One of:
+
+        * "reference" -- Keep references to the arguments themselves, without copying anything. Default.
+        * "snapshot" -- Keep a deep copy of every argument.
+        * "buffer" -- Keep the bytes of writable buffer protocol arguments (see snapshot_buffer), with a single
+          flat copy, and everything else by reference.
+        * "fingerprint" -- Keep only the size and digest of buffer protocol arguments (see fingerprint), and
+          everything else by reference.
+        * Any callable of arity 1, which is given each argument and returns the value to record.
+    :param invocation_log: (OPTIONAL) If set, invocations are streamed into an append-only log file at this path
+        (see the spy_log module), replacing any existing file, rather than kept in memory. Queries stream the
+        invocations back from the file, and the log may be reopened later with open_invocation_log(). The per
+        instance Spies of a method log to the path suffixed with ".<n>". An InvocationLogStore may also be given.
+        Call close() to close the log file. Not supported together with the other recording modes.
+    :param process_safe: True if the Spy will be invoked in worker processes forked from the one that created it
+        (i.e. by multiprocessing or a ProcessPoolExecutor), in which case the workers send their invocations back
+        to the creating process in batches (see the spy_process module), False otherwise. Not supported together
+        with the other recording modes.
+    :param process_batch_size: The number of invocations a worker process buffers before sending them, if
+        process_safe is set. Default: 64
+    :param sequence_clock: (OPTIONAL) A SequenceClock (see the spy_sequence module), shared with other Spies, which
+        stamps every recorded invocation with a sequence number (see sequence_numbers), so that the invocations of
+        those Spies may be ordered against each other (see match() and spy_sequence.assert_in_order()). Only
+        supported by the recording modes which keep every invocation, in order.
     :returns: A new callable, which wraps target_func and may be used as a stand in.
     """
-    def __init__(self, target_func, is_method=False, is_not_inspectable=False, verbose=True):
+    def __init__(self, target_func, is_method=False, is_not_inspectable=False, verbose=True, bind_arguments=False,
+                 columnar=False, max_invocations=None, counts_only=False, sample_every=None, reservoir_size=None,
+                 thread_safe=False, stream_results=False, stream_max_items=None, record_latency=False,
+                 index_arguments=False, profiler=None, capture="reference", invocation_log=None, process_safe=False,
+                 process_batch_size=64, sequence_clock=None):
         self.target_func = target_func
         self.is_weird_py2_call_method = False
 
         if is_not_inspectable:
-            self.target_func_argspec = inspect.ArgSpec((), 'args', 'kwargs', ())
+            self.target_func_argspec = _UNINSPECTABLE_ARGSPEC
             self.get_type = BuiltinFunctionType
         elif is_method:
-            args, varargs, kwargs, defaults = inspect.getargspec(target_func)
-            self.target_func_argspec = inspect.ArgSpec(args[1:], varargs, kwargs, defaults)
+            self.target_func_argspec = get_argspec(target_func, skip_first=True)
             self.get_type = MethodType
         elif isinstance(target_func, FunctionType):
-            self.target_func_argspec = inspect.getargspec(target_func)
+            self.target_func_argspec = get_argspec(target_func)
             self.get_type = FunctionType
         elif isinstance(target_func, object) and callable(target_func):
             if IS_PY2:
                 # I guess we just have to punt as Python 2 chokes on __call__ for getargspec.
-                self.target_func_argspec = inspect.ArgSpec((), 'args', 'kwargs', ())
+                self.target_func_argspec = _UNINSPECTABLE_ARGSPEC
                 self.is_weird_py2_call_method = True
             else:
-                args, varargs, kwargs, defaults = inspect.getargspec(target_func.__call__)
-                self.target_func_argspec = inspect.ArgSpec(args[1:], varargs, kwargs, defaults)
+                call_method = target_func.__call__
+                if hasattr(call_method, "__func__"):
+                    self.target_func_argspec = get_argspec(call_method.__func__, skip_first=True)
+                else:
+                    self.target_func_argspec = get_argspec(call_method)
                 self.is_method = True
             self.get_type = MethodType
         else:
@@ -86,46 +1154,487 @@ class Spy(object):
         if not self.is_weird_py2_call_method:
             update_wrapper(self, target_func)
         self.is_method = is_method
-        self.successful_invocations = []
+        self.spy_options = dict(
+            verbose=verbose, bind_arguments=bind_arguments, columnar=columnar, max_invocations=max_invocations,
+            counts_only=counts_only, sample_every=sample_every, reservoir_size=reservoir_size, thread_safe=thread_safe,
+            stream_results=stream_results, stream_max_items=stream_max_items, record_latency=record_latency,
+            index_arguments=index_arguments, profiler=profiler, capture=capture, invocation_log=invocation_log,
+            process_safe=process_safe, process_batch_size=process_batch_size, sequence_clock=sequence_clock
+        )
+        if callable(capture):
+            self._capture = capture
+        elif capture in _CAPTURE_POLICIES:
+            self._capture = _CAPTURE_POLICIES[capture]
+        else:
+            raise ValueError("Unknown Spy capture policy {0!r}.".format(capture))
+        recording_modes = [name for name in ("columnar", "max_invocations", "counts_only", "sample_every",
+                                             "reservoir_size", "thread_safe", "invocation_log", "process_safe")
+                           if self.spy_options[name] not in (None, False)]
+        if len(recording_modes) > 1:
+            raise ValueError("The Spy options {0} may not be combined.".format(", ".join(recording_modes)))
+        if bind_arguments and recording_modes and recording_modes[0] not in ("columnar", "max_invocations"):
+            raise ValueError("The Spy option bind_arguments may not be combined with {0}.".format(recording_modes[0]))
+        if index_arguments and recording_modes:
+            raise ValueError("The Spy option index_arguments may not be combined with {0}.".format(recording_modes[0]))
+        if sequence_clock is not None and recording_modes and recording_modes[0] not in ("columnar", "invocation_log"):
+            raise ValueError("The Spy option sequence_clock may not be combined with {0}.".format(recording_modes[0]))
+        for name in ("max_invocations", "sample_every", "reservoir_size", "process_batch_size"):
+            if self.spy_options[name] is not None and self.spy_options[name] < 1:
+                raise ValueError("{0} must be at least 1, not {1}.".format(name, self.spy_options[name]))
+        self.max_invocations = max_invocations
         self.successful_results = []
         self.verbose = verbose
+        self.bind_arguments = bind_arguments
+        self.columnar = columnar
+        self.invocation_store = self._new_invocation_store()
+        if self.invocation_store is not None:
+            self.successful_invocations = self.invocation_store
+        else:
+            self.successful_invocations = self._new_invocation_list()
+        self._binder = ArgumentBinder(self.target_func_argspec) if bind_arguments and not columnar else None
+        self.bound_invocations = self._new_invocation_list() if self._binder is not None else None
+        self.argument_index = ArgumentIndex(self.target_func_argspec) if index_arguments else None
+        self.async_kind = _get_async_kind(target_func)
+        self.stream_results = stream_results
+        self.stream_max_items = stream_max_items
+        self._wraps_results = stream_results or self.async_kind is not None
+        self.record_latency = record_latency
+        self.latencies_ns = array(_INT64_TYPECODE)
+        self.sequence_clock = sequence_clock
+        self.sequence_numbers = array(_INT64_TYPECODE)
+        self.profiler = profiler
         # If this is a decorated instance method, we've probably got to reinitialize the Spy
         # the first time it gets accessed (such that each instance has it's own Spy per method
         # per instance). To do this, we have to bootstrap new a new spy on first access (when
         # needs_reinit is likely set).
         self.needs_reinit = False
+        self._instance_spies = {}
+        self._num_instance_logs = 0
+        # Bumped by every reset(), so that an IncrementalQuery can tell that what it has examined is gone.
+        self._generation = 0
 
     def __call__(self, *args, **kwargs):
-        result = self.target_func(*args, **kwargs)
-        if self.is_method:
-            self.successful_invocations.append(TargetInvocation(args[1:], kwargs, result))
+        if self._capture is not None:
+            captured_args, captured_kwargs = self._capture_arguments(args[1:] if self.is_method else args, kwargs)
+        if self.profiler is not None:
+            result, latency_ns = self._call_profiled(args, kwargs)
+        elif self.record_latency:
+            start = perf_counter_ns()
+            result = self.target_func(*args, **kwargs)
+            latency_ns = perf_counter_ns() - start
+        else:
+            result = self.target_func(*args, **kwargs)
+            latency_ns = None
+        if self._capture is not None:
+            args, kwargs = captured_args, captured_kwargs
+        elif self.is_method:
+            args = args[1:]
+        if self._wraps_results:
+            return self._wrap_result(args, kwargs, result, latency_ns)
+        self.record_invocation(args, kwargs, result, latency_ns)
+        return result
+
+    def call_bound(self, instance, args, kwargs):
+        """
+        Invoke the target as a method of an instance, and record the invocation. This is the call path of
+        BoundSpy, which passes the positional arguments without self, so they can be recorded as they are.
+
+        :param instance: The instance the target is invoked on (i.e. self).
+        :param args: The positional arguments of the invocation, excluding self.
+        :param kwargs: The keyword arguments of the invocation.
+        :return: The result of the target (possibly wrapped, see stream_results).
+        """
+        if self._capture is not None:
+            captured_args, captured_kwargs = self._capture_arguments(args, kwargs)
+        if self.profiler is not None:
+            result, latency_ns = self._call_profiled((instance,) + args, kwargs)
+        elif self.record_latency:
+            start = perf_counter_ns()
+            result = self.target_func(instance, *args, **kwargs)
+            latency_ns = perf_counter_ns() - start
+        else:
+            result = self.target_func(instance, *args, **kwargs)
+            latency_ns = None
+        if self._capture is not None:
+            args, kwargs = captured_args, captured_kwargs
+        if self._wraps_results:
+            return self._wrap_result(args, kwargs, result, latency_ns)
+        self.record_invocation(args, kwargs, result, latency_ns)
+        return result
+
+    def _capture_arguments(self, args, kwargs):
+        capture = self._capture
+        return tuple(capture(value) for value in args), dict((name, capture(value)) for name, value in kwargs.items())
+
+    def _call_profiled(self, args, kwargs):
+        self.profiler.enter(self)
+        try:
+            result = self.target_func(*args, **kwargs)
+        finally:
+            elapsed_ns = self.profiler.exit()
+        return result, elapsed_ns if self.record_latency else None
+
+    def _wrap_result(self, args, kwargs, result, latency_ns=None):
+        if self.async_kind == "coroutine":
+            return record_awaited(self, args, kwargs, result)
+        elif self.async_kind == "async_context_manager":
+            return SpiedAsyncContextManager(self, args, kwargs, result)
+        elif self.async_kind == "async_generator":
+            result = SpiedAsyncIterator(result, self.stream_max_items)
+        elif isinstance(result, Iterator):
+            result = SpiedIterator(result, self.stream_max_items)
+        self.record_invocation(args, kwargs, result, latency_ns)
+        return result
+
+    def record_invocation(self, args, kwargs, result, latency_ns=None):
+        """
+        Record a successful invocation of the target with this Spy. This is done automatically when the Spy is
+        called, but may also be used to record invocations that were observed elsewhere.
+
+        :param args: The positional arguments of the invocation (excluding self, for methods).
+        :param kwargs: The keyword arguments of the invocation.
+        :param result: The result of the invocation.
+        :param latency_ns: (OPTIONAL) The latency of the invocation in nanoseconds, appended to latencies_ns.
+        :return: None
+        """
+        if self.sequence_clock is None:
+            self._record_arguments(args, kwargs, result)
+        else:
+            # Recording and ticking under the lock of the clock keeps sequence_numbers sorted, and aligned with the
+            # recorded invocations, whichever threads the Spies sharing that clock are called from.
+            with self.sequence_clock.lock:
+                self._record_arguments(args, kwargs, result)
+                self.sequence_numbers.append(self.sequence_clock.tick())
+        if latency_ns is not None:
+            self.latencies_ns.append(latency_ns)
+
+    def _record_arguments(self, args, kwargs, result):
+        if self.invocation_store is not None:
+            self.invocation_store.record(args, kwargs, result)
         else:
             self.successful_invocations.append(TargetInvocation(args, kwargs, result))
-        return result
+            bound_invocation = None
+            if self._binder is not None:
+                bound_invocation = self._binder.bind(args, kwargs, result)
+                self.bound_invocations.append(bound_invocation)
+            if self.argument_index is not None:
+                self.argument_index.add(args, kwargs, bound_invocation)
 
     def __get__(self, instance, owner):
-        if instance and self.needs_reinit:
-            if IS_PY2:
-                reinitialized = self.get_type(Spy(self.target_func, is_method=True), instance, owner)
-            else:
-                reinitialized = self.get_type(Spy(self.target_func, is_method=True), instance)
-            setattr(instance, self.target_func.__name__, reinitialized)
-            return reinitialized
+        if instance is not None and self.needs_reinit:
+            # The BoundSpy is cached on the instance, so that later lookups find it without calling __get__ at
+            # all. Special methods (i.e. __aenter__) are looked up on the type instead, so hand back that same
+            # BoundSpy rather than bootstrapping another one.
+            name = self.target_func.__name__
+            bound = getattr(instance, "__dict__", {}).get(name)
+            if bound is not None:
+                return bound
+            bound = BoundSpy(self._instance_spy(instance), instance)
+            try:
+                setattr(instance, name, bound)
+            except AttributeError:
+                # i.e. an instance with __slots__, which gets a new BoundSpy (over the same Spy) every lookup.
+                pass
+            return bound
         else:
             if IS_PY2:
                 return self.get_type(self, instance, owner)
             else:
                 return self.get_type(self, instance)
 
+    def __reduce__(self):
+        # A Spy which replaced a module level callable is pickled by reference, as that callable would be, so that
+        # it may be handed to worker processes (i.e. by ProcessPoolExecutor.map) which find it under the same name.
+        name = getattr(self, "__qualname__", None) or getattr(self, "__name__", None)
+        try:
+            owner = sys.modules[self.__module__]
+            for part in name.split("."):
+                owner = getattr(owner, part)
+        except Exception:
+            owner = None
+        if owner is self:
+            return name
+        return object.__reduce__(self)
+
+    def _reinitialize(self):
+        options = self.spy_options
+        if options["invocation_log"] is not None:
+            self._num_instance_logs += 1
+            options = dict(options, invocation_log="{0}.{1}".format(
+                getattr(options["invocation_log"], "path", options["invocation_log"]), self._num_instance_logs
+            ))
+        return Spy(self.target_func, is_method=True, **options)
+
+    def _instance_spy(self, instance):
+        # Per instance Spies are kept by instance identity, behind a weak reference, so that spied instances may
+        # still be collected (and equal instances still get their own Spy). Instances which cannot be weakly
+        # referenced get a new Spy, which is then only cached on the instance itself; those which cannot hold it
+        # either (i.e. __slots__ without __weakref__) would get a new, empty Spy on every lookup, so are refused.
+        instance_spies = self._instance_spies
+        key = id(instance)
+        entry = instance_spies.get(key)
+        if entry is not None and entry[0]() is instance:
+            return entry[1]
+
+        def forget(ref):
+            if instance_spies.get(key, (None,))[0] is ref:
+                del instance_spies[key]
+
+        try:
+            ref = weakref.ref(instance, forget)
+        except TypeError:
+            if not hasattr(instance, "__dict__"):
+                raise TypeError(
+                    "Cannot spy on {0} for {1} instances, which can neither be weakly referenced nor hold "
+                    "attributes. Add \"__weakref__\" to the __slots__ of {1}.".format(
+                        self.target_func.__name__, type(instance).__name__
+                    )
+                )
+            return self._reinitialize()
+        spy = self._reinitialize()
+        instance_spies[key] = (ref, spy)
+        return spy
+
+    def _use_argspec(self, argspec):
+        # For Spies over a stand in target (i.e. an invocation log or a replay stub), whose parameters are known
+        # from elsewhere: rebuild everything that was aligned to the uninspectable argspec.
+        self.target_func_argspec = argspec
+        if self.columnar:
+            self.invocation_store = self.successful_invocations = ColumnarInvocationStore(argspec)
+        if self._binder is not None:
+            self._binder = ArgumentBinder(argspec)
+        if self.argument_index is not None:
+            self.argument_index = ArgumentIndex(argspec)
+
+    def _new_invocation_list(self):
+        return [] if self.max_invocations is None else InvocationRingBuffer(self.max_invocations)
+
+    def _new_invocation_store(self):
+        options = self.spy_options
+        if options["columnar"]:
+            return ColumnarInvocationStore(self.target_func_argspec)
+        elif options["counts_only"]:
+            return InvocationCounter()
+        elif options["sample_every"] is not None:
+            return SampledInvocationStore(options["sample_every"])
+        elif options["reservoir_size"] is not None:
+            return ReservoirInvocationStore(options["reservoir_size"])
+        elif options["thread_safe"]:
+            return ThreadLocalInvocationStore()
+        elif options["invocation_log"] is not None:
+            from test_toolbox.spy_log import InvocationLogStore
+            if isinstance(options["invocation_log"], InvocationLogStore):
+                return options["invocation_log"]
+            return InvocationLogStore(options["invocation_log"], self.target_func_argspec)
+        elif options["process_safe"]:
+            from test_toolbox.spy_process import ProcessInvocationStore
+            return ProcessInvocationStore(options["process_batch_size"])
+        return None
+
     @property
     def num_invocations(self):
         """
-        Access the number of successful invocations recorded.
+        Access the number of successful invocations recorded (and retained, if max_invocations is set).
 
         :return: The integer number of invocations the Spy knows about.
         """
         return len(self.successful_invocations)
 
+    @property
+    def evicted_invocations(self):
+        """
+        Access the number of successful invocations that were seen but are not retained, because max_invocations
+        was exceeded or because they were not sampled.
+
+        :return: The integer number of invocations not retained, always 0 if every invocation is recorded.
+        """
+        return self.total_invocations - self.num_invocations
+
+    @property
+    def total_invocations(self):
+        """
+        Access the total number of successful invocations seen since the Spy was created or last reset,
+        including any that have since been evicted or were never sampled.
+
+        :return: The integer number of invocations seen.
+        """
+        return getattr(self.successful_invocations, "seen", self.num_invocations)
+
+    def latency_percentile(self, percentile):
+        """
+        Compute a percentile of the recorded invocation latencies (see record_latency), using the nearest-rank
+        method.
+
+        :param percentile: The percentile to compute, between 0 and 100.
+        :return: The latency in nanoseconds, or None if no latencies were recorded.
+        """
+        return _nearest_rank(sorted(self.latencies_ns), percentile)
+
+    def latency_histogram(self, bucket_bounds_ns=None):
+        """
+        Build a histogram of the recorded invocation latencies (see record_latency).
+
+        :param bucket_bounds_ns: (OPTIONAL) The ascending, inclusive upper bounds of the histogram buckets, in
+            nanoseconds. Latencies above the last bound are counted in a final bucket with a bound of None.
+            Default: powers of two from 1024 ns up to the largest recorded latency.
+        :return: A list of (upper bound in nanoseconds, count) pairs.
+        """
+        latencies = self.latencies_ns
+        if bucket_bounds_ns is None:
+            bucket_bounds_ns = [1024]
+            largest = max(latencies) if latencies else 0
+            while bucket_bounds_ns[-1] < largest:
+                bucket_bounds_ns.append(bucket_bounds_ns[-1] * 2)
+        counts = [0] * (len(bucket_bounds_ns) + 1)
+        for latency in latencies:
+            counts[bisect_left(bucket_bounds_ns, latency)] += 1
+        histogram = list(zip(bucket_bounds_ns, counts))
+        if counts[-1]:
+            histogram.append((None, counts[-1]))
+        return histogram
+
+    def check_quantified_latency_match(self, times_predicate, latency_predicate):
+        """
+        Check the recorded invocation latencies (see record_latency) against a latency predicate.
+
+        :param times_predicate: An arity 2 predicate that takes the matching latency list, and the total latency
+            list, returns true or false based on these matching number of times executed expectation embedded in
+            this predicate.
+        :param latency_predicate: An arity 1 predicate to match against each recorded latency, in nanoseconds.
+        :return: True if the latencies satisfy both predicates, False otherwise.
+        """
+        latencies = self.latencies_ns
+        if isinstance(times_predicate, QuantifierPredicate):
+            return times_predicate.evaluate(latency_predicate(latency) for latency in latencies)
+        return times_predicate([latency for latency in latencies if latency_predicate(latency)], latencies)
+
+    def assert_quantified_latency_match(self, times_predicate, latency_predicate):
+        """
+        Assert the recorded invocation latencies (see record_latency) against a latency predicate.
+
+        :param times_predicate: An arity 2 predicate that takes the matching latency list, and the total latency
+            list, returns true or false based on these matching number of times executed expectation embedded in
+            this predicate.
+        :param latency_predicate: An arity 1 predicate to match against each recorded latency, in nanoseconds.
+        :return: None
+        :raises: AssertionError on failure to match.
+        """
+        if not self.check_quantified_latency_match(times_predicate, latency_predicate):
+            raise AssertionError(
+                "Failed to find matching latencies!\n"
+                "Recorded latency percentiles (ns): {0}".format(self._latency_summary())
+            )
+
+    def assert_latency_below(self, max=None, **percentiles):
+        """
+        Assert that the recorded invocation latencies (see record_latency) are below the given bounds.
+
+        Example: spy.assert_latency_below(p50=100000, p99=2000000, max=10000000)
+
+        :param max: (OPTIONAL) The bound in nanoseconds that every latency must be below.
+        :param percentiles: Bounds in nanoseconds for percentiles of the latencies, keyed "p" followed by the
+            percentile digits (i.e. p50, p99, or p999 for the 99.9th percentile).
+        :return: None
+        :raises: AssertionError if any bound is exceeded, or if no latencies were recorded.
+        """
+        if not self.latencies_ns:
+            raise AssertionError("No latencies were recorded!")
+        bounds = [(_parse_percentile_name(name), bound) for name, bound in percentiles.items()]
+        if max is not None:
+            bounds.append((100, max))
+        sorted_latencies = sorted(self.latencies_ns)
+        exceeded = []
+        for percentile, bound in sorted(bounds):
+            latency = _nearest_rank(sorted_latencies, percentile)
+            if latency >= bound:
+                exceeded.append("p{0} = {1} ns (bound {2} ns)".format(percentile, latency, bound))
+        if exceeded:
+            raise AssertionError(
+                "Latency bounds exceeded: {0}\nRecorded latency percentiles (ns): {1}".format(
+                    ", ".join(exceeded), self._latency_summary()
+                )
+            )
+
+    def _latency_summary(self):
+        sorted_latencies = sorted(self.latencies_ns)
+        return ", ".join("p{0} = {1}".format(percentile, _nearest_rank(sorted_latencies, percentile))
+                         for percentile in (50, 90, 99, 100))
+
+    @property
+    def _query_invocations(self):
+        if self.bound_invocations is not None:
+            return self.bound_invocations
+        elif hasattr(self.invocation_store, "snapshot"):
+            return self.invocation_store.snapshot()
+        return self.successful_invocations
+
+    def _invocation_matcher(self, plan=None, result_predicate=None):
+        if plan is None:
+            def match_arguments(_):
+                return True
+        elif self.bound_invocations is not None:
+            match_arguments = plan.matches_bound
+        else:
+            def match_arguments(invocation):
+                return plan.matches(invocation.args, invocation.kwargs)
+        if result_predicate is None:
+            return match_arguments
+
+        def match(invocation):
+            return match_arguments(invocation) and result_predicate(invocation.result)
+        return match
+
+    def _find_matching_invocations(self, invocations, plan=None, result_predicate=None):
+        if hasattr(self.invocation_store, "find_matching"):
+            return self.invocation_store.find_matching(plan, result_predicate)
+        match = self._invocation_matcher(plan, result_predicate)
+        return [invocation for invocation in invocations if match(invocation)]
+
+    def _failure_report(self, header, plan=None, result_predicate=None, show_results=False):
+        invocations = self.successful_invocations
+        num_invocations = len(invocations)
+        max_listed = _REPORT_MAX_INVOCATIONS[0]
+
+        def closeness(invocation):
+            score = 0 if plan is None else plan.score(invocation.args, invocation.kwargs)
+            return score + (0 if result_predicate is None else _satisfies(result_predicate, invocation.result))
+
+        listed = heapq.nlargest(max_listed, invocations, key=closeness)
+        report = [header, "All invocation results" if show_results else "All invocations"]
+        if num_invocations > len(listed):
+            report[-1] += " ({0} of {1} listed, nearest matches first)".format(len(listed), num_invocations)
+        report[-1] += ":\n[{0}]".format(",\n".join(
+            _max_length_repr(invocation.result if show_results else invocation) for invocation in listed
+        ))
+        if num_invocations > len(listed):
+            report.append("... {0} more omitted".format(num_invocations - len(listed)))
+        return "\n".join(report)
+
+    def _check_quantified(self, times_predicate, plan=None, result_predicate=None):
+        if result_predicate is not None:
+            result_predicate = simplify_predicate(result_predicate)
+        invocations = self._query_invocations
+        if self.argument_index is not None and plan is not None:
+            candidates = self.argument_index.candidates(plan)
+            if candidates is not None:
+                match = self._invocation_matcher(plan, result_predicate)
+                return times_predicate(
+                    [invocations[i] for i in candidates if match(invocations[i])], invocations
+                )
+        if isinstance(times_predicate, QuantifierPredicate):
+            if hasattr(self.invocation_store, "count_matching"):
+                # Only the counts are kept, so decide from those rather than expanding a record per invocation.
+                return times_predicate.evaluate_counts(
+                    self.invocation_store.count_matching(plan, result_predicate), len(invocations)
+                )
+            elif hasattr(self.invocation_store, "matching_indices"):
+                # Quantifiers only count the matches, so there is no need to build the matching invocations.
+                return times_predicate(self.invocation_store.matching_indices(plan, result_predicate), invocations)
+            elif not hasattr(self.invocation_store, "find_matching"):
+                match = self._invocation_matcher(plan, result_predicate)
+                return times_predicate.evaluate(match(invocation) for invocation in invocations)
+        return times_predicate(self._find_matching_invocations(invocations, plan, result_predicate), invocations)
+
     def check_quantified_exact_match(self, times_predicate, *args, **kwargs):
         """
         Check to see if an exact match exists for the given times invoked predicate and argument matcher predicate.
@@ -140,13 +1649,7 @@ class Spy(object):
             against. These should all be arity 1 and return True/False.
         :return: True if a match/matches was found that satisfies all of the predicates, False otherwise.
         """
-        def check_invocation(invocation_data):
-            call_args, call_kwargs, _ = invocation_data
-            return _calculate_match(self.target_func_argspec, args, kwargs, call_args, call_kwargs, exact=True)
-        return times_predicate(
-            [invoc_matched for invoc_matched in map(check_invocation, self.successful_invocations) if invoc_matched],
-            self.successful_invocations
-        )
+        return self._check_quantified(times_predicate, MatchPlan(self.target_func_argspec, args, kwargs, exact=True))
 
     def check_quantified_partial_match(self, times_predicate, *args, **kwargs):
         """
@@ -162,13 +1665,7 @@ class Spy(object):
             against. These should all be arity 1 and return True/False.
         :return: True if a match/matches was found that satisfies all of the predicates, False otherwise.
         """
-        def check_invocation(invocation_data):
-            call_args, call_kwargs, _ = invocation_data
-            return _calculate_match(self.target_func_argspec, args, kwargs, call_args, call_kwargs, exact=False)
-        return times_predicate(
-            [invoc_matched for invoc_matched in map(check_invocation, self.successful_invocations) if invoc_matched],
-            self.successful_invocations
-        )
+        return self._check_quantified(times_predicate, MatchPlan(self.target_func_argspec, args, kwargs, exact=False))
 
     def check_quantified_result_match(self, times_predicate, result_predicate):
         """
@@ -180,8 +1677,7 @@ class Spy(object):
         :param result_predicate: An arity 1 predicate to match against the recorded result of a function call.
         :return: True if a result/results were found that satisfy both predicates.
         """
-        successful_results = map(lambda o: o[2], self.successful_invocations)
-        return times_predicate(map(result_predicate, successful_results))
+        return self._check_quantified(times_predicate, result_predicate=result_predicate)
 
     def check_quantified_partial_plus_result_match(self, times_predicate, result_predicate, *args, **kwargs):
         """
@@ -198,17 +1694,8 @@ class Spy(object):
             against. These should all be arity 1 and return True/False.
         :return: True all of the predicates satisfied, False otherwise.
         """
-        def check_invocation(invocation_data):
-            call_args, call_kwargs, result = invocation_data
-            params_match = _calculate_match(
-                self.target_func_argspec, args, kwargs, call_args, call_kwargs, exact=False
-            )
-            result_matches = result_predicate(result)
-            return params_match and result_matches
-        return times_predicate(
-            [invoc_matched for invoc_matched in map(check_invocation, self.successful_invocations) if invoc_matched],
-            self.successful_invocations
-        )
+        plan = MatchPlan(self.target_func_argspec, args, kwargs, exact=False)
+        return self._check_quantified(times_predicate, plan, result_predicate)
 
     def check_quantified_exact_plus_result_match(self, times_predicate, result_predicate, *args, **kwargs):
         """
@@ -225,19 +1712,8 @@ class Spy(object):
             against. These should all be arity 1 and return True/False.
         :return: True all of the predicates satisfied, False otherwise.
         """
-
-        def check_invocation(invocation_data):
-            call_args, call_kwargs, result = invocation_data
-            params_match = _calculate_match(
-                self.target_func_argspec, args, kwargs, call_args, call_kwargs, exact=True
-            )
-            result_matches = result_predicate(result)
-            return params_match and result_matches
-
-        return times_predicate(
-            [invoc_matched for invoc_matched in map(check_invocation, self.successful_invocations) if invoc_matched],
-            self.successful_invocations
-        )
+        plan = MatchPlan(self.target_func_argspec, args, kwargs, exact=True)
+        return self._check_quantified(times_predicate, plan, result_predicate)
 
     def assert_quantified_exact_match(self, times_predicate, *args, **kwargs):
         """
@@ -254,14 +1730,12 @@ class Spy(object):
         :return: None.
         :raises: AssertionError on failure to match.
         """
-        result = self.check_quantified_exact_match(times_predicate, *args, **kwargs)
+        plan = MatchPlan(self.target_func_argspec, args, kwargs, exact=True)
+        result = self._check_quantified(times_predicate, plan)
         if not result and not self.verbose:
             raise AssertionError("Failed to find a matching exact invocation!")
         elif not result:
-            raise AssertionError(
-                "Failed to find a matching partial invocation!\n"
-                "All invocations:\n[{}]".format(",\n".join(map(_max_length_repr, self.successful_invocations)))
-            )
+            raise AssertionError(self._failure_report("Failed to find a matching exact invocation!", plan))
 
     def assert_quantified_partial_match(self, times_predicate, *args, **kwargs):
         """
@@ -278,14 +1752,12 @@ class Spy(object):
         :return: None.
         :raises: AssertionError on failure to match.
         """
-        result = self.check_quantified_partial_match(times_predicate, *args, **kwargs)
+        plan = MatchPlan(self.target_func_argspec, args, kwargs, exact=False)
+        result = self._check_quantified(times_predicate, plan)
         if not result and not self.verbose:
             raise AssertionError("Failed to find a matching partial invocation!")
         elif not result:
-            raise AssertionError(
-                "Failed to find a matching partial invocation!\n"
-                "All invocations:\n[{}]".format(",\n".join(map(_max_length_repr, self.successful_invocations)))
-            )
+            raise AssertionError(self._failure_report("Failed to find a matching partial invocation!", plan))
 
     def assert_quantified_result_match(self, times_predicate, result_predicate):
         """
@@ -302,10 +1774,9 @@ class Spy(object):
         if not result and not self.verbose:
             raise AssertionError("Failed to find a matching result!")
         elif not result:
-            raise AssertionError(
-                "Failed to find a matching result!\n"
-                "All invocation results:\n[{}]".format(",\n".join(map(_max_length_repr, self.successful_results)))
-            )
+            raise AssertionError(self._failure_report(
+                "Failed to find a matching result!", result_predicate=result_predicate, show_results=True
+            ))
 
     def assert_quantified_partial_plus_result_match(self, times_predicate, result_predicate, *args, **kwargs):
         """
@@ -323,14 +1794,12 @@ class Spy(object):
         :return: None
         :raises: AssertionError on failure to match.
         """
-        result = self.check_quantified_partial_plus_result_match(times_predicate, result_predicate, *args, **kwargs)
+        plan = MatchPlan(self.target_func_argspec, args, kwargs, exact=False)
+        result = self._check_quantified(times_predicate, plan, result_predicate)
         if not result and not self.verbose:
             raise AssertionError("Failed to find a matching result!")
         elif not result:
-            raise AssertionError(
-                "Failed to find a matching result!\n"
-                "All invocation results:\n[{}]".format(",\n".join(map(_max_length_repr, self.successful_results)))
-            )
+            raise AssertionError(self._failure_report("Failed to find a matching result!", plan, result_predicate))
 
     def assert_quantified_exact_plus_result_match(self, times_predicate, result_predicate, *args, **kwargs):
         """
@@ -349,14 +1818,12 @@ class Spy(object):
         :raises: AssertionError on failure to match.
         """
 
-        result = self.check_quantified_exact_plus_result_match(times_predicate, result_predicate, *args, **kwargs)
+        plan = MatchPlan(self.target_func_argspec, args, kwargs, exact=True)
+        result = self._check_quantified(times_predicate, plan, result_predicate)
         if not result and not self.verbose:
             raise AssertionError("Failed to find a matching result!")
         elif not result:
-            raise AssertionError(
-                "Failed to find a matching result!\n"
-                "All invocation results:\n[{}]".format(",\n".join(map(_max_length_repr, self.successful_results)))
-            )
+            raise AssertionError(self._failure_report("Failed to find a matching result!", plan, result_predicate))
 
     def assert_any_exact_match(self, *args, **kwargs):
         """
@@ -402,128 +1869,863 @@ class Spy(object):
         """
         self.assert_quantified_partial_match(at_least_once, *args, **kwargs)
 
-    def assert_one_partial_match(self, *args, **kwargs):
+    def assert_one_partial_match(self, *args, **kwargs):
+        """
+        Wraps assert_quantified_partial_match, seeing if the specified arguments show up exactly once.
+
+        :param args: The arguments to attempt to match on.
+        :param kwargs: The keyword arguments to match on.
+        :return: None
+        :raises: AssertionError on failure to match.
+        """
+        self.assert_quantified_partial_match(once, *args, **kwargs)
+
+    def assert_all_partial_match(self, *args, **kwargs):
+        """
+        Wraps assert_quantified_partial_match, seeing if the specified arguments always show up.
+
+        :param args: The arguments to attempt to match on.
+        :param kwargs: The keyword arguments to match on.
+        :return: None
+        :raises: AssertionError on failure to match.
+        """
+        self.assert_quantified_partial_match(always, *args, **kwargs)
+
+    def assert_any_result_match(self, result_predicate):
+        """
+        Wraps assert_quantified_partial_match, seeing if the result predicate returns true at least once.
+
+        :param result_predicate: The function to match against stored results.
+        :return: None
+        :raises: AssertionError on failure to match.
+        """
+        self.assert_quantified_result_match(at_least_once, result_predicate)
+
+    def assert_one_result_match(self, result_predicate):
+        """
+        Wraps assert_quantified_partial_match, seeing if the result predicate is true exactly once.
+
+        :param result_predicate: The function to match against stored results.
+        :return: None
+        :raises: AssertionError on failure to match.
+        """
+        self.assert_quantified_result_match(once, result_predicate)
+
+    def assert_all_result_match(self, result_predicate):
+        """
+        Wraps assert_quantified_partial_match, seeing if the result predicate is always true.
+
+        :param result_predicate: The function to match against stored results.
+        :return: None
+        :raises: AssertionError on failure to match.
+        """
+        self.assert_quantified_result_match(always, result_predicate)
+
+    def _invocations_since(self, cursor):
+        # The invocations recorded after the cursor position of an IncrementalQuery, along with the new cursor.
+        if hasattr(self.invocation_store, "invocations_since"):
+            return self.invocation_store.invocations_since(cursor)
+        invocations = self._query_invocations
+        start, end = cursor or 0, len(invocations)
+        return (invocations[i] for i in range(start, end)), end
+
+    def _incremental_query(self, plan=None, result_predicate=None):
+        for name in ("max_invocations", "counts_only", "reservoir_size"):
+            if self.spy_options[name] not in (None, False):
+                raise ValueError("Incremental queries are not supported with the Spy option {0}.".format(name))
+        return IncrementalQuery(self, plan, result_predicate)
+
+    def incremental_exact_match(self, *args, **kwargs):
+        """
+        Build an IncrementalQuery for the invocations which exactly match the given predicates (see
+        check_quantified_exact_match), for checks that are polled repeatedly.
+
+        :param args: The predicate positional arguments to match up against the call arguments, to check and verify
+            against. These should all be arity 1 and return True/False.
+        :param kwargs: The predicate keyword arguments to match up against the call arguments, to check and verify
+            against. These should all be arity 1 and return True/False.
+        :return: A new IncrementalQuery.
+        :raises: ValueError if this Spy does not keep its invocations in an append-only manner.
+        """
+        return self._incremental_query(MatchPlan(self.target_func_argspec, args, kwargs, exact=True))
+
+    def incremental_partial_match(self, *args, **kwargs):
+        """
+        Build an IncrementalQuery for the invocations which partially match the given predicates (see
+        check_quantified_partial_match), for checks that are polled repeatedly.
+
+        :param args: The predicate positional arguments to match up against the call arguments, to check and verify
+            against. These should all be arity 1 and return True/False.
+        :param kwargs: The predicate keyword arguments to match up against the call arguments, to check and verify
+            against. These should all be arity 1 and return True/False.
+        :return: A new IncrementalQuery.
+        :raises: ValueError if this Spy does not keep its invocations in an append-only manner.
+        """
+        return self._incremental_query(MatchPlan(self.target_func_argspec, args, kwargs, exact=False))
+
+    def incremental_result_match(self, result_predicate):
+        """
+        Build an IncrementalQuery for the invocations whose result matches the given predicate (see
+        check_quantified_result_match), for checks that are polled repeatedly.
+
+        :param result_predicate: An arity 1 predicate to match against the recorded result of a function call.
+        :return: A new IncrementalQuery.
+        :raises: ValueError if this Spy does not keep its invocations in an append-only manner.
+        """
+        return self._incremental_query(result_predicate=result_predicate)
+
+    def incremental_partial_plus_result_match(self, result_predicate, *args, **kwargs):
+        """
+        Build an IncrementalQuery for the invocations which match both the result predicate and the given partial
+        invocation args/kwargs predicates (see check_quantified_partial_plus_result_match).
+
+        :param result_predicate: An arity 1 predicate to match against the recorded result of a function call.
+        :param args: The predicate positional arguments to match up against the call arguments, to check and verify
+            against. These should all be arity 1 and return True/False.
+        :param kwargs: The predicate keyword arguments to match up against the call arguments, to check and verify
+            against. These should all be arity 1 and return True/False.
+        :return: A new IncrementalQuery.
+        :raises: ValueError if this Spy does not keep its invocations in an append-only manner.
+        """
+        plan = MatchPlan(self.target_func_argspec, args, kwargs, exact=False)
+        return self._incremental_query(plan, result_predicate)
+
+    def incremental_exact_plus_result_match(self, result_predicate, *args, **kwargs):
+        """
+        Build an IncrementalQuery for the invocations which match both the result predicate and the given exact
+        invocation args/kwargs predicates (see check_quantified_exact_plus_result_match).
+
+        :param result_predicate: An arity 1 predicate to match against the recorded result of a function call.
+        :param args: The predicate positional arguments to match up against the call arguments, to check and verify
+            against. These should all be arity 1 and return True/False.
+        :param kwargs: The predicate keyword arguments to match up against the call arguments, to check and verify
+            against. These should all be arity 1 and return True/False.
+        :return: A new IncrementalQuery.
+        :raises: ValueError if this Spy does not keep its invocations in an append-only manner.
+        """
+        plan = MatchPlan(self.target_func_argspec, args, kwargs, exact=True)
+        return self._incremental_query(plan, result_predicate)
+
+    def _matching_indices(self, plan=None, result_predicate=None):
+        if result_predicate is not None:
+            result_predicate = simplify_predicate(result_predicate)
+        invocations = self._query_invocations
+        match = self._invocation_matcher(plan, result_predicate)
+        if self.argument_index is not None and plan is not None:
+            candidates = self.argument_index.candidates(plan)
+            if candidates is not None:
+                return [i for i in candidates if match(invocations[i])]
+        if hasattr(self.invocation_store, "matching_indices"):
+            return self.invocation_store.matching_indices(plan, result_predicate)
+        return [i for i, invocation in enumerate(invocations) if match(invocation)]
+
+    def _sequenced_match(self, kind, args, kwargs, plan=None, result_predicate=None):
+        from test_toolbox.spy_sequence import SequencedMatch
+        predicates = [_predicate_repr(predicate) for predicate in args] + [
+            "{0}={1}".format(name, _predicate_repr(predicate)) for name, predicate in sorted(kwargs.items())
+        ]
+        description = "{0}.{1}({2})".format(
+            getattr(self, "__name__", None) or _max_length_repr(self.target_func, 80), kind, ", ".join(predicates)
+        )
+        return SequencedMatch(self, description, plan, result_predicate)
+
+    def match(self, *args, **kwargs):
+        """
+        Describe the invocations of this Spy which partially match the given predicates (see
+        assert_any_partial_match), to be ordered against the invocations of other Spies sharing its sequence_clock
+        (see spy_sequence.assert_in_order()). With no predicates at all, every invocation matches.
+
+        :param args: The predicate positional arguments to match up against the call arguments.
+        :param kwargs: The predicate keyword arguments to match up against the call arguments.
+        :return: A SequencedMatch.
+        :raises: ValueError if this Spy has no sequence_clock.
+        """
+        plan = MatchPlan(self.target_func_argspec, args, kwargs, exact=False) if args or kwargs else None
+        return self._sequenced_match("match", args, kwargs, plan)
+
+    def exact_match(self, *args, **kwargs):
+        """
+        Describe the invocations of this Spy which exactly match the given predicates (see assert_any_exact_match),
+        to be ordered against the invocations of other Spies sharing its sequence_clock (see
+        spy_sequence.assert_in_order()).
+
+        :param args: The predicate positional arguments to match up against the call arguments.
+        :param kwargs: The predicate keyword arguments to match up against the call arguments.
+        :return: A SequencedMatch.
+        :raises: ValueError if this Spy has no sequence_clock.
+        """
+        plan = MatchPlan(self.target_func_argspec, args, kwargs, exact=True)
+        return self._sequenced_match("exact_match", args, kwargs, plan)
+
+    def result_match(self, result_predicate):
+        """
+        Describe the invocations of this Spy whose result matches the given predicate, to be ordered against the
+        invocations of other Spies sharing its sequence_clock (see spy_sequence.assert_in_order()).
+
+        :param result_predicate: An arity 1 predicate to match against the recorded result of a function call.
+        :return: A SequencedMatch.
+        :raises: ValueError if this Spy has no sequence_clock.
+        """
+        return self._sequenced_match("result_match", (result_predicate,), {}, result_predicate=result_predicate)
+
+    def _result_values(self):
+        store = self.invocation_store
+        if isinstance(store, ColumnarInvocationStore):
+            values = store.results.as_numpy()
+            if values is not None:
+                return values
+            return list(store.results.values or [])
+        return [invocation.result for invocation in self.successful_invocations]
+
+    def _assert_numeric_results(self, description, numpy_check, python_check, expected=None):
+        results = self._result_values()
+        if not len(results):
+            raise AssertionError("No results were recorded!")
+        failing, non_numeric = _failing_results(results, numpy_check, python_check, expected)
+        if not failing and not non_numeric:
+            return
+        max_listed = _REPORT_MAX_INVOCATIONS[0]
+
+        def describe(index):
+            result = results[index]
+            if numpy is not None and isinstance(result, numpy.generic):
+                result = result.item()
+            return "  #{0}: {1}".format(index, _max_length_repr(result, 200))
+        lines = []
+        if non_numeric:
+            lines.append("{0} of {1} results are not numeric:".format(len(non_numeric), len(results)))
+            lines.extend(describe(index) for index in non_numeric[:max_listed])
+        if failing:
+            lines.append("{0} of {1} results are not {2}:".format(len(failing), len(results), description))
+            lines.extend(describe(index) for index in failing[:max_listed])
+        num_omitted = max(len(failing) - max_listed, 0) + max(len(non_numeric) - max_listed, 0)
+        if num_omitted:
+            lines.append("  ... {0} more omitted".format(num_omitted))
+        raise AssertionError("\n".join(lines))
+
+    def assert_results_within(self, lower=None, upper=None):
+        """
+        Assert that every numeric result is within bounds (inclusive). A result which is itself an array (i.e. a
+        NumPy array, or a list of numbers) must have every element within the bounds. The check runs as a single
+        NumPy operation over all of the results, when NumPy is available and the results are uniformly shaped, and
+        element by element otherwise. The numeric results of a columnar Spy are already kept in a typed array, so
+        they are checked without collecting them from the recorded invocations first.
+
+        :param lower: (OPTIONAL) The lowest allowed value. None for no lower bound.
+        :param upper: (OPTIONAL) The highest allowed value. None for no upper bound.
+        :return: None
+        :raises: AssertionError if a result is out of bounds (NaN always is) or not numeric, or if no results
+            were recorded.
+        """
+        def numpy_check(values, _):
+            within = numpy.ones(values.shape, dtype=bool)
+            if lower is not None:
+                within &= values >= lower
+            if upper is not None:
+                within &= values <= upper
+            return within
+
+        def python_check(value, _):
+            return (lower is None or value >= lower) and (upper is None or value <= upper)
+
+        self._assert_numeric_results("within [{0}, {1}]".format(lower, upper), numpy_check, python_check)
+
+    def assert_results_allclose(self, expected, rtol=1e-07, atol=0.0):
+        """
+        Assert that every numeric result is close to its expected value, as numpy.testing.assert_allclose() does:
+        abs(result - expected) <= atol + rtol * abs(expected), element by element for array results. The check runs
+        as a single NumPy operation over all of the results, when NumPy is available and the results are uniformly
+        shaped, and element by element otherwise.
+
+        :param expected: A number that every result (or every element of every result) must be close to, or a
+            sequence holding the expected result of every recorded invocation, in order.
+        :param rtol: The relative tolerance. Default: 1e-07
+        :param atol: The absolute tolerance. Default: 0
+        :return: None
+        :raises: AssertionError if a result is not close to its expected value (NaN never is) or not numeric, or
+            if no results were recorded.
+        """
+        if not isinstance(expected, Real) and len(expected) != self.num_invocations:
+            raise AssertionError("Expected {0} results, but {1} were recorded!".format(
+                len(expected), self.num_invocations
+            ))
+
+        def numpy_check(values, expected_values):
+            return numpy.abs(values - expected_values) <= atol + rtol * numpy.abs(expected_values)
+
+        def python_check(value, expected_value):
+            return abs(value - expected_value) <= atol + rtol * abs(expected_value)
+
+        self._assert_numeric_results(
+            "close to {0} (rtol={1}, atol={2})".format(_max_length_repr(expected, 200), rtol, atol),
+            numpy_check, python_check, expected
+        )
+
+    def result_stats(self):
+        """
+        Compute summary statistics over the numeric results (every element of every result, for array results),
+        with a single NumPy reduction each when NumPy is available and the results are uniformly shaped.
+
+        :return: A ResultStats of the number of results, and the minimum, maximum and mean value (which are None if
+            no results were recorded).
+        :raises: ValueError if a result is not numeric.
+        """
+        results = self._result_values()
+        if not len(results):
+            return ResultStats(0, None, None, None)
+        rows = _numeric_rows(results)
+        if rows is not None and rows.size:
+            return ResultStats(len(results), float(rows.min()), float(rows.max()), float(rows.mean()))
+        values = []
+        for index, result in enumerate(results):
+            row = _numeric_row(result)
+            if row is None:
+                raise ValueError("The result of invocation #{0} is not numeric: {1}".format(
+                    index, _max_length_repr(result, 200)
+                ))
+            values.extend(row)
+        if not values:
+            return ResultStats(len(results), None, None, None)
+        return ResultStats(len(results), min(values), max(values), math.fsum(values) / len(values))
+
+    def assert_result_stats(self, min=None, max=None, mean=None):
+        """
+        Assert summary statistics of the numeric results (see result_stats()) against predicates.
+
+        Example: spy.assert_result_stats(mean=in_range(0.45, 0.55), max=in_range(upper=1.0, inclusive=True))
+
+        :param min: (OPTIONAL) An arity 1 predicate the minimum value must satisfy.
+        :param max: (OPTIONAL) An arity 1 predicate the maximum value must satisfy.
+        :param mean: (OPTIONAL) An arity 1 predicate the mean value must satisfy.
+        :return: None
+        :raises: AssertionError if a statistic does not satisfy its predicate, or if no results were recorded.
+        """
+        stats = self.result_stats()
+        if not stats.count:
+            raise AssertionError("No results were recorded!")
+        failed = [
+            "{0} = {1} (expected {2})".format(name, value, _predicate_repr(predicate))
+            for name, value, predicate in (("min", stats.min, min), ("max", stats.max, max), ("mean", stats.mean, mean))
+            if predicate is not None and not predicate(value)
+        ]
+        if failed:
+            raise AssertionError("Result statistics do not match: {0}\nResult statistics: {1}".format(
+                ", ".join(failed), stats
+            ))
+
+    def reset(self):
+        """
+        Clear all of the recorded invocations to return to an "uninvoked" state.
+
+        :return: True
+        """
+        if self.invocation_store is not None:
+            self.invocation_store.clear()
+        else:
+            self.successful_invocations = self._new_invocation_list()
+        self.successful_results = []
+        if self.bound_invocations is not None:
+            self.bound_invocations = self._new_invocation_list()
+        if self.argument_index is not None:
+            self.argument_index.clear()
+        self.latencies_ns = array(_INT64_TYPECODE)
+        self.sequence_numbers = array(_INT64_TYPECODE)
+        self._generation += 1
+        return True
+
+    def close(self):
+        """
+        Release whatever the invocation store of this Spy holds open (i.e. the file of an invocation_log), along
+        with those of its per instance Spies, if it spies a method. The recorded invocations may still be queried,
+        but no more may be recorded until the Spy is reset.
+
+        :return: True
+        """
+        close = getattr(self.invocation_store, "close", None)
+        if close is not None:
+            close()
+        for _, spy in list(self._instance_spies.values()):
+            spy.close()
+        return True
+
+
+def _numeric_rows(results):
+    # All of the results as a single float array, with a row per result, if NumPy is available and the results
+    # are numeric and uniformly shaped. None otherwise.
+    if numpy is None:
+        return None
+    try:
+        values = numpy.asarray(results)
+    except ValueError:
+        return None
+    if values.dtype.kind not in "biuf" or not values.size:
+        return None
+    return values.astype(float, copy=False).reshape(len(results), -1)
+
+
+def _numeric_row(result):
+    # A single result as a flat list of floats, or None if it is not numeric.
+    if isinstance(result, Real):
+        return [float(result)]
+    if isinstance(result, (str, bytes, bytearray)):
+        return None
+    if hasattr(result, "tolist"):
+        result = result.tolist()
+        if isinstance(result, Real):
+            return [float(result)]
+    try:
+        items = iter(result)
+    except TypeError:
+        return None
+    row = []
+    for item in items:
+        item_row = _numeric_row(item)
+        if item_row is None:
+            return None
+        row.extend(item_row)
+    return row
+
+
+def _failing_results(results, numpy_check, python_check, expected=None):
+    """
+    Apply an element wise check to numeric results, as a single NumPy operation where possible.
+
+    :param results: The results, one per invocation.
+    :param numpy_check: A function of (value array, expected array) to a boolean array.
+    :param python_check: A function of (value, expected value) to a bool.
+    :param expected: (OPTIONAL) A number, or a sequence holding the expected value of every result.
+    :return: A (failing result indices, non numeric result indices) pair.
+    """
+    per_result = expected is not None and not isinstance(expected, Real)
+    rows = _numeric_rows(results)
+    expected_rows = _numeric_rows(expected) if per_result else expected
+    if rows is not None and (not per_result or expected_rows is not None and expected_rows.shape == rows.shape):
+        with numpy.errstate(invalid="ignore"):
+            passing = numpy_check(rows, expected_rows).all(axis=1)
+        return numpy.flatnonzero(~passing).tolist(), []
+    failing, non_numeric = [], []
+    for index, result in enumerate(results):
+        row = _numeric_row(result)
+        if row is None:
+            non_numeric.append(index)
+            continue
+        if per_result:
+            expected_row = _numeric_row(expected[index])
+            if expected_row is None or len(expected_row) != len(row):
+                failing.append(index)
+                continue
+        else:
+            expected_row = repeat(expected)
+        if not all(python_check(value, expected_value) for value, expected_value in zip(row, expected_row)):
+            failing.append(index)
+    return failing, non_numeric
+
+
+def _nearest_rank(sorted_values, percentile):
+    if not 0 <= percentile <= 100:
+        raise ValueError("Percentiles must be between 0 and 100, not {0}.".format(percentile))
+    if not sorted_values:
+        return None
+    rank = int(math.ceil(percentile / 100.0 * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def _parse_percentile_name(name):
+    digits = name[1:]
+    if not name.startswith("p") or not digits.isdigit():
+        raise TypeError("Unexpected latency bound {0}, expected i.e. p50 or p999.".format(name))
+    if len(digits) > 2 and digits != "100":
+        return float(digits[:2] + "." + digits[2:])
+    return int(digits)
+
+
+def _align_args_kwargs_to_argspec_args(argspec_args, args, kwargs, kwonly_args=()):
+    aligned_map = dict(zip(argspec_args[:len(args)], args))
+    aligned_map.update((k, v) for k, v in kwargs.items() if k in argspec_args or k in kwonly_args)
+    return aligned_map
+
+
+class MatchPlan(object):
+    """
+    A MatchPlan is the compiled form of the predicate side of a Spy query. The predicates are aligned against the
+    argspec of the spied callable once, when the plan is built, and the resulting plan may then be applied to any
+    number of recorded invocations without redoing that work.
+
+    :param argspec: The argspec of the spied callable (see Spy.target_func_argspec).
+    :param predicate_args: The positional predicates to align against the argspec.
+    :param predicate_kwargs: The keyword predicates to align against the argspec.
+    :param exact: True if every argument of an invocation must have a matching predicate, False if arguments
+        without predicates should be ignored.
+    """
+    def __init__(self, argspec, predicate_args, predicate_kwargs, exact=True):
+        arg_names = tuple(argspec.args)
+        kwonly_names = tuple(argspec.kwonlyargs or ())
+        parameter_names = arg_names + kwonly_names
+        self.arg_names = arg_names
+        self.exact = exact
+        self._arg_name_set = frozenset(parameter_names)
+        self.defaults = _argspec_defaults(argspec)
+
+        # Predicates are simplified once, here, rather than paying for their redundant checks on every call.
+        predicate_args = [simplify_predicate(predicate) for predicate in predicate_args]
+        predicate_kwargs = dict((name, simplify_predicate(predicate)) for name, predicate in predicate_kwargs.items())
+        aligned_predicates = _align_args_kwargs_to_argspec_args(
+            arg_names, predicate_args, predicate_kwargs, kwonly_names
+        )
+        # Keyword-only parameters are placed after the positional ones, at an index no positional argument reaches.
+        positions = dict((name, index) for index, name in enumerate(arg_names))
+        positions.update((name, sys.maxsize) for name in kwonly_names)
+        self.named_predicates = tuple(
+            (positions[name], name, predicate) for name, predicate in sorted(
+                aligned_predicates.items(), key=lambda item: parameter_names.index(item[0])
+            )
+        )
+        self.extra_arg_predicates = tuple(predicate_args[len(arg_names):])
+        self.extra_kwarg_predicates = tuple(
+            (name, predicate) for name, predicate in predicate_kwargs.items() if name not in self._arg_name_set
+        )
+
+        # Precomputed structural facts used by exact matching: the named arguments of an invocation (positional,
+        # keyword or defaulted) must be exactly the predicated ones.
+        self._defaults_predicated = set(self.defaults.keys()) <= set(aligned_predicates.keys())
+        self._predicated_positional_prefix = len(arg_names)
+        for i, name in enumerate(arg_names):
+            if name not in aligned_predicates:
+                self._predicated_positional_prefix = i
+                break
+        self._predicated_names = frozenset(aligned_predicates.keys())
+
+    def _structure_matches(self, call_args, call_kwargs):
+        num_names = len(self.arg_names)
+        num_extra_args = len(call_args) - num_names if len(call_args) > num_names else 0
+        extra_kwarg_names = [name for name in call_kwargs if name not in self._arg_name_set]
+        if self.exact:
+            if not self._defaults_predicated:
+                return False
+            if min(len(call_args), num_names) > self._predicated_positional_prefix:
+                return False
+            if num_extra_args != len(self.extra_arg_predicates):
+                return False
+            if len(extra_kwarg_names) != len(self.extra_kwarg_predicates):
+                return False
+            for name in call_kwargs:
+                if name in self._arg_name_set and name not in self._predicated_names:
+                    return False
+        elif num_extra_args < len(self.extra_arg_predicates):
+            return False
+        for name, _ in self.extra_kwarg_predicates:
+            if name not in call_kwargs:
+                return False
+        for index, name, _ in self.named_predicates:
+            if not (index < len(call_args) or name in call_kwargs or name in self.defaults):
+                return False
+        return True
+
+    def matches(self, call_args, call_kwargs):
+        """
+        Apply this plan to a single recorded invocation.
+
+        :param call_args: The positional arguments of the invocation.
+        :param call_kwargs: The keyword arguments of the invocation.
+        :return: True if the invocation satisfies all of the predicates of this plan, False otherwise.
+        """
+        if not self._structure_matches(call_args, call_kwargs):
+            return False
+        num_args = len(call_args)
+        for index, name, predicate in self.named_predicates:
+            if index < num_args:
+                value = call_args[index]
+            elif name in call_kwargs:
+                value = call_kwargs[name]
+            else:
+                value = self.defaults[name]
+            if not predicate(value):
+                return False
+        num_names = len(self.arg_names)
+        for offset, predicate in enumerate(self.extra_arg_predicates):
+            if not predicate(call_args[num_names + offset]):
+                return False
+        for name, predicate in self.extra_kwarg_predicates:
+            if not predicate(call_kwargs[name]):
+                return False
+        return True
+
+    def score(self, call_args, call_kwargs):
+        """
+        Rate how nearly a recorded invocation matches this plan, i.e. to list the nearest invocations first when an
+        assertion fails.
+
+        :param call_args: The positional arguments of the invocation.
+        :param call_kwargs: The keyword arguments of the invocation.
+        :return: The number of predicates of this plan that the invocation satisfies.
+        """
+        satisfied = 0
+        num_args = len(call_args)
+        for index, name, predicate in self.named_predicates:
+            if index < num_args:
+                satisfied += _satisfies(predicate, call_args[index])
+            elif name in call_kwargs:
+                satisfied += _satisfies(predicate, call_kwargs[name])
+            elif name in self.defaults:
+                satisfied += _satisfies(predicate, self.defaults[name])
+        num_names = len(self.arg_names)
+        for offset, predicate in enumerate(self.extra_arg_predicates):
+            if num_names + offset < num_args:
+                satisfied += _satisfies(predicate, call_args[num_names + offset])
+        for name, predicate in self.extra_kwarg_predicates:
+            if name in call_kwargs:
+                satisfied += _satisfies(predicate, call_kwargs[name])
+        return satisfied
+
+    def matches_bound(self, bound_invocation):
+        """
+        Apply this plan to a single invocation that was bound when it was recorded (see ArgumentBinder).
+
+        :param bound_invocation: The BoundInvocation to check.
+        :return: True if the invocation satisfies all of the predicates of this plan, False otherwise.
+        """
+        arguments, extra_args, extra_kwargs, _ = bound_invocation
+        if self.exact:
+            if len(arguments) != len(self.named_predicates) or len(extra_args) != len(self.extra_arg_predicates) \
+                    or len(extra_kwargs) != len(self.extra_kwarg_predicates):
+                return False
+        elif len(extra_args) < len(self.extra_arg_predicates):
+            return False
+        for _, name, _ in self.named_predicates:
+            if name not in arguments:
+                return False
+        for name, _ in self.extra_kwarg_predicates:
+            if name not in extra_kwargs:
+                return False
+        for _, name, predicate in self.named_predicates:
+            if not predicate(arguments[name]):
+                return False
+        for predicate, value in zip(self.extra_arg_predicates, extra_args):
+            if not predicate(value):
+                return False
+        for name, predicate in self.extra_kwarg_predicates:
+            if not predicate(extra_kwargs[name]):
+                return False
+        return True
+
+
+def _calculate_match(argspec, predicate_args, predicate_kwargs, call_args, call_kwargs, exact=True):
+    return MatchPlan(argspec, predicate_args, predicate_kwargs, exact=exact).matches(call_args, call_kwargs)
+
+
+class IncrementalQuery(object):
+    """
+    An IncrementalQuery is a Spy query that is evaluated incrementally, for checks which are polled repeatedly
+    (i.e. with helpers.await_condition). It remembers how far it has examined the recorded invocations, and which
+    of them matched, so every update only examines the invocations recorded since the previous one: polling a Spy
+    until it has recorded N invocations costs O(N) overall, rather than O(N^2). Built by Spy.incremental_*_match(),
+    for instance:
+
+        query = spy.incremental_partial_match(equal_to("ping"))
+        await_condition("1000 pings", lambda: query.check(at_least_times(1000)))
+
+    Resetting the Spy invalidates the query, which then starts over from the first invocation recorded after the
+    reset. An IncrementalQuery should only be polled from one thread at a time. Only Spies which record their
+    invocations in an append-only manner are supported (so not those with max_invocations, counts_only or
+    reservoir_size); for a thread_safe Spy, invocations are examined thread by thread, rather than in global
+    sequence order.
+
+    :param spy: The Spy to query.
+    :param plan: (OPTIONAL) The MatchPlan the invocation arguments must satisfy.
+    :param result_predicate: (OPTIONAL) An arity 1 predicate the invocation result must satisfy.
+    """
+    def __init__(self, spy, plan=None, result_predicate=None):
+        self.spy = spy
+        self.plan = plan
+        self.result_predicate = None if result_predicate is None else simplify_predicate(result_predicate)
+        self._match = spy._invocation_matcher(plan, self.result_predicate)
+        self._start()
+
+    def _start(self):
+        self._generation = self.spy._generation
+        self._cursor = None
+        self.num_examined = 0
+        self.matching_invocations = []
+
+    @property
+    def num_matching(self):
         """
-        Wraps assert_quantified_partial_match, seeing if the specified arguments show up exactly once.
+        Access the number of matching invocations found by the last update.
 
-        :param args: The arguments to attempt to match on.
-        :param kwargs: The keyword arguments to match on.
-        :return: None
-        :raises: AssertionError on failure to match.
+        :return: The integer number of matching invocations.
         """
-        self.assert_quantified_partial_match(once, *args, **kwargs)
+        return len(self.matching_invocations)
 
-    def assert_all_partial_match(self, *args, **kwargs):
+    def update(self):
         """
-        Wraps assert_quantified_partial_match, seeing if the specified arguments always show up.
+        Examine the invocations recorded since the last update (or since the query was built, or the Spy reset).
 
-        :param args: The arguments to attempt to match on.
-        :param kwargs: The keyword arguments to match on.
-        :return: None
-        :raises: AssertionError on failure to match.
+        :return: The number of matching invocations found so far.
         """
-        self.assert_quantified_partial_match(always, *args, **kwargs)
-
-    def assert_any_result_match(self, result_predicate):
+        if self._generation != self.spy._generation:
+            self._start()
+        invocations, self._cursor = self.spy._invocations_since(self._cursor)
+        match = self._match
+        matching_invocations = self.matching_invocations
+        num_examined = 0
+        for invocation in invocations:
+            num_examined += 1
+            if match(invocation):
+                matching_invocations.append(invocation)
+        self.num_examined += num_examined
+        return len(matching_invocations)
+
+    def check(self, times_predicate):
         """
-        Wraps assert_quantified_partial_match, seeing if the result predicate returns true at least once.
+        Update the query, and check the matching invocations against a times predicate. A QuantifierPredicate
+        (i.e. times(), at_least_times() or always) is decided from the counts alone.
 
-        :param result_predicate: The function to match against stored results.
-        :return: None
-        :raises: AssertionError on failure to match.
+        :param times_predicate: An arity 2 predicate that takes the matching invocation list, and the total
+            invocation list, returns true or false based on these matching number of times executed expectation
+            embedded in this predicate.
+        :return: True if the matching invocations satisfy the times predicate, False otherwise.
         """
-        self.assert_quantified_result_match(at_least_once, result_predicate)
+        self.update()
+        if isinstance(times_predicate, QuantifierPredicate):
+            return times_predicate.evaluate_counts(len(self.matching_invocations), self.num_examined)
+        return times_predicate(self.matching_invocations, self.spy._query_invocations)
 
-    def assert_one_result_match(self, result_predicate):
+    def assert_check(self, times_predicate):
         """
-        Wraps assert_quantified_partial_match, seeing if the result predicate is true exactly once.
+        Update the query, and assert the matching invocations against a times predicate (see check()).
 
-        :param result_predicate: The function to match against stored results.
+        :param times_predicate: An arity 2 predicate that takes the matching invocation list, and the total
+            invocation list, returns true or false based on these matching number of times executed expectation
+            embedded in this predicate.
         :return: None
         :raises: AssertionError on failure to match.
         """
-        self.assert_quantified_result_match(once, result_predicate)
+        if self.check(times_predicate):
+            return
+        header = "Failed to find a matching result!" if self.result_predicate is not None else \
+            "Failed to find a matching {0} invocation!".format("exact" if self.plan.exact else "partial")
+        if not self.spy.verbose:
+            raise AssertionError(header)
+        raise AssertionError(self.spy._failure_report(
+            header, self.plan, self.result_predicate, show_results=self.plan is None
+        ))
+
+    def __repr__(self):
+        return "<IncrementalQuery of {0} matching in {1} examined invocations>".format(
+            len(self.matching_invocations), self.num_examined
+        )
 
-    def assert_all_result_match(self, result_predicate):
-        """
-        Wraps assert_quantified_partial_match, seeing if the result predicate is always true.
 
-        :param result_predicate: The function to match against stored results.
-        :return: None
-        :raises: AssertionError on failure to match.
+class QuantifierPredicate(object):
+    """
+    A QuantifierPredicate is a times predicate that can decide its outcome lazily. Rather than being handed the
+    complete list of matching invocations, evaluate() consumes a stream of per-invocation match outcomes (True or
+    False, in recording order) and may stop as soon as the outcome is decided, so the remaining invocations are
+    never matched at all.
+
+    Subclasses implement evaluate_counts(), which decides the predicate from the number of matching invocations,
+    and override evaluate() to stop as soon as they can (the default counts every outcome). A QuantifierPredicate
+    may still be called like any other times predicate, with the matching invocations list and the total
+    invocations list.
+    """
+    def evaluate(self, outcomes):
         """
-        self.assert_quantified_result_match(always, result_predicate)
+        Decide this predicate from a stream of match outcomes. The default implementation consumes every outcome,
+        and decides from the counts (see evaluate_counts()).
 
-    def reset(self):
+        :param outcomes: An iterable of booleans, one per invocation, True if that invocation matched.
+        :return: True or False.
         """
-        Clear all of the recorded invocations to return to an "uninvoked" state.
+        num_matching = num_invocations = 0
+        for outcome in outcomes:
+            num_invocations += 1
+            if outcome:
+                num_matching += 1
+        return self.evaluate_counts(num_matching, num_invocations)
+
+    def evaluate_counts(self, num_matching, num_invocations):
+        """
+        Decide this predicate from the number of matching invocations alone (see IncrementalQuery). This is the
+        one method every subclass must implement.
 
-        :return: True
+        :param num_matching: The number of invocations which matched.
+        :param num_invocations: The total number of invocations.
+        :return: True or False.
         """
-        self.successful_invocations = []
-        self.successful_results = []
-        return True
+        raise NotImplementedError(
+            "{0} is a QuantifierPredicate, so it must implement evaluate_counts().".format(type(self).__name__)
+        )
 
+    def __call__(self, matching_invocations, all_invocations):
+        return self.evaluate_counts(len(matching_invocations), len(all_invocations))
 
-def _align_args_kwargs_to_argspec_args(argspec_args, args, kwargs):
-    aligned_map = dict(zip(argspec_args[:len(args)], args))
-    aligned_map.update((k, v) for k, v in kwargs.items() if k in argspec_args)
-    return aligned_map
 
+class TimesPredicate(QuantifierPredicate):
+    """
+    A predicate that checks to see if the number of matching invocations occur exactly the specified number
+    of times. Evaluation stops once more than that many matches have been seen.
+
+    :param num_times: The exact number of matches that must have occurred.
+    """
+    def __init__(self, num_times):
+        self.num_times = num_times
 
-def _apply_predicate_map_to_value_map(predicate_map, value_map):
-    for key in set(predicate_map.keys()):
-        yield predicate_map[key](value_map[key])
+    def evaluate(self, outcomes):
+        return len(list(islice(_filter(None, outcomes), self.num_times + 1))) == self.num_times
 
+    def evaluate_counts(self, num_matching, _):
+        return num_matching == self.num_times
 
-def _apply_predicate_list_to_value_list(predicate_list, value_list):
-    for predicate, value in islice(zip(predicate_list, value_list), 0, len(predicate_list)):
-        yield predicate(value)
+    def __call__(self, matching_invocations, _):
+        return len(matching_invocations) == self.num_times
 
 
-def _calculate_match(argspec, predicate_args, predicate_kwargs, call_args, call_kwargs, exact=True):
-    if argspec.defaults:
-        aligned_call_args = dict(zip(argspec.args[len(argspec.defaults)+1::-1], argspec.defaults[::-1]))
-    else:
-        aligned_call_args = {}
-    aligned_call_args.update(_align_args_kwargs_to_argspec_args(argspec.args, call_args, call_kwargs))
-    aligned_predicate_args = _align_args_kwargs_to_argspec_args(argspec.args, predicate_args, predicate_kwargs)
+class AtLeastTimesPredicate(QuantifierPredicate):
+    """
+    A predicate that checks to see if the number of matching invocations occur at least the specified number
+    of times. Evaluation stops once that many matches have been seen.
 
-    extra_call_args = call_args[len(argspec.args):]
-    extra_predicate_args = predicate_args[len(argspec.args):]
+    :param num_times: The minimum number of matches that must have occurred.
+    """
+    def __init__(self, num_times):
+        self.num_times = num_times
 
-    extra_call_kwargs = dict((k, v) for k, v in call_kwargs.items() if k not in aligned_call_args)
-    extra_predicate_kwargs = dict((k, v) for k, v in predicate_kwargs.items() if k not in aligned_predicate_args)
+    def evaluate(self, outcomes):
+        if self.num_times <= 0:
+            return True
+        return next(islice(_filter(None, outcomes), self.num_times - 1, None), _MISSING) is not _MISSING
 
-    if exact:
-        matching_named_call_args = set(aligned_call_args.keys()) == set(aligned_predicate_args.keys())
-        matching_extra_args = len(extra_call_args) == len(extra_predicate_args)
-        matching_extra_kwargs = set(extra_call_kwargs.keys()) == set(extra_predicate_kwargs.keys())
-    else:
-        matching_named_call_args = set(aligned_call_args.keys()) >= set(aligned_predicate_args.keys())
-        matching_extra_args = len(extra_call_args) >= len(extra_predicate_args)
-        matching_extra_kwargs = set(extra_call_kwargs.keys()) >= set(extra_predicate_kwargs.keys())
-
-    if matching_named_call_args and matching_extra_args and matching_extra_kwargs:
-        all_named_pass = all(_apply_predicate_map_to_value_map(aligned_predicate_args, aligned_call_args))
-        all_extra_args_pass = all(_apply_predicate_list_to_value_list(extra_predicate_args, extra_call_args))
-        all_extra_kwargs_pass = all(_apply_predicate_map_to_value_map(extra_predicate_kwargs, extra_call_kwargs))
-        return all_named_pass and all_extra_args_pass and all_extra_kwargs_pass
-    else:
-        return False
+    def evaluate_counts(self, num_matching, _):
+        return num_matching >= self.num_times
+
+    def __call__(self, matching_invocations, _):
+        return len(matching_invocations) >= self.num_times
+
+
+class AlwaysPredicate(QuantifierPredicate):
+    """
+    This predicate verifies that all invocations must have matched. Evaluation stops at the first invocation that
+    did not match. For a Spy with max_invocations set, this applies to the retained invocations only.
+    """
+    def evaluate(self, outcomes):
+        return all(outcomes)
+
+    def evaluate_counts(self, num_matching, num_invocations):
+        return num_matching == num_invocations
+
+    def __call__(self, matching_invocations, all_invocations):
+        return len(matching_invocations) == len(all_invocations)
 
 
 def times(num_times):
     """
     Create a predicate that checks to see if the number of matching invocations occur exactly the specified number
-    of times.
+    of times. For a Spy with max_invocations set, only the retained invocations are counted.
 
     :param num_times: The exact number of matches that must have occurred.
     :return: A predicate to check the resulting matching invocations list.
     """
-    def predicate(matching_invocations, _):
-        return len(matching_invocations) == num_times
-    return predicate
+    return TimesPredicate(num_times)
 
 
 once = times(1)
@@ -533,33 +2735,21 @@ never = times(0)
 def at_least_times(num_times):
     """
     Create a predicate that checks to see if the number of matching invocations occur at least the specified number
-    of times.
+    of times. For a Spy with max_invocations set, only the retained invocations are counted.
 
     :param num_times: The minimum number of matches that must have occurred.
     :return: A predicate to check the resulting matching invocations list.
     """
-    def predicate(matching_invocations, _):
-        return len(matching_invocations) >= num_times
-    return predicate
+    return AtLeastTimesPredicate(num_times)
 
 
 at_least_once = at_least_times(1)
-
-
-def always(matching_invocations, all_invocations):
-    """
-    This predicate verifies that all invocations must have matched.
-
-    :param matching_invocations: All found matching invocations.
-    :param all_invocations: All invocations of the Spy
-    :return: True or False.
-    """
-    return len(matching_invocations) == len(all_invocations)
+always = AlwaysPredicate()
 
 
 def apply_builtin_function_spy(func):
     """
-    Apply a spy to a built-in function that does not work with inspect.getargspec.
+    Apply a spy to a built-in function that cannot be introspected (see get_argspec).
 
     :param func: The function to spy on.
     :return: The function with a spy attached.
@@ -567,29 +2757,193 @@ def apply_builtin_function_spy(func):
     return Spy(func, is_not_inspectable=True)
 
 
-def apply_function_spy(func):
+def apply_function_spy(func, **spy_options):
     """
     Apply a Spy to a function, lambda, staticmethod, or instantiated object's method.
 
     :param func: The callable to spy on.
+    :param spy_options: (OPTIONAL) Additional keyword arguments to pass to the Spy (i.e. bind_arguments).
     :return: The callable with attached spy.
     """
-    return Spy(func)
+    return Spy(func, **spy_options)
 
 
-def apply_method_spy(method):
+def apply_method_spy(method, **spy_options):
     """
     Apply a spy to an instance method declaration on an object. This must be handled differently because
     of the way Python handles decorators and does virtual method dispatch on instance methods.
 
     :param method: The instance method (or possibly classmethod) to spy on.
+    :param spy_options: (OPTIONAL) Additional keyword arguments to pass to the Spy (i.e. bind_arguments).
     :return: The method with attached spy.
     """
-    new_spy = Spy(method, is_method=True)
+    new_spy = Spy(method, is_method=True, **spy_options)
     new_spy.needs_reinit = True
     return new_spy
 
 
+def _offline_target(*args, **kwargs):
+    raise TypeError("A Spy reopened from an invocation log cannot be called.")
+
+
+def open_invocation_log(path):
+    """
+    Reopen the invocation log written by a Spy (see its invocation_log option), i.e. after the test run that wrote
+    it, as a Spy whose queries and assertions run over the logged invocations. The argspec of the original target
+    is read back from the log, so predicates align to its parameters as they did for the original Spy.
+
+    :param path: The path of the log file.
+    :return: A Spy over the logged invocations. It cannot be called itself, but reset() empties the log.
+    :raises: IOError if there is no log at that path, ValueError if the file is not a Spy invocation log.
+    """
+    from test_toolbox.spy_log import InvocationLogStore
+    store = InvocationLogStore(path, append=True)
+    spy = Spy(_offline_target, is_not_inspectable=True, invocation_log=store)
+    spy._use_argspec(store.argspec)
+    return spy
+
+
+class SpyRegistry(dict):
+    """
+    A SpyRegistry maps the qualified names (i.e. "package.module.function" or "package.module.Class.method") of
+    the callables spied by spy_module() or spy_class() to their Spies, and remembers the attributes they replaced.
+    restore() puts the original attributes back, as does leaving the registry when it is used as a context manager:
+
+        with spy_class(Connection, include=["send", "recv"]) as spies:
+            ...
+            spies["my_package.net.Connection.send"].assert_any_partial_match(equal_to(b"HELO"))
+
+    A registry may be extended by further spy_module()/spy_class() calls (see their registry parameter), and
+    restores everything it installed in reverse order.
+    """
+    def __init__(self):
+        dict.__init__(self)
+        self._replaced = []
+
+    def install(self, owner, name, qualified_name, spy, replacement=None):
+        """
+        Replace an attribute of a module or class with a Spy, and register it.
+
+        :param owner: The module or class to patch.
+        :param name: The attribute name.
+        :param qualified_name: The name the Spy is registered under.
+        :param spy: The Spy.
+        :param replacement: (OPTIONAL) The value to actually set, if not the Spy itself (i.e. a staticmethod).
+        :return: The Spy.
+        """
+        self._replaced.append((owner, name, owner.__dict__[name], spy))
+        setattr(owner, name, spy if replacement is None else replacement)
+        self[qualified_name] = spy
+        return spy
+
+    def reset(self):
+        """
+        Reset every registered Spy (see Spy.reset), i.e. between tests.
+
+        :return: True
+        """
+        for spy in self.values():
+            spy.reset()
+        return True
+
+    def restore(self):
+        """
+        Put back every attribute replaced through this registry, and empty it. Instances which cached a BoundSpy
+        for a restored method get the original method back too.
+
+        :return: True
+        """
+        while self._replaced:
+            owner, name, original, spy = self._replaced.pop()
+            setattr(owner, name, original)
+            for ref, _ in list(spy._instance_spies.values()):
+                instance = ref()
+                instance_dict = getattr(instance, "__dict__", {})
+                if isinstance(instance_dict.get(name), BoundSpy):
+                    del instance_dict[name]
+        self.clear()
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.restore()
+        return False
+
+
+def _included_names(namespace, include):
+    if include is None:
+        return [name for name in namespace if not name.startswith("_")]
+    elif callable(include):
+        return [name for name in namespace if include(name)]
+    for name in include:
+        if name not in namespace:
+            raise AttributeError("No such attribute {0} to spy on.".format(name))
+    return list(include)
+
+
+def spy_module(module, include=None, registry=None, **spy_options):
+    """
+    Install a Spy on every function (or built-in function) defined in a module, in a single pass. Callables the
+    module merely imports from elsewhere are left alone, as are classes (see spy_class).
+
+    :param module: The module to spy on.
+    :param include: (OPTIONAL) The names to spy on, either as a collection of names, or as a predicate which is
+        given each name of the module. Default: every public (not underscored) name.
+    :param registry: (OPTIONAL) An existing SpyRegistry to add the Spies to. Default: a new SpyRegistry.
+    :param spy_options: (OPTIONAL) Additional keyword arguments to pass to each Spy (i.e. bind_arguments).
+    :return: The SpyRegistry, keyed by qualified name (i.e. "package.module.function").
+    """
+    registry = SpyRegistry() if registry is None else registry
+    namespace = vars(module)
+    try:
+        for name in _included_names(namespace, include):
+            value = namespace[name]
+            if isinstance(value, Spy) or getattr(value, "__module__", None) != module.__name__:
+                continue
+            qualified_name = "{0}.{1}".format(module.__name__, name)
+            if isinstance(value, FunctionType):
+                registry.install(module, name, qualified_name, Spy(value, **spy_options))
+            elif isinstance(value, BuiltinFunctionType):
+                registry.install(module, name, qualified_name, Spy(value, is_not_inspectable=True, **spy_options))
+    except Exception:
+        registry.restore()
+        raise
+    return registry
+
+
+def spy_class(cls, include=None, registry=None, **spy_options):
+    """
+    Install a Spy on every method defined in a class body (including staticmethods and classmethods), in a single
+    pass. Inherited methods are left alone; spy on the class which defines them instead. Instance methods are
+    spied per instance, as with apply_method_spy.
+
+    :param cls: The class to spy on.
+    :param include: (OPTIONAL) The names to spy on, either as a collection of names, or as a predicate which is
+        given each name of the class. Default: every public (not underscored) name.
+    :param registry: (OPTIONAL) An existing SpyRegistry to add the Spies to. Default: a new SpyRegistry.
+    :param spy_options: (OPTIONAL) Additional keyword arguments to pass to each Spy (i.e. bind_arguments).
+    :return: The SpyRegistry, keyed by qualified name (i.e. "package.module.Class.method").
+    """
+    registry = SpyRegistry() if registry is None else registry
+    namespace = vars(cls)
+    prefix = "{0}.{1}".format(cls.__module__, getattr(cls, "__qualname__", cls.__name__))
+    try:
+        for name in _included_names(namespace, include):
+            value = namespace[name]
+            qualified_name = "{0}.{1}".format(prefix, name)
+            if isinstance(value, FunctionType):
+                registry.install(cls, name, qualified_name, apply_method_spy(value, **spy_options))
+            elif isinstance(value, (staticmethod, classmethod)) and isinstance(value.__func__, FunctionType):
+                spy = Spy(value.__func__, is_method=isinstance(value, classmethod), **spy_options)
+                registry.install(cls, name, qualified_name, spy, replacement=type(value)(spy))
+    except Exception:
+        registry.restore()
+        raise
+    return registry
+
+
 def anything(_):
     """
     This predicate will always return True, and thus matches anything.
@@ -600,6 +2954,381 @@ def anything(_):
     return True
 
 
+class ArgumentPredicate(object):
+    """
+    The base class of the predicate objects built by the predicate helpers of this module (equal_to(), all_of(),
+    in_range() and so on). A predicate object is called with a single argument, like any other arity 1 predicate,
+    and may also be introspected:
+
+    * index_values -- If not None, a tuple holding every value the predicate may accept, so that an ArgumentIndex
+      can look up candidate invocations instead of scanning them.
+    * vectorized -- If not None, a function applying the predicate to a whole numpy array at once, for a
+      ColumnarInvocationStore.
+    * simplify() -- Build an equivalent, cheaper predicate. This is done once for every predicate of a query, when
+      it is planned (see MatchPlan), rather than on every call.
+    """
+    index_values = None
+    vectorized = None
+
+    def simplify(self):
+        """
+        Build an equivalent predicate which is cheaper to call.
+
+        :return: The simplified predicate, or this predicate if it cannot be simplified.
+        """
+        return self
+
+
+def simplify_predicate(predicate):
+    """
+    Simplify a predicate (see ArgumentPredicate.simplify()). Predicates which are not ArgumentPredicates (i.e. plain
+    functions) are returned as they are.
+
+    :param predicate: The predicate to simplify.
+    :return: The simplified predicate.
+    """
+    if isinstance(predicate, ArgumentPredicate):
+        return predicate.simplify()
+    return predicate
+
+
+def _predicate_repr(predicate):
+    if isinstance(predicate, ArgumentPredicate):
+        return repr(predicate)
+    return getattr(predicate, "__name__", None) or repr(predicate)
+
+
+def _is_hashable(value):
+    try:
+        hash(value)
+        return True
+    except TypeError:
+        return False
+
+
+class EqualToPredicate(ArgumentPredicate):
+    """
+    Matches arguments equal to an element (see equal_to()).
+    """
+
+    def __init__(self, element):
+        self.element = element
+        self.index_values = (element,)
+        if type(element) in _NUMERIC_TYPECODES:
+            self.vectorized = lambda values: values == element
+
+    def __call__(self, argument):
+        return argument == self.element
+
+    def __repr__(self):
+        return "equal_to({0})".format(_max_length_repr(self.element, 80))
+
+
+class AnyOfPredicate(ArgumentPredicate):
+    """
+    Matches arguments contained in a collection of elements (see any_of()). A list, tuple, set or frozenset of
+    hashable elements is kept as a frozenset, so that membership is a single hash lookup; any other collection is
+    searched as it is.
+    """
+
+    def __init__(self, elements):
+        self._elements_tuple = None
+        if isinstance(elements, (list, tuple, set, frozenset)):
+            self.index_values = tuple(elements)
+            if all(_is_hashable(element) for element in elements):
+                self._elements_tuple = self.index_values
+                elements = frozenset(elements)
+            if elements and all(type(element) in _NUMERIC_TYPECODES for element in elements):
+                numeric_elements = list(elements)
+                self.vectorized = lambda values: numpy.isin(values, numeric_elements)
+        self.elements = elements
+
+    def __call__(self, argument):
+        try:
+            return argument in self.elements
+        except TypeError:
+            if self._elements_tuple is None:
+                raise
+            # An unhashable argument, which may still compare equal to one of the (hashable) elements.
+            return argument in self._elements_tuple
+
+    def __repr__(self):
+        elements = self.elements
+        if isinstance(elements, frozenset):
+            elements = sorted(elements, key=repr)
+        return "any_of({0})".format(_max_length_repr(elements, 200))
+
+
+class ContainsPredicate(ArgumentPredicate):
+    """
+    Matches arguments which contain an element (see contains()).
+    """
+    def __init__(self, element):
+        self.element = element
+
+    def __call__(self, argument):
+        try:
+            return self.element in argument
+        except:
+            return False
+
+    def __repr__(self):
+        return "contains({0})".format(_max_length_repr(self.element, 80))
+
+
+class IdenticalToPredicate(ArgumentPredicate):
+    """
+    Matches the very same object as an element (see identical_to()).
+    """
+
+    def __init__(self, element):
+        self.element = element
+
+    def __call__(self, argument):
+        return self.element is argument
+
+    def __repr__(self):
+        return "identical_to({0})".format(_max_length_repr(self.element, 80))
+
+
+class InstanceOfPredicate(ArgumentPredicate):
+    """
+    Matches instances of a class, or of any class of a tuple of classes (see instance_of()).
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+
+    def __call__(self, argument):
+        return isinstance(argument, self.cls)
+
+    def __repr__(self):
+        if isinstance(self.cls, tuple):
+            return "instance_of(({0}))".format(", ".join(cls.__name__ for cls in self.cls))
+        return "instance_of({0})".format(self.cls.__name__)
+
+
+class InRangePredicate(ArgumentPredicate):
+    """
+    Matches arguments within bounds (see in_range()). Arguments which cannot be compared to the bounds do not match.
+    """
+
+    def __init__(self, lower=None, upper=None, inclusive=False):
+        self.lower = lower
+        self.upper = upper
+        self.inclusive = inclusive
+        if all(bound is None or type(bound) in _NUMERIC_TYPECODES for bound in (lower, upper)):
+            self.vectorized = self._vectorized
+
+    def __call__(self, argument):
+        try:
+            if self.lower is not None and not self.lower <= argument:
+                return False
+            if self.upper is not None:
+                return argument <= self.upper if self.inclusive else argument < self.upper
+            return True
+        except TypeError:
+            return False
+
+    def _vectorized(self, values):
+        mask = numpy.ones(len(values), dtype=bool)
+        if self.lower is not None:
+            mask &= values >= self.lower
+        if self.upper is not None:
+            mask &= (values <= self.upper) if self.inclusive else (values < self.upper)
+        return mask
+
+    def intersect(self, other):
+        """
+        Build the range of the arguments within both this range and another.
+
+        :param other: The other InRangePredicate.
+        :return: A new InRangePredicate.
+        :raises: TypeError if the bounds of the ranges cannot be compared.
+        """
+        if self.lower is None or other.lower is None:
+            lower = other.lower if self.lower is None else self.lower
+        else:
+            lower = max(self.lower, other.lower)
+        if self.upper is None or other.upper is None:
+            upper, inclusive = (other.upper, other.inclusive) if self.upper is None else (self.upper, self.inclusive)
+        elif self.upper == other.upper:
+            upper, inclusive = self.upper, self.inclusive and other.inclusive
+        else:
+            upper, inclusive = min((self.upper, self.inclusive), (other.upper, other.inclusive),
+                                   key=lambda bound: bound[0])
+        return InRangePredicate(lower, upper, inclusive)
+
+    def __repr__(self):
+        return "in_range({0}, {1}{2})".format(
+            _max_length_repr(self.lower, 80), _max_length_repr(self.upper, 80), ", inclusive=True" if self.inclusive
+            else ""
+        )
+
+
+class RegexPredicate(ArgumentPredicate):
+    """
+    Matches strings in which a regular expression can be found (see matches_regex()).
+    """
+
+    def __init__(self, pattern, flags=0):
+        self.pattern = re.compile(pattern, flags)
+
+    def __call__(self, argument):
+        try:
+            return self.pattern.search(argument) is not None
+        except TypeError:
+            return False
+
+    def __repr__(self):
+        return "matches_regex({0!r})".format(self.pattern.pattern)
+
+
+class AllOfPredicate(ArgumentPredicate):
+    """
+    Matches arguments which satisfy every one of a number of predicates (see all_of()), which are checked in the
+    order they were given, until one fails. Simplifying never reorders them, so an earlier predicate may guard a
+    later one (i.e. all_of(instance_of(str), my_string_check)).
+    """
+    def __init__(self, *predicates):
+        self.predicates = predicates
+        indexed = [predicate.index_values for predicate in predicates
+                   if getattr(predicate, "index_values", None) is not None]
+        if indexed:
+            # Every accepted argument is accepted by each of those predicates, so the smallest of them will do.
+            self.index_values = min(indexed, key=len)
+        vectorized = [getattr(predicate, "vectorized", None) for predicate in predicates]
+        if predicates and all(vectorized):
+            self.vectorized = lambda values: numpy.logical_and.reduce([function(values) for function in vectorized])
+
+    def __call__(self, argument):
+        for predicate in self.predicates:
+            if not predicate(argument):
+                return False
+        return True
+
+    def simplify(self):
+        """
+        Flatten nested all_of() predicates, drop anything, and intersect in_range() predicates (in place of the
+        first of them). The order of the predicates is otherwise kept as it is.
+
+        :return: The simplified predicate.
+        """
+        predicates = []
+        for predicate in self.predicates:
+            predicate = simplify_predicate(predicate)
+            if predicate is anything:
+                continue
+            elif isinstance(predicate, AllOfPredicate):
+                predicates.extend(predicate.predicates)
+            else:
+                predicates.append(predicate)
+        ranges = [predicate for predicate in predicates if isinstance(predicate, InRangePredicate)]
+        if len(ranges) > 1:
+            try:
+                merged = ranges[0]
+                for other in ranges[1:]:
+                    merged = merged.intersect(other)
+                predicates = [merged if predicate is ranges[0] else predicate for predicate in predicates
+                              if predicate is ranges[0] or not isinstance(predicate, InRangePredicate)]
+            except TypeError:
+                pass
+        if not predicates:
+            return anything
+        elif len(predicates) == 1:
+            return predicates[0]
+        return AllOfPredicate(*predicates)
+
+    def __repr__(self):
+        return "all_of({0})".format(", ".join(_predicate_repr(predicate) for predicate in self.predicates))
+
+
+class EitherPredicate(ArgumentPredicate):
+    """
+    Matches arguments which satisfy at least one of a number of predicates (see either()), which are checked in
+    the order they were given, until one succeeds. As for all_of(), simplifying never reorders them.
+    """
+    def __init__(self, *predicates):
+        self.predicates = predicates
+        indexed = [getattr(predicate, "index_values", None) for predicate in predicates]
+        if predicates and all(values is not None for values in indexed):
+            self.index_values = tuple(chain.from_iterable(indexed))
+        vectorized = [getattr(predicate, "vectorized", None) for predicate in predicates]
+        if predicates and all(vectorized):
+            self.vectorized = lambda values: numpy.logical_or.reduce([function(values) for function in vectorized])
+
+    def __call__(self, argument):
+        for predicate in self.predicates:
+            if predicate(argument):
+                return True
+        return False
+
+    def simplify(self):
+        """
+        Flatten nested either() predicates, reduce to anything if anything is one of them, and merge the equal_to()
+        and any_of() predicates over hashable elements into a single any_of() (in place of the first of them). The
+        order of the predicates is otherwise kept as it is.
+
+        :return: The simplified predicate.
+        """
+        predicates = []
+        for predicate in self.predicates:
+            predicate = simplify_predicate(predicate)
+            if predicate is anything:
+                return anything
+            elif isinstance(predicate, EitherPredicate):
+                predicates.extend(predicate.predicates)
+            else:
+                predicates.append(predicate)
+        elements, merged = [], []
+        for predicate in predicates:
+            if isinstance(predicate, EqualToPredicate) and _is_hashable(predicate.element):
+                elements.append(predicate.element)
+                merged.append(predicate)
+            elif isinstance(predicate, AnyOfPredicate) and isinstance(predicate.elements, frozenset):
+                elements.extend(predicate.index_values)
+                merged.append(predicate)
+        if len(merged) > 1:
+            predicates = [AnyOfPredicate(elements) if predicate is merged[0] else predicate for predicate in predicates
+                          if predicate is merged[0] or not any(predicate is other for other in merged)]
+        if not predicates:
+            return self
+        elif len(predicates) == 1:
+            return predicates[0]
+        return EitherPredicate(*predicates)
+
+    def __repr__(self):
+        return "either({0})".format(", ".join(_predicate_repr(predicate) for predicate in self.predicates))
+
+
+class NotPredicate(ArgumentPredicate):
+    """
+    Matches arguments which do not satisfy a predicate (see not_()).
+    """
+    def __init__(self, predicate):
+        self.predicate = predicate
+        vectorized = getattr(predicate, "vectorized", None)
+        if vectorized is not None:
+            self.vectorized = lambda values: numpy.logical_not(vectorized(values))
+
+    def __call__(self, argument):
+        return not self.predicate(argument)
+
+    def simplify(self):
+        """
+        Cancel out double negation.
+
+        :return: The simplified predicate.
+        """
+        predicate = simplify_predicate(self.predicate)
+        if isinstance(predicate, NotPredicate):
+            return predicate.predicate
+        return NotPredicate(predicate)
+
+    def __repr__(self):
+        return "not_({0})".format(_predicate_repr(self.predicate))
+
+
 def any_of(elements):
     """
     Check to see if the argument is contained in a list of possible elements.
@@ -607,9 +3336,7 @@ def any_of(elements):
     :param elements: The elements to check the argument against in the predicate.
     :return: A predicate to check if the argument is a constituent element.
     """
-    def predicate(argument):
-        return argument in elements
-    return predicate
+    return AnyOfPredicate(elements)
 
 
 def equal_to(element):
@@ -619,9 +3346,7 @@ def equal_to(element):
     :param element: The element to check against the argument.
     :return: A predicate to check if the argument is equal to the element.
     """
-    def predicate(argument):
-        return argument == element
-    return predicate
+    return EqualToPredicate(element)
 
 
 def contains(element):
@@ -631,12 +3356,7 @@ def contains(element):
     :param element: The element to check against.
     :return: A predicate to check if the argument is equal to the element.
     """
-    def predicate(argument):
-        try:
-            return element in argument
-        except:
-            return False
-    return predicate
+    return ContainsPredicate(element)
 
 
 def identical_to(element):
@@ -646,9 +3366,7 @@ def identical_to(element):
     :param element: The element to check against the argument.
     :return: A predicate to check if the argument is identical to the element.
     """
-    def predicate(argument):
-        return element is argument
-    return predicate
+    return IdenticalToPredicate(element)
 
 
 def instance_of(cls):
@@ -658,6 +3376,58 @@ def instance_of(cls):
     :param cls: The element to use to check inheritance of the argument.
     :return: A predicate to check if the argument an instance of the element.
     """
-    def predicate(argument):
-        return isinstance(argument, cls)
-    return predicate
+    return InstanceOfPredicate(cls)
+
+
+def in_range(lower=None, upper=None, inclusive=False):
+    """
+    Check to see if the argument is within a range, as for range(): from lower (inclusive) up to upper (exclusive,
+    unless inclusive is set).
+
+    :param lower: (OPTIONAL) The lowest matching value. None for no lower bound.
+    :param upper: (OPTIONAL) The upper bound. None for no upper bound.
+    :param inclusive: True if the upper bound itself matches, False otherwise.
+    :return: A predicate to check if the argument is within the range.
+    """
+    return InRangePredicate(lower, upper, inclusive)
+
+
+def matches_regex(pattern, flags=0):
+    """
+    Check to see if a regular expression can be found in the argument (with re.search()).
+
+    :param pattern: The regular expression, as a string or a compiled pattern.
+    :param flags: (OPTIONAL) The re flags to compile a string pattern with.
+    :return: A predicate to check if the argument is a string matching the regular expression.
+    """
+    return RegexPredicate(pattern, flags)
+
+
+def all_of(*predicates):
+    """
+    Check to see if the argument satisfies every one of several predicates.
+
+    :param predicates: The arity 1 predicates to check the argument against.
+    :return: A predicate to check if the argument satisfies all of the predicates.
+    """
+    return AllOfPredicate(*predicates)
+
+
+def either(*predicates):
+    """
+    Check to see if the argument satisfies at least one of several predicates.
+
+    :param predicates: The arity 1 predicates to check the argument against.
+    :return: A predicate to check if the argument satisfies any of the predicates.
+    """
+    return EitherPredicate(*predicates)
+
+
+def not_(predicate):
+    """
+    Check to see if the argument does not satisfy a predicate.
+
+    :param predicate: The arity 1 predicate to check the argument against.
+    :return: A predicate to check if the argument does not satisfy the predicate.
+    """
+    return NotPredicate(predicate)
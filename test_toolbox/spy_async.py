@@ -0,0 +1,125 @@
+"""
+This module contains the asyncio support for the Spy module. It is imported by test_toolbox.spy on Python 3.6 and
+later, and should not usually need to be used directly.
+
+Included are:
+
+* record_awaited() -- Awaits a coroutine returned by a spied coroutine function, then records the awaited result
+    and the time spent awaiting it.
+* SpiedAsyncIterator -- Wraps an async generator returned by a spied async generator function, and records the items
+    it yields as they are consumed.
+* SpiedAsyncContextManager -- Wraps an async context manager returned by a spied async context manager factory
+    (i.e. a function decorated with contextlib.asynccontextmanager), and records the value it enters.
+* is_async_context_manager_factory() -- Tells the factories made by contextlib.asynccontextmanager from other
+    callables, including plain decorators (i.e. functools.wraps) of async generator functions.
+"""
+from test_toolbox.helpers import perf_counter_ns
+
+try:
+    from contextlib import asynccontextmanager as _asynccontextmanager
+except ImportError:
+    # Python 3.6, which has no asynccontextmanager.
+    _asynccontextmanager = None
+
+
+async def _probe():
+    yield
+
+
+# Every factory made by asynccontextmanager is a closure over the same nested helper function, and so shares its
+# code object, which then marks such factories apart from any other function that merely wraps an async generator.
+_ASYNC_CONTEXT_MANAGER_FACTORY_CODE = None if _asynccontextmanager is None else \
+    _asynccontextmanager(_probe).__code__
+
+
+def is_async_context_manager_factory(func):
+    """
+    Check whether a callable is an async context manager factory made by contextlib.asynccontextmanager.
+
+    :param func: The callable to check.
+    :return: True if it is such a factory, False otherwise.
+    """
+    code = getattr(func, "__code__", None)
+    return code is not None and code is _ASYNC_CONTEXT_MANAGER_FACTORY_CODE
+
+
+async def record_awaited(spy, args, kwargs, awaitable):
+    """
+    Await an awaitable on behalf of a Spy, and record the awaited result once it is available.
+
+    :param spy: The Spy to record the invocation with.
+    :param args: The positional arguments of the invocation.
+    :param kwargs: The keyword arguments of the invocation.
+    :param awaitable: The awaitable returned by the spied callable.
+    :return: The awaited result.
+    """
+    start = perf_counter_ns()
+    result = await awaitable
+    spy.record_invocation(args, kwargs, result, latency_ns=perf_counter_ns() - start)
+    return result
+
+
+class SpiedAsyncIterator(object):
+    """
+    An async iterator wrapper, which records the items yielded by the wrapped async iterator as they are consumed.
+    Any other attributes (i.e. asend(), athrow() and aclose() on an async generator) are passed through.
+    This is the async counterpart of test_toolbox.spy.SpiedIterator.
+
+    :param iterator: The async iterator to wrap.
+    :param max_items: (OPTIONAL) The maximum number of yielded items to keep; only the first max_items are kept, but
+        every item is counted. Default: None (keep every item)
+    """
+    def __init__(self, iterator, max_items=None):
+        self.iterator = iterator
+        self.max_items = max_items
+        self.items = []
+        self.count = 0
+        self.exhausted = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            item = await self.iterator.__anext__()
+        except StopAsyncIteration:
+            self.exhausted = True
+            raise
+        self.count += 1
+        if self.max_items is None or len(self.items) < self.max_items:
+            self.items.append(item)
+        return item
+
+    def __getattr__(self, name):
+        return getattr(self.iterator, name)
+
+    def __repr__(self):
+        return "SpiedAsyncIterator(count={0!r}, items={1!r}, exhausted={2!r})".format(
+            self.count, self.items, self.exhausted
+        )
+
+
+class SpiedAsyncContextManager(object):
+    """
+    An async context manager wrapper, which records an invocation with a Spy when the wrapped context manager is
+    entered, using the entered value as the result.
+
+    :param spy: The Spy to record the invocation with.
+    :param args: The positional arguments of the invocation.
+    :param kwargs: The keyword arguments of the invocation.
+    :param context_manager: The async context manager returned by the spied callable.
+    """
+    def __init__(self, spy, args, kwargs, context_manager):
+        self.spy = spy
+        self.args = args
+        self.kwargs = kwargs
+        self.context_manager = context_manager
+
+    async def __aenter__(self):
+        start = perf_counter_ns()
+        value = await self.context_manager.__aenter__()
+        self.spy.record_invocation(self.args, self.kwargs, value, latency_ns=perf_counter_ns() - start)
+        return value
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return await self.context_manager.__aexit__(exc_type, exc_value, traceback)
@@ -0,0 +1,234 @@
+"""
+This module contains the on-disk invocation log of the Spy module. A Spy created with the invocation_log option
+streams its invocations into an append-only log file instead of keeping them in memory, so resident memory stays
+flat however long the test runs, and the log can be reopened afterwards for offline analysis (see
+test_toolbox.spy.open_invocation_log()). It is imported by test_toolbox.spy when needed, and should not usually
+need to be used directly.
+
+Included are:
+
+* InvocationLogStore -- An invocation store backed by an append-only log file of pickled invocation records, read
+    back through a memory map.
+* UnpicklableValue -- Stands in for a recorded value that could not be pickled.
+
+The log format is a magic string, followed by a header record holding the argspec of the spied callable, followed
+by one record per invocation. Every record is a little endian 32 bit length, followed by that many bytes of pickle.
+"""
+from array import array
+from collections import namedtuple
+import errno
+from itertools import islice
+import mmap
+import os
+import struct
+import sys
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from test_toolbox.spy import SpyArgSpec, TargetInvocation, _max_length_repr
+
+UnpicklableValue = namedtuple("UnpicklableValue", ["type_name", "repr"])
+
+_MAGIC = b"TTSPYLOG\x01"
+_LENGTH = struct.Struct("<I")
+_CHECKPOINT_EVERY = 1024
+_OFFSET_TYPECODE = 'l' if sys.version_info[0] == 2 else 'q'
+
+
+def _picklable(value):
+    try:
+        pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return value
+    except Exception:
+        return UnpicklableValue(type(value).__name__, _max_length_repr(value, 200))
+
+
+def _dumps(args, kwargs, result):
+    try:
+        return pickle.dumps((args, kwargs, result), pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        # Only pay for the per value fallback when something in the record cannot be pickled.
+        return pickle.dumps((
+            tuple(_picklable(value) for value in args),
+            dict((name, _picklable(value)) for name, value in kwargs.items()),
+            _picklable(result)
+        ), pickle.HIGHEST_PROTOCOL)
+
+
+def _picklable_argspec(argspec):
+    # The defaults of the spied callable may be anything (i.e. a lambda or a lock), so they get the same per value
+    # fallback as recorded values do.
+    return argspec._replace(
+        defaults=None if argspec.defaults is None else tuple(_picklable(value) for value in argspec.defaults),
+        kwonlydefaults=None if argspec.kwonlydefaults is None else dict(
+            (name, _picklable(value)) for name, value in argspec.kwonlydefaults.items()
+        )
+    )
+
+
+class InvocationLogStore(object):
+    """
+    An invocation store which appends every recorded invocation to a log file, and keeps only a count and a sparse
+    index (the file offset of every 1024th record) in memory. Iterating over the store (and so every Spy query)
+    streams the invocations back from the file through a memory map, as TargetInvocation records.
+
+    Recorded values are pickled; any value that cannot be is recorded as an UnpicklableValue, holding its type name
+    and a bounded repr. The log is written through a buffer, which is flushed before every read, and by flush().
+
+    :param path: The path of the log file.
+    :param argspec: (OPTIONAL) The argspec of the spied callable, kept in the header of a new log. Required unless
+        reopening an existing log.
+    :param append: True to reopen an existing log (if there is one) and keep appending to it, False to start a new
+        log, replacing any existing file. A reopened log is only opened for writing by the first record(), which
+        also drops any partially written trailing record (i.e. from a crashed run).
+    :raises: IOError if asked to reopen a log that does not exist without an argspec to start a new one with,
+        ValueError if asked to start a new log without an argspec. The file system is left untouched in both cases.
+    """
+    def __init__(self, path, argspec=None, append=False):
+        self.path = path
+        self._file = None
+        self._closed = False
+        if append and os.path.exists(path):
+            self._reopen()
+            return
+        if argspec is None:
+            if append:
+                raise IOError(errno.ENOENT, "No such Spy invocation log", path)
+            raise ValueError("Starting the invocation log {0} needs the argspec of the spied callable.".format(path))
+        self.argspec = argspec
+        self.clear()
+
+    def clear(self):
+        """
+        Remove every recorded invocation, by starting a new (empty) log in place of the old one.
+
+        :return: None
+        """
+        self.close()
+        self._closed = False
+        self._file = open(self.path, "wb")
+        header = pickle.dumps(tuple(_picklable_argspec(self.argspec)), pickle.HIGHEST_PROTOCOL)
+        self._file.write(_MAGIC + _LENGTH.pack(len(header)) + header)
+        self._end_offset = self._file.tell()
+        self._length = 0
+        self._checkpoints = array(_OFFSET_TYPECODE)
+
+    def _reopen(self):
+        with open(self.path, "rb") as log:
+            if log.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError("{0} is not a Spy invocation log.".format(self.path))
+            header_length, = _LENGTH.unpack(log.read(_LENGTH.size))
+            self.argspec = SpyArgSpec(*pickle.loads(log.read(header_length)))
+        self._end_offset = len(_MAGIC) + _LENGTH.size + header_length
+        self._length = 0
+        self._checkpoints = array(_OFFSET_TYPECODE)
+        for offset, payload in self._scan(self._end_offset):
+            self._add_record(offset, len(payload))
+
+    def _add_record(self, offset, payload_length):
+        if self._length % _CHECKPOINT_EVERY == 0:
+            self._checkpoints.append(offset)
+        self._length += 1
+        self._end_offset = offset + _LENGTH.size + payload_length
+
+    def record(self, args, kwargs, result):
+        """
+        Append a single invocation to the log.
+
+        :param args: The positional arguments of the invocation.
+        :param kwargs: The keyword arguments of the invocation.
+        :param result: The result of the invocation.
+        :return: None
+        """
+        if self._file is None:
+            if self._closed:
+                raise ValueError("The invocation log {0} is closed.".format(self.path))
+            self._file = open(self.path, "r+b")
+            self._file.truncate(self._end_offset)
+            self._file.seek(self._end_offset)
+        payload = _dumps(args, kwargs, result)
+        self._file.write(_LENGTH.pack(len(payload)) + payload)
+        self._add_record(self._end_offset, len(payload))
+
+    def flush(self):
+        """
+        Flush the buffered records to the log file, i.e. before handing it over to another process.
+
+        :return: None
+        """
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        """
+        Flush and close the log file. The store may still be read, but no longer recorded into (until it is
+        cleared, which starts a new log).
+
+        :return: None
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._closed = True
+
+    def _scan(self, start_offset, count=None):
+        # Stream (offset, payload) pairs through a memory map, stopping at count records, or at the first
+        # incomplete one.
+        self.flush()
+        if count == 0 or os.path.getsize(self.path) <= start_offset:
+            return
+        with open(self.path, "rb") as log:
+            log_map = mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                size = len(log_map)
+                offset = start_offset
+                while offset + _LENGTH.size <= size and count != 0:
+                    length, = _LENGTH.unpack_from(log_map, offset)
+                    end = offset + _LENGTH.size + length
+                    if end > size:
+                        break
+                    yield offset, log_map[offset + _LENGTH.size:end]
+                    offset = end
+                    if count is not None:
+                        count -= 1
+            finally:
+                log_map.close()
+
+    def _iter_from(self, index):
+        checkpoint = index // _CHECKPOINT_EVERY
+        skip = index - checkpoint * _CHECKPOINT_EVERY
+        records = self._scan(self._checkpoints[checkpoint], self._length - checkpoint * _CHECKPOINT_EVERY)
+        for _, payload in records:
+            if skip:
+                skip -= 1
+            else:
+                yield TargetInvocation(*pickle.loads(payload))
+
+    def invocations_since(self, cursor):
+        """
+        Access the invocations recorded since an earlier call (see IncrementalQuery), streamed from the nearest
+        checkpoint rather than from the start of the log.
+
+        :param cursor: The cursor returned by the earlier call, or None for every invocation.
+        :return: An (iterator of TargetInvocation records, cursor) pair.
+        """
+        start, end = cursor or 0, self._length
+        if start >= end:
+            return iter(()), end
+        return islice(self._iter_from(start), end - start), end
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return self._iter_from(0) if self._length else iter(())
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("invocation index out of range")
+        return next(self._iter_from(index))
@@ -0,0 +1,234 @@
+"""
+This module contains the cross-process invocation store of the Spy module. A Spy created with the process_safe
+option keeps recording when it is called in a worker process forked from the process which created it (i.e. by
+multiprocessing.Pool or concurrent.futures.ProcessPoolExecutor): workers ship their invocation records back to the
+creating process in batches, so the usual queries and assertions run there over the calls of every worker. It is
+imported by test_toolbox.spy when needed, and should not usually need to be used directly.
+
+Included are:
+
+* ProcessInvocationStore -- An invocation store which gathers the invocations recorded in forked worker processes.
+* ProcessInvocation -- An invocation, along with the id of the process that recorded it.
+
+Workers only inherit Spies through fork, so the "fork" start method must be used (the default on Linux, or i.e.
+ProcessPoolExecutor(mp_context=multiprocessing.get_context("fork"))). Spies created in a worker record in that
+worker only.
+"""
+from collections import namedtuple
+import multiprocessing
+from multiprocessing.util import Finalize
+import os
+import threading
+import weakref
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from test_toolbox.spy import TargetInvocation
+from test_toolbox.spy_log import _picklable
+
+ProcessInvocation = namedtuple("ProcessInvocation", ["pid", "invocation"])
+
+_COLLECTOR = [None]
+_COLLECTOR_LOCK = threading.Lock()
+
+
+def _dumps_batch(token, pid, batch):
+    try:
+        return pickle.dumps((token, pid, batch), pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        # Only pay for the per value fallback when something in the batch cannot be pickled.
+        return pickle.dumps((token, pid, [(
+            tuple(_picklable(value) for value in args),
+            dict((name, _picklable(value)) for name, value in kwargs.items()),
+            _picklable(result)
+        ) for args, kwargs, result in batch]), pickle.HIGHEST_PROTOCOL)
+
+
+class _ProcessCollector(object):
+    """
+    The receiving end of the batches sent by worker processes, shared by every ProcessInvocationStore created in
+    a process. Workers write to a single pipe, under a process shared lock so that batches are never interleaved.
+    A daemon thread keeps reading that pipe, so a worker flushing a batch never blocks on a full pipe (i.e. while
+    the parent waits for it to exit), and every query reads whatever the thread has not got to yet, so any batch
+    flushed before the query started is seen by it.
+    """
+    def __init__(self):
+        self.owner_pid = os.getpid()
+        self._reader, self._writer = multiprocessing.Pipe(duplex=False)
+        self._write_lock = multiprocessing.Lock()
+        self._lock = threading.Lock()
+        self._stores = weakref.WeakValueDictionary()
+        self._num_tokens = 0
+        self._thread = None
+
+    def register(self, store):
+        with self._lock:
+            self._num_tokens += 1
+            self._stores[self._num_tokens] = store
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._drain_forever, name="SpyProcessCollector")
+                self._thread.daemon = True
+                self._thread.start()
+            return self._num_tokens
+
+    def send(self, payload):
+        with self._write_lock:
+            self._writer.send_bytes(payload)
+
+    def drain(self):
+        with self._lock:
+            while self._reader.poll():
+                token, pid, batch = pickle.loads(self._reader.recv_bytes())
+                store = self._stores.get(token)
+                if store is not None:
+                    store._receive(pid, batch)
+
+    def _drain_forever(self):
+        while True:
+            self._reader.poll(None)
+            self.drain()
+
+
+def _get_collector():
+    with _COLLECTOR_LOCK:
+        collector = _COLLECTOR[0]
+        if collector is None or collector.owner_pid != os.getpid():
+            collector = _COLLECTOR[0] = _ProcessCollector()
+        return collector
+
+
+class _WorkerBatch(object):
+    """
+    The invocations recorded in a worker process that have not been sent yet.
+    """
+    def __init__(self, store):
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.invocations = []
+        # Run at the normal exit of the worker (as multiprocessing workers skip atexit).
+        self.finalizer = Finalize(store, store.flush, exitpriority=10)
+
+
+class ProcessInvocationStore(object):
+    """
+    An invocation store for callables invoked in forked worker processes. In the process which created the store,
+    invocations are recorded as usual. In any process forked from it, they are buffered and sent back to that
+    process in batches of batch_size invocations; a partial batch is sent when the worker exits normally, or when
+    flush() is called in the worker. The invocations of workers are appended in the order their batches arrive.
+
+    Calls made in a worker are only seen once their batch has been sent, so use a batch_size of 1, or let the
+    workers exit (i.e. leave the "with" block of a ProcessPoolExecutor, or close() and join() a Pool; terminate()
+    kills the workers before they can send their last batch) before making assertions.
+
+    :param batch_size: The number of invocations a worker buffers before sending them. Default: 64
+    """
+    def __init__(self, batch_size=64):
+        self.batch_size = batch_size
+        self._collector = _get_collector()
+        self._owner_pid = self._collector.owner_pid
+        self._token = self._collector.register(self)
+        self._batch = None
+        self.clear()
+
+    def clear(self):
+        """
+        Remove all of the recorded invocations from this store (or, in a worker, the invocations not sent yet).
+        Batches still in flight from workers may be received after a clear.
+
+        :return: None
+        """
+        if os.getpid() == self._owner_pid:
+            self._invocations = []
+        elif self._batch is not None and self._batch.pid == os.getpid():
+            with self._batch.lock:
+                del self._batch.invocations[:]
+
+    def _worker_batch(self):
+        batch = self._batch
+        if batch is None or batch.pid != os.getpid():
+            # First call in this worker: forget whatever was pending in the process it was forked from.
+            batch = self._batch = _WorkerBatch(self)
+        return batch
+
+    def record(self, args, kwargs, result):
+        """
+        Record a single invocation, or buffer it to be sent if this is a worker.
+
+        :param args: The positional arguments of the invocation.
+        :param kwargs: The keyword arguments of the invocation.
+        :param result: The result of the invocation.
+        :return: None
+        """
+        if os.getpid() == self._owner_pid:
+            self._invocations.append(ProcessInvocation(self._owner_pid, TargetInvocation(args, kwargs, result)))
+            return
+        batch = self._worker_batch()
+        with batch.lock:
+            batch.invocations.append((args, kwargs, result))
+            if len(batch.invocations) < self.batch_size:
+                return
+            invocations, batch.invocations = batch.invocations, []
+        self._collector.send(_dumps_batch(self._token, batch.pid, invocations))
+
+    def flush(self):
+        """
+        Send the invocations buffered in this worker to the process which created the store. Does nothing in that
+        process itself.
+
+        :return: None
+        """
+        batch = self._batch
+        if batch is None or batch.pid != os.getpid():
+            return
+        with batch.lock:
+            invocations, batch.invocations = batch.invocations, []
+        if invocations:
+            self._collector.send(_dumps_batch(self._token, batch.pid, invocations))
+
+    def _receive(self, pid, batch):
+        self._invocations.extend(ProcessInvocation(pid, TargetInvocation(*invocation)) for invocation in batch)
+
+    def by_process(self):
+        """
+        Access the recorded invocations, along with the process that recorded each of them.
+
+        :return: The list of ProcessInvocation records received so far, in arrival order.
+        """
+        if os.getpid() == self._owner_pid:
+            self._collector.drain()
+        return list(self._invocations)
+
+    def snapshot(self):
+        """
+        Access the recorded invocations.
+
+        :return: The list of TargetInvocation records received so far, in arrival order.
+        """
+        return [entry.invocation for entry in self.by_process()]
+
+    def invocations_since(self, cursor):
+        """
+        Access the invocations received since an earlier call (see IncrementalQuery).
+
+        :param cursor: The cursor returned by the earlier call, or None for every invocation.
+        :return: A (list of TargetInvocation records, cursor) pair.
+        """
+        if os.getpid() == self._owner_pid:
+            self._collector.drain()
+        invocations = self._invocations
+        end = len(invocations)
+        return [entry.invocation for entry in invocations[cursor or 0:end]], end
+
+    def __len__(self):
+        if os.getpid() == self._owner_pid:
+            self._collector.drain()
+        return len(self._invocations)
+
+    def __getitem__(self, index):
+        return self.by_process()[index].invocation
+
+    def __iter__(self):
+        return iter(self.snapshot())
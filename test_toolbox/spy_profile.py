@@ -0,0 +1,257 @@
+"""
+This module contains a lightweight call-graph profiler for spied code. A SpyProfiler is handed to Spies with their
+profiler option (i.e. spy_module(my_module, profiler=profiler)), and from then on every call through those Spies
+is timed, along with the spied caller it was made from. Only spied callables are profiled, so a suite that already
+spies on the code under test gets its hot paths without a separate (and much slower) cProfile pass.
+
+Included are:
+
+* SpyProfiler -- Collects call counts, exclusive and inclusive times, and caller/callee edges of spied callables.
+    It exports collapsed stacks (for flamegraph.pl, speedscope and the like), and pstats compatible statistics:
+    pstats.Stats(profiler) works as it would for a cProfile.Profile.
+* FunctionProfile -- The statistics of a single spied callable, as reported by SpyProfiler.function_stats().
+"""
+from collections import namedtuple, OrderedDict
+import marshal
+import threading
+
+from test_toolbox.helpers import perf_counter_ns
+
+FunctionProfile = namedtuple("FunctionProfile", ["calls", "primitive_calls", "exclusive_ns", "inclusive_ns"])
+
+
+def _function_label(func):
+    module = getattr(func, "__module__", None) or "~"
+    name = getattr(func, "__qualname__", None) or getattr(func, "__name__", None) or repr(func)
+    return "{0}.{1}".format(module, name)
+
+
+def _function_key(func):
+    code = getattr(func, "__code__", None)
+    if code is None:
+        # The same convention as cProfile, for built-in functions.
+        return "~", 0, "<built-in method {0}>".format(getattr(func, "__name__", repr(func)))
+    return code.co_filename, code.co_firstlineno, getattr(func, "__qualname__", code.co_name)
+
+
+class _CallNode(object):
+    """
+    A node of the call tree of a thread: one distinct stack of spied calls. A node is on the stack at most once at a
+    time, so it also holds the timing of its call in progress, and entering or leaving a call does not allocate.
+    """
+    __slots__ = ("label", "parent", "children", "recursive", "calls", "exclusive_ns", "inclusive_ns",
+                 "start_ns", "child_ns")
+
+    def __init__(self, label, parent):
+        self.label = label
+        self.parent = parent
+        self.children = {}
+        self.recursive = False
+        ancestor = parent
+        while ancestor is not None:
+            if ancestor.label == label:
+                self.recursive = True
+                break
+            ancestor = ancestor.parent
+        self.calls = self.exclusive_ns = self.inclusive_ns = self.start_ns = self.child_ns = 0
+
+    def path(self):
+        labels = []
+        node = self
+        while node.label is not None:
+            labels.append(node.label)
+            node = node.parent
+        return tuple(reversed(labels))
+
+    def walk(self):
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.children.values())
+            yield node
+
+
+class _ThreadState(threading.local):
+    def __init__(self, roots, lock):
+        self.current = _CallNode(None, None)
+        with lock:
+            roots.append(self.current)
+
+
+class SpyProfiler(object):
+    """
+    A SpyProfiler times every call made through the Spies it is attached to (see the profiler option of Spy).
+    Each thread builds its own tree of spied calls, so nested calls are attributed to their spied caller without
+    any locking; the statistics are aggregated from those trees when they are exported. Callables are identified
+    by their qualified name (i.e. "package.module.Class.method"), so the per instance Spies of a method all report
+    together.
+
+    Times are inclusive (the whole call) and exclusive (minus the time spent in spied callees). As with cProfile,
+    the inclusive time of a recursive callable only counts its outermost call. Calls which raise are timed too.
+    Coroutine functions are timed until they return their coroutine, not until it is awaited.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._roots = []
+        self._local = _ThreadState(self._roots, self._lock)
+        self._labels = {}
+        self.keys = {}
+
+    def reset(self):
+        """
+        Forget everything profiled so far. Calls in progress are still timed, into the emptied profile.
+
+        :return: True
+        """
+        for node in self._nodes():
+            node.calls = node.exclusive_ns = node.inclusive_ns = 0
+        return True
+
+    def enter(self, spy):
+        """
+        Start timing a call through a Spy. Every enter() must be followed by an exit() on the same thread.
+
+        :param spy: The Spy being called.
+        :return: None
+        """
+        func = spy.target_func
+        label = self._labels.get(func)
+        if label is None:
+            label = _function_label(func)
+            with self._lock:
+                self.keys.setdefault(label, _function_key(func))
+            self._labels[func] = label
+        state = self._local
+        parent = state.current
+        node = parent.children.get(label)
+        if node is None:
+            node = parent.children[label] = _CallNode(label, parent)
+        node.child_ns = 0
+        state.current = node
+        node.start_ns = perf_counter_ns()
+
+    def exit(self):
+        """
+        Stop timing the innermost call started with enter() on this thread.
+
+        :return: The duration of that call, in nanoseconds.
+        """
+        end_ns = perf_counter_ns()
+        state = self._local
+        node = state.current
+        elapsed_ns = end_ns - node.start_ns
+        node.calls += 1
+        node.exclusive_ns += elapsed_ns - node.child_ns
+        if not node.recursive:
+            node.inclusive_ns += elapsed_ns
+        parent = node.parent
+        parent.child_ns += elapsed_ns
+        state.current = parent
+        return elapsed_ns
+
+    def _nodes(self):
+        with self._lock:
+            roots = list(self._roots)
+        for root in roots:
+            for node in root.walk():
+                if node.label is not None:
+                    yield node
+
+    @staticmethod
+    def _accumulate(table, key, node):
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = [0, 0, 0, 0]
+        stats[0] += node.calls
+        stats[1] += 0 if node.recursive else node.calls
+        stats[2] += node.exclusive_ns
+        stats[3] += node.inclusive_ns
+
+    def _aggregate(self):
+        functions, edges = {}, {}
+        for node in self._nodes():
+            if node.calls:
+                self._accumulate(functions, node.label, node)
+                if node.parent.label is not None:
+                    self._accumulate(edges, (node.parent.label, node.label), node)
+        return functions, edges
+
+    def function_stats(self):
+        """
+        Access the statistics of every profiled callable.
+
+        :return: An OrderedDict of qualified name to FunctionProfile, ordered by decreasing exclusive time.
+        """
+        functions, _ = self._aggregate()
+        items = [(label, FunctionProfile(*stats)) for label, stats in functions.items()]
+        return OrderedDict(sorted(items, key=lambda item: -item[1].exclusive_ns))
+
+    def callers(self, label):
+        """
+        Access the spied callers of a profiled callable.
+
+        :param label: The qualified name of the callee.
+        :return: A dict of caller qualified name to FunctionProfile, for the calls made from that caller only.
+        """
+        _, edges = self._aggregate()
+        return dict((caller, FunctionProfile(*stats)) for (caller, callee), stats in edges.items() if callee == label)
+
+    def collapsed_stacks(self, unit_ns=1000):
+        """
+        Export the profile as collapsed stacks, one "caller;callee;... weight" line per distinct stack of spied
+        calls, weighted by the exclusive time spent in that stack. This is the input format of flamegraph.pl.
+
+        :param unit_ns: The number of nanoseconds per unit of weight. Default: 1000 (microseconds)
+        :return: A list of lines (without line endings), sorted by stack. Stacks which round to 0 are left out.
+        """
+        stacks = {}
+        for node in self._nodes():
+            path = node.path()
+            stacks[path] = stacks.get(path, 0) + node.exclusive_ns
+        lines = []
+        for path, exclusive_ns in sorted(stacks.items()):
+            weight = int(round(exclusive_ns / float(unit_ns)))
+            if weight:
+                lines.append("{0} {1}".format(";".join(path), weight))
+        return lines
+
+    def write_collapsed_stacks(self, path, unit_ns=1000):
+        """
+        Write the collapsed stacks (see collapsed_stacks()) to a file.
+
+        :param path: The file path to write to.
+        :param unit_ns: The number of nanoseconds per unit of weight. Default: 1000 (microseconds)
+        :return: None
+        """
+        with open(path, "w") as output:
+            for line in self.collapsed_stacks(unit_ns):
+                output.write(line + "\n")
+
+    def create_stats(self):
+        """
+        Build the pstats compatible statistics into stats, as cProfile.Profile.create_stats() does. This is called
+        by pstats.Stats when it is given this profiler.
+
+        :return: None
+        """
+        functions, edges = self._aggregate()
+        self.stats = dict(
+            (self.keys[label], (primitive_calls, calls, exclusive_ns / 1e9, inclusive_ns / 1e9, {}))
+            for label, (calls, primitive_calls, exclusive_ns, inclusive_ns) in functions.items()
+        )
+        # Unlike the entries themselves, pstats orders the caller counts as (calls, primitive calls).
+        for (caller, callee), (calls, primitive_calls, exclusive_ns, inclusive_ns) in edges.items():
+            self.stats[self.keys[callee]][4][self.keys[caller]] = (
+                calls, primitive_calls, exclusive_ns / 1e9, inclusive_ns / 1e9
+            )
+
+    def dump_stats(self, path):
+        """
+        Write the pstats compatible statistics to a file, which pstats.Stats (or snakeviz and the like) can load.
+
+        :param path: The file path to write to.
+        :return: None
+        """
+        self.create_stats()
+        with open(path, "wb") as output:
+            marshal.dump(self.stats, output)
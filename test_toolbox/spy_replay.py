@@ -0,0 +1,247 @@
+"""
+This module contains record and replay stubs for slow (but deterministic) dependencies. A Spy on the real dependency
+records the arguments and result of every call; save_recording() writes that recording to a file, and a later run
+builds a ReplayStub from it, which answers calls with the recorded results instead of calling the dependency again.
+
+Included are:
+
+* save_recording -- Write the successful invocations of a Spy to a recording file.
+* ReplayStub -- A stand in for a recorded callable, which answers each call with the result recorded for the same
+    arguments (or for arguments matching a predicate rule, see ReplayStub.when()), and handles calls that were not
+    recorded according to its miss policy.
+* replay_stub -- Build a Spy over a ReplayStub, so that the replayed calls may be asserted on as usual.
+* ReplayMissError -- Raised by a ReplayStub for a call that was not recorded, under the "raise" miss policy.
+
+Recordings are invocation logs (see the spy_log module), so the log of a Spy created with the invocation_log option
+is a recording as it is.
+"""
+import errno
+import os
+
+from test_toolbox.spy import Spy, ArgumentBinder, MatchPlan, TargetInvocation, equal_to, _max_length_repr
+from test_toolbox.spy_log import InvocationLogStore, UnpicklableValue
+
+_MISS_POLICIES = ("raise", "call_through", "nearest")
+
+
+class ReplayMissError(LookupError):
+    """
+    Raised by a ReplayStub when it is called with arguments for which nothing was recorded.
+    """
+
+
+def save_recording(spy, path):
+    """
+    Write the successful invocations of a Spy to a recording file, which ReplayStub (or replay_stub) can load.
+    Invocations whose arguments or result cannot be pickled are saved with UnpicklableValue stand ins (see the
+    spy_log module); such results are not replayed.
+
+    :param spy: The Spy whose invocations should be saved.
+    :param path: The path of the recording file. Any existing file is replaced.
+    :return: None
+    """
+    store = spy.invocation_store
+    if isinstance(store, InvocationLogStore) and os.path.abspath(store.path) == os.path.abspath(path):
+        # The Spy is already logging to that very file.
+        store.flush()
+        return
+    recording = InvocationLogStore(path, spy.target_func_argspec)
+    try:
+        for args, kwargs, result in spy.successful_invocations:
+            recording.record(args, kwargs, result)
+    finally:
+        recording.close()
+
+
+def _call_key(bound_invocation):
+    arguments, extra_args, extra_kwargs, _ = bound_invocation
+    return tuple(sorted(arguments.items())), extra_args, tuple(sorted(extra_kwargs.items()))
+
+
+class _RecordedResults(object):
+    """
+    The results recorded for a single set of arguments, which are replayed in the order they were recorded. The
+    last one is repeated once they run out.
+    """
+    __slots__ = ("results", "position")
+
+    def __init__(self, result):
+        self.results = [result]
+        self.position = 0
+
+    def next_result(self):
+        result = self.results[min(self.position, len(self.results) - 1)]
+        self.position += 1
+        return result
+
+
+class ReplayStub(object):
+    """
+    A ReplayStub stands in for a recorded callable. Each call is answered, without calling the real target, by:
+
+    1. The result recorded for the same arguments, once they are bound to the parameters of the recorded target (so
+       f(1, bar=2), f(1, 2) and f(1), for a bar which defaults to 2, are all the same call). A call recorded more
+       than once replays its results in the order they were recorded, then keeps repeating the last one.
+    2. Otherwise, the result of the first predicate rule (see when()) which the call matches.
+    3. Otherwise, according to the miss policy:
+
+       * "raise" -- Raise a ReplayMissError, which shows the nearest recorded call. Default.
+       * "call_through" -- Call target_func, and record its result, so that the same call is replayed from then on.
+       * "nearest" -- Replay the result of the recorded call which has the most arguments in common with this one
+         (the earliest recorded one, between equally near calls).
+
+    Recorded results that could not be pickled (see UnpicklableValue) are never replayed.
+
+    :param recording: The path of a recording file (see save_recording), or a Spy to replay the invocations of.
+    :param miss_policy: How calls that were not recorded are handled (see above). Default: "raise"
+    :param target_func: (OPTIONAL) The real callable, which the "call_through" miss policy calls.
+    :raises: IOError if there is no recording file at the given path.
+    """
+    __slots__ = ("argspec", "miss_policy", "target_func", "num_hits", "num_misses", "_binder", "_invocations",
+                 "_results", "_unhashable_results", "_rules")
+
+    def __init__(self, recording, miss_policy="raise", target_func=None):
+        if miss_policy not in _MISS_POLICIES:
+            raise ValueError("Unknown miss policy {0!r}, expected one of {1}.".format(
+                miss_policy, ", ".join(_MISS_POLICIES)
+            ))
+        if miss_policy == "call_through" and target_func is None:
+            raise ValueError("The call_through miss policy needs a target_func to call.")
+        self.miss_policy = miss_policy
+        self.target_func = target_func
+        self.num_hits = self.num_misses = 0
+        self._invocations = []
+        self._results = {}
+        self._unhashable_results = []
+        self._rules = []
+        if isinstance(recording, Spy):
+            self.argspec = recording.target_func_argspec
+            self._binder = ArgumentBinder(self.argspec)
+            for args, kwargs, result in recording.successful_invocations:
+                self.add(args, kwargs, result)
+        else:
+            if not os.path.exists(recording):
+                raise IOError(errno.ENOENT, "No such recording", recording)
+            store = InvocationLogStore(recording, append=True)
+            self.argspec = store.argspec
+            self._binder = ArgumentBinder(self.argspec)
+            for args, kwargs, result in store:
+                self.add(args, kwargs, result)
+
+    def add(self, args, kwargs, result):
+        """
+        Add a recorded call to this stub, after those it was loaded with.
+
+        :param args: The positional arguments of the call.
+        :param kwargs: The keyword arguments of the call.
+        :param result: The result to replay for those arguments.
+        :return: None
+        """
+        if isinstance(result, UnpicklableValue):
+            return
+        self._invocations.append(TargetInvocation(args, kwargs, result))
+        bound_invocation = self._binder.bind(args, kwargs, result)
+        try:
+            key = _call_key(bound_invocation)
+            recorded = self._results.get(key)
+            if recorded is None:
+                self._results[key] = _RecordedResults(result)
+            else:
+                recorded.results.append(result)
+        except TypeError:
+            for other, recorded in self._unhashable_results:
+                if other[:3] == bound_invocation[:3]:
+                    recorded.results.append(result)
+                    break
+            else:
+                self._unhashable_results.append((bound_invocation, _RecordedResults(result)))
+
+    def when(self, *predicate_args, **predicate_kwargs):
+        """
+        Add a predicate rule, which answers calls that were not recorded as they are, but which match the given
+        predicates (as a partial match, see Spy.assert_any_partial_match), with the result of a recorded call that
+        matches them too: the nearest one to the call, as for the "nearest" miss policy. For instance,
+        stub.when(equal_to("GET"), timestamp=anything) replays recorded GET requests whatever their timestamp.
+        Rules are tried in the order they were added.
+
+        :param predicate_args: The positional predicates of the rule.
+        :param predicate_kwargs: The keyword predicates of the rule.
+        :return: This stub, so that rules may be chained.
+        """
+        plan = MatchPlan(self.argspec, predicate_args, predicate_kwargs, exact=False)
+        self._rules.append(plan)
+        return self
+
+    def _lookup(self, args, kwargs):
+        bound_invocation = self._binder.bind(args, kwargs, None)
+        try:
+            recorded = self._results.get(_call_key(bound_invocation))
+        except TypeError:
+            recorded = None
+            for other, unhashable_recorded in self._unhashable_results:
+                if other[:3] == bound_invocation[:3]:
+                    recorded = unhashable_recorded
+                    break
+        return recorded
+
+    def _nearest(self, args, kwargs, invocations):
+        plan = MatchPlan(
+            self.argspec, [equal_to(value) for value in args],
+            dict((name, equal_to(value)) for name, value in kwargs.items()), exact=False
+        )
+        nearest, nearest_score = None, -1
+        for invocation in invocations:
+            score = plan.score(invocation.args, invocation.kwargs)
+            if score > nearest_score:
+                nearest, nearest_score = invocation, score
+        return nearest
+
+    def __call__(self, *args, **kwargs):
+        recorded = self._lookup(args, kwargs)
+        if recorded is not None:
+            self.num_hits += 1
+            return recorded.next_result()
+        for plan in self._rules:
+            if plan.matches(args, kwargs):
+                nearest = self._nearest(args, kwargs, [
+                    invocation for invocation in self._invocations if plan.matches(invocation.args, invocation.kwargs)
+                ])
+                if nearest is not None:
+                    self.num_hits += 1
+                    return nearest.result
+        self.num_misses += 1
+        if self.miss_policy == "call_through":
+            result = self.target_func(*args, **kwargs)
+            self.add(args, kwargs, result)
+            return result
+        nearest = self._nearest(args, kwargs, self._invocations)
+        if self.miss_policy == "nearest" and nearest is not None:
+            return nearest.result
+        raise ReplayMissError("No recorded call matches args={0}, kwargs={1}. Nearest recorded call: {2}".format(
+            _max_length_repr(args), _max_length_repr(kwargs),
+            "none" if nearest is None else "args={0}, kwargs={1}".format(
+                _max_length_repr(nearest.args), _max_length_repr(nearest.kwargs)
+            )
+        ))
+
+    def __repr__(self):
+        return "<ReplayStub of {0} recorded calls, miss policy {1!r}>".format(len(self._invocations), self.miss_policy)
+
+
+def replay_stub(recording, miss_policy="raise", target_func=None, **spy_options):
+    """
+    Build a Spy over a ReplayStub (see ReplayStub for the parameters), which aligns predicates to the parameters of
+    the recorded target, so that the replayed calls may be queried and asserted on like those of any other Spy. The
+    ReplayStub itself is the target_func of the Spy.
+
+    :param recording: The path of a recording file (see save_recording), or a Spy to replay the invocations of.
+    :param miss_policy: How calls that were not recorded are handled (see ReplayStub). Default: "raise"
+    :param target_func: (OPTIONAL) The real callable, which the "call_through" miss policy calls.
+    :param spy_options: (OPTIONAL) Additional keyword arguments to pass to the Spy (i.e. record_latency).
+    :return: A Spy over the ReplayStub.
+    :raises: IOError if there is no recording file at the given path.
+    """
+    stub = ReplayStub(recording, miss_policy=miss_policy, target_func=target_func)
+    spy = Spy(stub, is_not_inspectable=True, **spy_options)
+    spy._use_argspec(stub.argspec)
+    return spy
@@ -0,0 +1,160 @@
+"""
+This module contains the sequence clock of the Spy module, which orders the invocations of several Spies against
+each other. Spies created with the same SequenceClock as their sequence_clock option (i.e.
+spy_module(my_module, sequence_clock=clock)) stamp each recorded invocation with the next number drawn from that
+clock, kept in the sequence_numbers array of each Spy. Ordered assertions across those Spies are then answered by
+binary search over those arrays, rather than by merging and rescanning the invocations of every Spy.
+
+Included are:
+
+* SequenceClock -- A monotonic counter, shared by the Spies whose invocations should be ordered.
+* SequencedMatch -- The sequence numbers of the invocations of a Spy which match some predicates, as built by
+    Spy.match(), Spy.exact_match() and Spy.result_match().
+* check_in_order -- Check that the matches of several SequencedMatches happened in the given order.
+* assert_in_order -- Assert that the matches of several SequencedMatches happened in the given order.
+
+An invocation is stamped when it is recorded, which is when the target returns (or, for coroutine functions, when
+the awaited result is available). A spied call made from within another spied call is so sequenced before it.
+"""
+from bisect import bisect_right
+from itertools import count
+import threading
+
+from test_toolbox.spy import _max_length_repr
+
+
+class SequenceClock(object):
+    """
+    A monotonic counter of invocations, shared by several Spies through their sequence_clock option. A Spy records
+    each invocation and draws its number while holding the lock of the clock, as SequencedMatch does to look them
+    up, so a clock may be shared by Spies called from several threads. Resetting a Spy does not reset its clock.
+
+    :param start: The first sequence number drawn. Default: 0
+    """
+    def __init__(self, start=0):
+        self._counter = count(start)
+        # Reentrant, as recording (i.e. pickling into an invocation log) or matching may call another spy.
+        self.lock = threading.RLock()
+
+    def tick(self):
+        """
+        Draw the next sequence number.
+
+        :return: The integer sequence number, greater than every one drawn before from this clock.
+        """
+        return next(self._counter)
+
+    def __repr__(self):
+        return "<SequenceClock at {0:#x}>".format(id(self))
+
+
+class SequencedMatch(object):
+    """
+    The invocations of a single Spy which match a MatchPlan and/or a result predicate, identified by their sequence
+    numbers. The matching invocations are looked up every time sequences() is called, so a SequencedMatch may be
+    built before the calls it describes are made.
+
+    :param spy: The Spy whose invocations to match, which must have a sequence_clock.
+    :param description: How the match is described in assertion messages (i.e. "send.match(equal_to(1))").
+    :param plan: (OPTIONAL) The MatchPlan the invocation arguments must satisfy.
+    :param result_predicate: (OPTIONAL) An arity 1 predicate the invocation result must satisfy.
+    """
+    def __init__(self, spy, description, plan=None, result_predicate=None):
+        if spy.sequence_clock is None:
+            raise ValueError("{0} needs a Spy created with a sequence_clock.".format(description))
+        self.spy = spy
+        self.description = description
+        self.plan = plan
+        self.result_predicate = result_predicate
+
+    @property
+    def sequence_clock(self):
+        return self.spy.sequence_clock
+
+    def sequences(self):
+        """
+        Find the sequence numbers of the matching invocations.
+
+        :return: The ascending sequence numbers of the matching invocations.
+        """
+        with self.sequence_clock.lock:
+            sequence_numbers = self.spy.sequence_numbers
+            if self.plan is None and self.result_predicate is None:
+                return list(sequence_numbers)
+            return [sequence_numbers[index] for index in self.spy._matching_indices(self.plan, self.result_predicate)]
+
+    def first_after(self, sequence, sequences=None):
+        """
+        Find the earliest matching invocation after a sequence number, by binary search.
+
+        :param sequence: The sequence number, or None for the earliest matching invocation of all.
+        :param sequences: (OPTIONAL) The result of sequences(), if it is already at hand.
+        :return: The sequence number of that invocation, or None if there is none.
+        """
+        if sequences is None:
+            sequences = self.sequences()
+        position = 0 if sequence is None else bisect_right(sequences, sequence)
+        return sequences[position] if position < len(sequences) else None
+
+    def __repr__(self):
+        return self.description
+
+
+def _match_in_order(matches):
+    # Greedily take the earliest match of each step that follows the match taken for the step before it: if any
+    # choice of one match per step is in order, this one is. Returns the sequences of every step, the index of the
+    # first step that could not be matched (or None) and the sequence number matched for the step before it.
+    clocks = set(id(match.sequence_clock) for match in matches)
+    if len(clocks) > 1:
+        raise ValueError("The matches {0} do not share a SequenceClock, so they cannot be ordered.".format(
+            ", ".join(repr(match) for match in matches)
+        ))
+    all_sequences = []
+    last = None
+    for step, match in enumerate(matches):
+        sequences = match.sequences()
+        all_sequences.append(sequences)
+        sequence = match.first_after(last, sequences)
+        if sequence is None:
+            return all_sequences, step, last
+        last = sequence
+    return all_sequences, None, last
+
+
+def check_in_order(*matches):
+    """
+    Check that the given matches happened in order: that there is a matching invocation of each of them, each one
+    recorded after the matching invocation chosen for the match before it. Other invocations may happen in between.
+    Each match costs a single binary search over its sequence numbers.
+
+    Example: check_in_order(connect.match(), send.match(equal_to(b"HELLO")), close.match())
+
+    :param matches: The SequencedMatches, in the order they should have happened, all sharing the same clock.
+    :return: True if the matches happened in order, False otherwise.
+    :raises: ValueError if the matches do not share a SequenceClock.
+    """
+    return _match_in_order(matches)[1] is None
+
+
+def assert_in_order(*matches):
+    """
+    Assert that the given matches happened in order (see check_in_order()).
+
+    :param matches: The SequencedMatches, in the order they should have happened, all sharing the same clock.
+    :return: None
+    :raises: AssertionError if the matches did not happen in order, ValueError if they do not share a
+        SequenceClock.
+    """
+    all_sequences, failed_step, last = _match_in_order(matches)
+    if failed_step is None:
+        return
+    if last is None:
+        header = "Failed to find any invocation of {0}!".format(matches[failed_step])
+    else:
+        header = "Failed to find an invocation of {0} after sequence number {1} (matching {2})!".format(
+            matches[failed_step], last, matches[failed_step - 1]
+        )
+    raise AssertionError("{0}\nMatching sequence numbers:\n{1}".format(header, "\n".join(
+        "{0}. {1}: {2}".format(step + 1, match, _max_length_repr(list(sequences), 200))
+        for step, (match, sequences) in enumerate(zip(matches, all_sequences))
+    )))